@@ -0,0 +1,157 @@
+'''
+Binary, memory-mapped copy of a GloVe text file.
+
+The index directory (default: the text file + '.index') holds
+    vectors.f32   float32 matrix (n_words, dim), row after row
+    words.bin     utf-8 words put end to end, word i is words[offsets[i]:offsets[i + 1]]
+    offsets.npy   int64 (n_words + 1)
+    table.npy     int32 open addressing hash table (crc32 of the word, linear probing) of row ids, -1 empty
+    meta.json     dim, n_words and the size / mtime of the text file
+'''
+import io
+import os
+import csv
+import json
+import zlib
+import numpy as np
+import pandas as pd
+
+INDEX_VERSION = 1
+
+
+def _source(txt_file):
+    return {'mtime': os.path.getmtime(txt_file), 'size': os.path.getsize(txt_file)}
+
+
+def _hash(word):
+    return zlib.crc32(word) & 0xffffffff
+
+
+def _parse(lines, dim):
+    # words may contain spaces, the vector is always the last dim fields
+    words, tails = [], []
+    for line in lines:
+        line = line.rstrip(b'\r\n')
+        end = line.find(b' ')
+        if line.count(b' ', end) != dim:
+            parts = line.rsplit(b' ', dim)
+            if len(parts) != dim + 1:
+                continue
+            end = len(parts[0])
+        words.append(line[:end])
+        tails.append(line[end + 1:])
+    if not words:
+        return words, np.zeros((0, dim), dtype=np.float32)
+    # the C parser of pandas is much faster than float() on every field
+    vectors = pd.read_csv(io.BytesIO(b'\n'.join(tails)), sep=' ', header=None, dtype=np.float32,
+                          quoting=csv.QUOTE_NONE, na_filter=False)
+    return words, vectors.values
+
+
+def convert_glove(txt_file, index_dir=None, dim=300, chunksize=100000):
+    '''
+    One pass over the GloVe text file, writes the index directory described above.
+    Lines without dim values are skipped; a repeated word gets the vector of its last line.
+    '''
+    if index_dir is None:
+        index_dir = txt_file + '.index'
+    if not os.path.exists(index_dir):
+        os.makedirs(index_dir)
+    words = []
+    with open(txt_file, 'rb') as f, open(os.path.join(index_dir, 'vectors.f32'), 'wb') as out:
+        lines = []
+        for line in f:
+            lines.append(line)
+            if len(lines) == chunksize:
+                chunk_words, vectors = _parse(lines, dim)
+                words.extend(chunk_words)
+                vectors.tofile(out)
+                lines = []
+        chunk_words, vectors = _parse(lines, dim)
+        words.extend(chunk_words)
+        vectors.tofile(out)
+
+    offsets = np.zeros(len(words) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(w) for w in words])
+    with open(os.path.join(index_dir, 'words.bin'), 'wb') as out:
+        out.write(b''.join(words))
+    np.save(os.path.join(index_dir, 'offsets.npy'), offsets)
+
+    # at most half full
+    size = 1 << max(int(2 * len(words)).bit_length(), 4)
+    table = [-1] * size
+    mask = size - 1
+    for i, word in enumerate(words):
+        slot = _hash(word) & mask
+        while table[slot] >= 0 and words[table[slot]] != word:
+            slot = (slot + 1) & mask
+        table[slot] = i
+    np.save(os.path.join(index_dir, 'table.npy'), np.array(table, dtype=np.int32))
+
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as out:
+        json.dump({'version': INDEX_VERSION, 'dim': dim, 'n_words': len(words), 'source': _source(txt_file)}, out)
+    print('Indexed %d word vectors of %s' % (len(words), txt_file))
+    return index_dir
+
+
+class GloveIndex(object):
+    '''
+    Word vectors of a GloVe text file through its binary index, made by convert_glove on first use
+    (and again when the text file changes). Nothing but the hash table is read into memory.
+    '''
+
+    def __init__(self, txt_file, index_dir=None, dim=300):
+        if index_dir is None:
+            index_dir = txt_file + '.index'
+        meta_file = os.path.join(index_dir, 'meta.json')
+        meta = None
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+        if meta is None or meta.get('version') != INDEX_VERSION or meta['dim'] != dim or \
+                (os.path.exists(txt_file) and meta['source'] != _source(txt_file)):
+            convert_glove(txt_file, index_dir, dim)
+            with open(meta_file) as f:
+                meta = json.load(f)
+        self.dim = meta['dim']
+        self.vectors = np.memmap(os.path.join(index_dir, 'vectors.f32'), dtype=np.float32, mode='r',
+                                 shape=(meta['n_words'], self.dim))
+        self.words = np.memmap(os.path.join(index_dir, 'words.bin'), dtype=np.uint8, mode='r')
+        self.offsets = np.load(os.path.join(index_dir, 'offsets.npy'), mmap_mode='r')
+        self.table = np.load(os.path.join(index_dir, 'table.npy'))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _word(self, i):
+        return self.words[self.offsets[i]:self.offsets[i + 1]].tobytes()
+
+    def rows(self, words):
+        '''row of every word in vectors, -1 for words without a vector'''
+        mask = len(self.table) - 1
+        out = np.full(len(words), -1, dtype=np.int64)
+        for k, word in enumerate(words):
+            if not isinstance(word, bytes):
+                word = word.encode('utf-8')
+            slot = _hash(word) & mask
+            while self.table[slot] >= 0:
+                if self._word(self.table[slot]) == word:
+                    out[k] = self.table[slot]
+                    break
+                slot = (slot + 1) & mask
+        return out
+
+    def embedding_matrix(self, word_index, nb_words, dtype=np.float32):
+        '''
+        (nb_words, dim) matrix of the vectors of the words of a keras Tokenizer word_index,
+        zeros for words without a vector and row 0; words with an index >= nb_words are left out
+        '''
+        items = [(w, i) for w, i in word_index.items() if i < nb_words]
+        ids = np.array([i for _, i in items], dtype=np.int64)
+        rows = self.rows([w for w, _ in items])
+        found = rows >= 0
+        matrix = np.zeros((nb_words, self.dim), dtype=dtype)
+        # sorted rows read the memory-mapped file front to back
+        order = np.argsort(rows[found])
+        matrix[ids[found][order]] = self.vectors[rows[found][order]]
+        return matrix
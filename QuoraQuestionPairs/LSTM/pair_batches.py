@@ -0,0 +1,101 @@
+'''
+Batches of question pairs for the LSTM model, built from the padded sequence arrays as they are.
+The swapped pairs (q2, q1) are taken on the fly instead of stacking a second copy of the data, and
+pairs are grouped by length so that a batch only keeps the time steps its longest question needs
+(sequences are padded in front, as pad_sequences does by default). The model inputs need
+shape=(None,) for this, and an Embedding with mask_zero=True so that the number of padding steps
+doesn't change the LSTM output.
+'''
+import numpy as np
+
+
+def sequence_lengths(data):
+    '''number of tokens of every padded sequence'''
+    return (np.asarray(data) != 0).sum(axis=1)
+
+
+def _bucket_of(lengths, buckets):
+    return np.searchsorted(np.asarray(buckets), lengths)
+
+
+def _batch(data_1, data_2, leaks, rows, swapped):
+    # the longest question of the batch decides the number of time steps
+    width = max(int(sequence_lengths(data_1[rows]).max()), int(sequence_lengths(data_2[rows]).max()), 1)
+    a, b = data_1[rows, -width:], data_2[rows, -width:]
+    first = np.where(swapped[:, None], b, a)
+    second = np.where(swapped[:, None], a, b)
+    return [first, second, leaks[rows]]
+
+
+class PairBatches(object):
+    '''
+    Endless batches ([question 1, question 2, leaks], labels[, weights]) of the pairs of index,
+    for keras fit_generator(iter(batches), steps_per_epoch=batches.steps). Not for validation_data:
+    keras reads ahead of every validation pass and drops the extra batches, so the epochs would
+    see shifted windows of the pairs.
+    swap: every pair comes a second time as (q2, q1) in the same epoch
+    buckets: upper bounds of the pair lengths (longest question) that may share a batch
+    weights: optional sample weight of every pair of the arrays (e.g. re-weighted validation)
+    '''
+
+    def __init__(self, data_1, data_2, leaks, index, labels=None, weights=None, batch_size=2048,
+                 buckets=(10, 15, 20, 30), swap=True, shuffle=True, seed=None):
+        self.data_1, self.data_2, self.leaks = data_1, data_2, leaks
+        self.labels, self.weights = labels, weights
+        self.batch_size, self.shuffle = batch_size, shuffle
+        self.rng = np.random.RandomState(seed)
+        index = np.asarray(index)
+        lengths = np.maximum(sequence_lengths(data_1[index]), sequence_lengths(data_2[index]))
+        bucket = _bucket_of(lengths, buckets)
+        # (row, swapped) of every sample of an epoch, per bucket
+        self.groups = []
+        for b in np.unique(bucket):
+            rows = index[bucket == b]
+            swapped = np.zeros(len(rows), dtype=bool)
+            if swap:
+                rows = np.concatenate([rows, rows])
+                swapped = np.concatenate([swapped, ~swapped])
+            self.groups.append((rows, swapped))
+        self.steps = sum((len(rows) + batch_size - 1) // batch_size for rows, _ in self.groups)
+        self.samples = sum(len(rows) for rows, _ in self.groups)
+
+    def _epoch(self):
+        batches = []
+        for rows, swapped in self.groups:
+            order = self.rng.permutation(len(rows)) if self.shuffle else np.arange(len(rows))
+            for start in range(0, len(rows), self.batch_size):
+                part = order[start:start + self.batch_size]
+                batches.append((rows[part], swapped[part]))
+        if self.shuffle:
+            batches = [batches[i] for i in self.rng.permutation(len(batches))]
+        return batches
+
+    def __iter__(self):
+        while True:
+            for rows, swapped in self._epoch():
+                x = _batch(self.data_1, self.data_2, self.leaks, rows, swapped)
+                if self.labels is None:
+                    yield x
+                elif self.weights is None:
+                    yield x, self.labels[rows]
+                else:
+                    yield x, self.labels[rows], self.weights[rows]
+
+
+def predict_pairs(model, data_1, data_2, leaks, batch_size=8192):
+    '''
+    Mean prediction of (q1, q2) and (q2, q1) for every pair, in the order of the arrays. The pairs
+    are taken by length and each batch goes through the model once, with both orientations stacked
+    (batch_size rows per call).
+    '''
+    lengths = np.maximum(sequence_lengths(data_1), sequence_lengths(data_2))
+    index = np.argsort(lengths, kind='mergesort')
+    preds = np.zeros((len(index), 1), dtype=np.float32)
+    half = max(batch_size // 2, 1)
+    for start in range(0, len(index), half):
+        rows = index[start:start + half]
+        both = np.concatenate([rows, rows])
+        swapped = np.arange(len(both)) >= len(rows)
+        out = np.asarray(model.predict_on_batch(_batch(data_1, data_2, leaks, both, swapped))).reshape(-1, 1)
+        preds[rows] = (out[:len(rows)] + out[len(rows):]) / 2
+    return preds
@@ -0,0 +1,67 @@
+'''
+Cache of the preprocessed Quora data: the padded sequences, the word index, the embedding matrix
+and the scaled leak features. The artifacts of a set of cleaning parameters are built once, saved
+to cache_root/<hash of the parameters>/ and memory-mapped by the following runs.
+'''
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+CACHE_VERSION = 1
+
+
+def _source(path):
+    return {'path': os.path.abspath(path), 'mtime': os.path.getmtime(path), 'size': os.path.getsize(path)}
+
+
+def cache_key(params, files=()):
+    '''hash of the parameters and of the size / mtime of the input files'''
+    key = {'version': CACHE_VERSION, 'params': params, 'files': [_source(f) for f in files]}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def save_artifacts(cache_dir, arrays, word_index, params):
+    '''arrays: {name: numpy array} saved as .npy; params.json is written last and marks a complete cache'''
+    tmp_dir = cache_dir + '.tmp{}'.format(os.getpid())
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), values)
+    with open(os.path.join(tmp_dir, 'word_index.json'), 'w') as f:
+        json.dump(word_index, f)
+    with open(os.path.join(tmp_dir, 'params.json'), 'w') as f:
+        json.dump({'params': params, 'arrays': sorted(arrays)}, f)
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.rename(tmp_dir, cache_dir)
+
+
+def load_artifacts(cache_dir):
+    '''(arrays, word_index) of save_artifacts; the arrays are memory-mapped read-only'''
+    with open(os.path.join(cache_dir, 'params.json')) as f:
+        names = json.load(f)['arrays']
+    arrays = dict((name, np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r')) for name in names)
+    with open(os.path.join(cache_dir, 'word_index.json')) as f:
+        word_index = json.load(f)
+    return arrays, word_index
+
+
+def cached_artifacts(params, build, files=(), cache_root='cache'):
+    '''
+    (arrays, word_index) for the cleaning parameters params (a json-able dict).
+    build(): returns (arrays, word_index), called when cache_root has no complete cache for
+    params and the input files.
+    '''
+    cache_dir = os.path.join(cache_root, cache_key(params, files))
+    if not os.path.exists(os.path.join(cache_dir, 'params.json')):
+        print('Preprocessing, cache %s' % cache_dir)
+        arrays, word_index = build()
+        if not os.path.exists(cache_root):
+            os.makedirs(cache_root)
+        save_artifacts(cache_dir, arrays, word_index, params)
+    else:
+        print('Loading preprocessed data from %s' % cache_dir)
+    return load_artifacts(cache_dir)
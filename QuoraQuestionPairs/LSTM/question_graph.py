@@ -0,0 +1,106 @@
+'''
+Graph ("magic") features of question pairs: the questions are the nodes and every pair is an edge,
+train and test pairs together. Questions are hashed to integer node ids once and the neighbours of
+every node are kept as a CSR adjacency matrix with sorted column indices.
+'''
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+
+def question_nodes(question1, question2):
+    '''(u, v, n_nodes): integer node ids of the two questions of every pair; missing questions are ""'''
+    questions = np.concatenate([np.asarray(question1, dtype=object), np.asarray(question2, dtype=object)])
+    codes, uniques = pd.factorize(pd.Series(questions).fillna('').values)
+    return codes[:len(question1)], codes[len(question1):], len(uniques)
+
+
+def adjacency(u, v, n_nodes):
+    '''
+    Symmetric 0/1 CSR matrix of the distinct neighbours of every node, with sorted indices;
+    a question paired with itself is its own neighbour
+    '''
+    rows = np.concatenate([u, v]).astype(np.int64)
+    cols = np.concatenate([v, u]).astype(np.int64)
+    keys = np.unique(rows * n_nodes + cols)
+    rows, cols = keys // n_nodes, keys % n_nodes
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_nodes), out=indptr[1:])
+    return sparse.csr_matrix((np.ones(len(cols), dtype=np.int8), cols, indptr), shape=(n_nodes, n_nodes))
+
+
+def _neighbours(adj, nodes):
+    # (i, neighbour) for every neighbour of every nodes[i]
+    starts = adj.indptr[nodes].astype(np.int64)
+    lengths = adj.indptr[nodes + 1] - starts
+    offsets = np.cumsum(lengths) - lengths
+    pos = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+    return np.repeat(np.arange(len(nodes)), lengths), adj.indices[pos].astype(np.int64)
+
+
+def common_neighbours(adj, u, v):
+    '''
+    Number of common neighbours of u[i] and v[i]. The neighbours of the node with fewer of them
+    are searched in the sorted neighbour lists of the other one, so a pair costs the smaller degree.
+    '''
+    n_nodes = adj.shape[0]
+    degree = np.diff(adj.indptr)
+    swap = degree[u] > degree[v]
+    small, large = np.where(swap, v, u), np.where(swap, u, v)
+    pairs, neighbours = _neighbours(adj, small)
+    # node * n_nodes + neighbour of every edge, sorted since the rows of adj are
+    edges = np.repeat(np.arange(n_nodes, dtype=np.int64), degree) * n_nodes + adj.indices
+    wanted = large[pairs].astype(np.int64) * n_nodes + neighbours
+    found = np.minimum(np.searchsorted(edges, wanted), len(edges) - 1)
+    return np.bincount(pairs[edges[found] == wanted], minlength=len(u))
+
+
+def core_numbers(adj):
+    '''k-core number of every node, peeling all the nodes of degree <= k at once, round after round'''
+    degree = np.diff(adj.indptr).astype(np.int64)
+    core = np.zeros(adj.shape[0], dtype=np.int64)
+    alive = np.ones(adj.shape[0], dtype=bool)
+    coo = adj.tocoo()
+    # each edge once per direction; a node losing a neighbour loses one degree
+    rows, cols = coo.row.astype(np.int64), coo.col.astype(np.int64)
+    k = 0
+    while alive.any():
+        peel = alive & (degree <= k)
+        if not peel.any():
+            k = degree[alive].min()
+            continue
+        core[peel] = k
+        alive[peel] = False
+        removed = peel[cols] & alive[rows]
+        degree -= np.bincount(rows[removed], minlength=len(degree))
+        keep = alive[rows] & alive[cols]
+        rows, cols = rows[keep], cols[keep]
+    return core
+
+
+def component_sizes(adj):
+    '''number of questions in the connected component of every node'''
+    n_components, labels = connected_components(adj, directed=False)
+    return np.bincount(labels)[labels]
+
+
+def graph_features(question1, question2, kcore=False, components=False):
+    '''
+    DataFrame of the pair features, one row per pair:
+    q1_q2_intersect (common neighbours), q1_freq, q2_freq (degrees),
+    with kcore q1_kcore, q2_kcore and with components component_size
+    '''
+    u, v, n_nodes = question_nodes(question1, question2)
+    adj = adjacency(u, v, n_nodes)
+    degree = np.diff(adj.indptr)
+    features = pd.DataFrame({'q1_q2_intersect': common_neighbours(adj, u, v),
+                             'q1_freq': degree[u], 'q2_freq': degree[v]},
+                            columns=['q1_q2_intersect', 'q1_freq', 'q2_freq'])
+    if kcore:
+        core = core_numbers(adj)
+        features['q1_kcore'] = core[u]
+        features['q2_kcore'] = core[v]
+    if components:
+        features['component_size'] = component_sizes(adj)[u]
+    return features
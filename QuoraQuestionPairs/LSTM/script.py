@@ -20,9 +20,6 @@ import pandas as pd
 from string import punctuation
 from collections import defaultdict
 
-from nltk.corpus import stopwords
-from nltk.stem import SnowballStemmer
-
 from keras.preprocessing.text import Tokenizer
 from keras.preprocessing.sequence import pad_sequences
 from keras.layers import Dense, Input, LSTM, Embedding, Dropout, Activation
@@ -30,9 +27,16 @@ from keras.layers.merge import concatenate
 from keras.models import Model
 from keras.layers.normalization import BatchNormalization
 from keras.callbacks import EarlyStopping, ModelCheckpoint
+from keras import backend as K
 
 from sklearn.preprocessing import StandardScaler
 
+from glove_index import GloveIndex
+from text_cleaning import clean_texts
+from question_graph import graph_features
+from pair_batches import PairBatches, predict_pairs
+from preprocessing_cache import cached_artifacts
+
 import sys
 reload(sys)
 sys.setdefaultencoding('utf-8')
@@ -48,287 +52,254 @@ MAX_SEQUENCE_LENGTH = 30
 MAX_NB_WORDS = 200000
 EMBEDDING_DIM = 300
 VALIDATION_SPLIT = 0.1
-
-num_lstm = np.random.randint(175, 275)
-num_dense = np.random.randint(100, 150)
-rate_drop_lstm = 0.15 + np.random.rand() * 0.25
-rate_drop_dense = 0.15 + np.random.rand() * 0.25
+REMOVE_STOPWORDS = False
+STEM_WORDS = False
+CACHE_DIR = 'cache'
 
 act = 'relu'
 re_weight = True # whether to re-weight classes to fit the 17.5% share in test set
 
-STAMP = 'lstm_%d_%d_%.2f_%.2f'%(num_lstm, num_dense, rate_drop_lstm, \
-        rate_drop_dense)
-
-########################################
-## index word vectors
-########################################
-print('Indexing word vectors')
-
-embeddings_index = {}
-f = open(EMBEDDING_FILE)
-count = 0
-for line in f:
-    values = line.split()
-    word = values[0]
-    coefs = np.asarray(values[1:], dtype='float32')
-    embeddings_index[word] = coefs
-f.close()
-
-print('Found %d word vectors of glove.' % len(embeddings_index))
-
 ########################################
-## process texts in datasets
+## preprocessing
 ########################################
-print('Processing text dataset')
-
-# The function "text_to_wordlist" is from
-# https://www.kaggle.com/currie32/quora-question-pairs/the-importance-of-cleaning-text
-def text_to_wordlist(text, remove_stopwords=False, stem_words=False):
-    # Clean the text, with the option to remove stopwords and to stem words.
-    
-    # Convert words to lower case and split them
-    text = text.lower().split()
-
-    # Optionally, remove stop words
-    if remove_stopwords:
-        stops = set(stopwords.words("english"))
-        text = [w for w in text if not w in stops]
-    
-    text = " ".join(text)
-
-    # Clean the text
-    text = re.sub(r"[^A-Za-z0-9^,!.\/'+-=]", " ", text)
-    text = re.sub(r"what's", "what is ", text)
-    text = re.sub(r"\'s", " ", text)
-    text = re.sub(r"\'ve", " have ", text)
-    text = re.sub(r"can't", "cannot ", text)
-    text = re.sub(r"n't", " not ", text)
-    text = re.sub(r"i'm", "i am ", text)
-    text = re.sub(r"\'re", " are ", text)
-    text = re.sub(r"\'d", " would ", text)
-    text = re.sub(r"\'ll", " will ", text)
-    text = re.sub(r",", " ", text)
-    text = re.sub(r"\.", " ", text)
-    text = re.sub(r"!", " ! ", text)
-    text = re.sub(r"\/", " ", text)
-    text = re.sub(r"\^", " ^ ", text)
-    text = re.sub(r"\+", " + ", text)
-    text = re.sub(r"\-", " - ", text)
-    text = re.sub(r"\=", " = ", text)
-    text = re.sub(r"'", " ", text)
-    text = re.sub(r"(\d+)(k)", r"\g<1>000", text)
-    text = re.sub(r":", " : ", text)
-    text = re.sub(r" e g ", " eg ", text)
-    text = re.sub(r" b g ", " bg ", text)
-    text = re.sub(r" u s ", " american ", text)
-    text = re.sub(r"\0s", "0", text)
-    text = re.sub(r" 9 11 ", "911", text)
-    text = re.sub(r"e - mail", "email", text)
-    text = re.sub(r"j k", "jk", text)
-    text = re.sub(r"\s{2,}", " ", text)
-    
-    # Optionally, shorten words to their stems
-    if stem_words:
-        text = text.split()
-        stemmer = SnowballStemmer('english')
-        stemmed_words = [stemmer.stem(word) for word in text]
-        text = " ".join(stemmed_words)
-    
-    # Return a list of words
-    return(text)
-
-texts_1 = [] 
-texts_2 = []
-labels = []
-with codecs.open(TRAIN_DATA_FILE, encoding='utf-8') as f:
-    reader = csv.reader(f, delimiter=',')
-    header = next(reader)
-    for values in reader:
-        texts_1.append(text_to_wordlist(values[3]))
-        texts_2.append(text_to_wordlist(values[4]))
-        labels.append(int(values[5]))
-print('Found %s texts in train.csv' % len(texts_1))
-
-test_texts_1 = []
-test_texts_2 = []
-test_ids = []
-with codecs.open(TEST_DATA_FILE, encoding='utf-8') as f:
-    reader = csv.reader(f, delimiter=',')
-    header = next(reader)
-    for values in reader:
-        test_texts_1.append(text_to_wordlist(values[1]))
-        test_texts_2.append(text_to_wordlist(values[2]))
-        test_ids.append(values[0])
-print('Found %s texts in test.csv' % len(test_texts_1))
-
-tokenizer = Tokenizer(num_words=MAX_NB_WORDS)
-tokenizer.fit_on_texts(texts_1 + texts_2 + test_texts_1 + test_texts_2)
-
-sequences_1 = tokenizer.texts_to_sequences(texts_1)
-sequences_2 = tokenizer.texts_to_sequences(texts_2)
-test_sequences_1 = tokenizer.texts_to_sequences(test_texts_1)
-test_sequences_2 = tokenizer.texts_to_sequences(test_texts_2)
-
-word_index = tokenizer.word_index
-print('Found %s unique tokens' % len(word_index))
-
-data_1 = pad_sequences(sequences_1, maxlen=MAX_SEQUENCE_LENGTH)
-data_2 = pad_sequences(sequences_2, maxlen=MAX_SEQUENCE_LENGTH)
-labels = np.array(labels)
-print('Shape of data tensor:', data_1.shape)
-print('Shape of label tensor:', labels.shape)
-
-test_data_1 = pad_sequences(test_sequences_1, maxlen=MAX_SEQUENCE_LENGTH)
-test_data_2 = pad_sequences(test_sequences_2, maxlen=MAX_SEQUENCE_LENGTH)
-test_ids = np.array(test_ids)
+def preprocess():
+    # everything but the model, the arrays are cached by cached_artifacts
+    ########################################
+    ## index word vectors
+    ########################################
+    print('Indexing word vectors')
+
+    # binary copy of the text file, converted on the first run and memory-mapped after
+    embeddings_index = GloveIndex(EMBEDDING_FILE, dim=EMBEDDING_DIM)
+
+    print('Found %d word vectors of glove.' % len(embeddings_index))
+
+    ########################################
+    ## process texts in datasets
+    ########################################
+    print('Processing text dataset')
+
+    # text_to_wordlist of every question, see text_cleaning.py
+    texts_1 = [] 
+    texts_2 = []
+    labels = []
+    with codecs.open(TRAIN_DATA_FILE, encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter=',')
+        header = next(reader)
+        for values in reader:
+            texts_1.append(values[3])
+            texts_2.append(values[4])
+            labels.append(int(values[5]))
+    texts_1 = clean_texts(texts_1, REMOVE_STOPWORDS, STEM_WORDS)
+    texts_2 = clean_texts(texts_2, REMOVE_STOPWORDS, STEM_WORDS)
+    print('Found %s texts in train.csv' % len(texts_1))
+
+    test_texts_1 = []
+    test_texts_2 = []
+    test_ids = []
+    with codecs.open(TEST_DATA_FILE, encoding='utf-8') as f:
+        reader = csv.reader(f, delimiter=',')
+        header = next(reader)
+        for values in reader:
+            test_texts_1.append(values[1])
+            test_texts_2.append(values[2])
+            test_ids.append(values[0])
+    test_texts_1 = clean_texts(test_texts_1, REMOVE_STOPWORDS, STEM_WORDS)
+    test_texts_2 = clean_texts(test_texts_2, REMOVE_STOPWORDS, STEM_WORDS)
+    print('Found %s texts in test.csv' % len(test_texts_1))
+
+    tokenizer = Tokenizer(num_words=MAX_NB_WORDS)
+    tokenizer.fit_on_texts(texts_1 + texts_2 + test_texts_1 + test_texts_2)
+
+    sequences_1 = tokenizer.texts_to_sequences(texts_1)
+    sequences_2 = tokenizer.texts_to_sequences(texts_2)
+    test_sequences_1 = tokenizer.texts_to_sequences(test_texts_1)
+    test_sequences_2 = tokenizer.texts_to_sequences(test_texts_2)
+
+    word_index = tokenizer.word_index
+    print('Found %s unique tokens' % len(word_index))
+
+    data_1 = pad_sequences(sequences_1, maxlen=MAX_SEQUENCE_LENGTH)
+    data_2 = pad_sequences(sequences_2, maxlen=MAX_SEQUENCE_LENGTH)
+    labels = np.array(labels)
+    print('Shape of data tensor:', data_1.shape)
+    print('Shape of label tensor:', labels.shape)
+
+    test_data_1 = pad_sequences(test_sequences_1, maxlen=MAX_SEQUENCE_LENGTH)
+    test_data_2 = pad_sequences(test_sequences_2, maxlen=MAX_SEQUENCE_LENGTH)
+    test_ids = np.array(test_ids)
+
+    ########################################
+    ## generate leaky features
+    ########################################
+
+    train_df = pd.read_csv(TRAIN_DATA_FILE)
+    test_df = pd.read_csv(TEST_DATA_FILE)
+
+    ques = pd.concat([train_df[['question1', 'question2']], \
+            test_df[['question1', 'question2']]], axis=0).reset_index(drop='index')
+    # degrees and common neighbours in the graph of all the question pairs
+    graph = graph_features(ques.question1.values, ques.question2.values)
+    for col in ['q1_q2_intersect', 'q1_freq', 'q2_freq']:
+        train_df[col] = graph[col].values[:len(train_df)]
+        test_df[col] = graph[col].values[len(train_df):]
+
+    leaks = train_df[['q1_q2_intersect', 'q1_freq', 'q2_freq']]
+    test_leaks = test_df[['q1_q2_intersect', 'q1_freq', 'q2_freq']]
+
+    ss = StandardScaler()
+    ss.fit(np.vstack((leaks, test_leaks)))
+    leaks = ss.transform(leaks)
+    test_leaks = ss.transform(test_leaks)
+
+    ########################################
+    ## prepare embeddings
+    ########################################
+    print('Preparing embedding matrix')
+
+    nb_words = min(MAX_NB_WORDS, len(word_index))+1
+
+    embedding_matrix = embeddings_index.embedding_matrix(word_index, nb_words)
+    print('Null word embeddings: %d' % np.sum(np.sum(embedding_matrix, axis=1) == 0))
+
+    return dict(data_1=data_1, data_2=data_2, labels=labels, leaks=leaks,
+            test_data_1=test_data_1, test_data_2=test_data_2, test_ids=test_ids, test_leaks=test_leaks,
+            embedding_matrix=embedding_matrix), word_index
 
 ########################################
-## generate leaky features
+## load or build the preprocessed data
 ########################################
-
-train_df = pd.read_csv(TRAIN_DATA_FILE)
-test_df = pd.read_csv(TEST_DATA_FILE)
-
-ques = pd.concat([train_df[['question1', 'question2']], \
-        test_df[['question1', 'question2']]], axis=0).reset_index(drop='index')
-q_dict = defaultdict(set)
-for i in range(ques.shape[0]):
-        q_dict[ques.question1[i]].add(ques.question2[i])
-        q_dict[ques.question2[i]].add(ques.question1[i])
-
-def q1_freq(row):
-    return(len(q_dict[row['question1']]))
-    
-def q2_freq(row):
-    return(len(q_dict[row['question2']]))
-    
-def q1_q2_intersect(row):
-    return(len(set(q_dict[row['question1']]).intersection(set(q_dict[row['question2']]))))
-
-train_df['q1_q2_intersect'] = train_df.apply(q1_q2_intersect, axis=1, raw=True)
-train_df['q1_freq'] = train_df.apply(q1_freq, axis=1, raw=True)
-train_df['q2_freq'] = train_df.apply(q2_freq, axis=1, raw=True)
-
-test_df['q1_q2_intersect'] = test_df.apply(q1_q2_intersect, axis=1, raw=True)
-test_df['q1_freq'] = test_df.apply(q1_freq, axis=1, raw=True)
-test_df['q2_freq'] = test_df.apply(q2_freq, axis=1, raw=True)
-
-leaks = train_df[['q1_q2_intersect', 'q1_freq', 'q2_freq']]
-test_leaks = test_df[['q1_q2_intersect', 'q1_freq', 'q2_freq']]
-
-ss = StandardScaler()
-ss.fit(np.vstack((leaks, test_leaks)))
-leaks = ss.transform(leaks)
-test_leaks = ss.transform(test_leaks)
+params = {'max_sequence_length': MAX_SEQUENCE_LENGTH, 'max_nb_words': MAX_NB_WORDS,
+        'embedding_dim': EMBEDDING_DIM, 'remove_stopwords': REMOVE_STOPWORDS, 'stem_words': STEM_WORDS}
+artifacts, word_index = cached_artifacts(params, preprocess,
+        [EMBEDDING_FILE, TRAIN_DATA_FILE, TEST_DATA_FILE], CACHE_DIR)
+data_1, data_2 = artifacts['data_1'], artifacts['data_2']
+labels, leaks = artifacts['labels'], artifacts['leaks']
+test_data_1, test_data_2 = artifacts['test_data_1'], artifacts['test_data_2']
+test_ids, test_leaks = artifacts['test_ids'], artifacts['test_leaks']
+embedding_matrix = artifacts['embedding_matrix']
+nb_words = embedding_matrix.shape[0]
 
 ########################################
-## prepare embeddings
+## model
 ########################################
-print('Preparing embedding matrix')
-
-nb_words = min(MAX_NB_WORDS, len(word_index))+1
-
-embedding_matrix = np.zeros((nb_words, EMBEDDING_DIM))
-for word, i in word_index.items():
-    embedding_vector = embeddings_index.get(word)
-    if embedding_vector is not None:
-        embedding_matrix[i] = embedding_vector
-print('Null word embeddings: %d' % np.sum(np.sum(embedding_matrix, axis=1) == 0))
+def train(num_lstm, num_dense, rate_drop_lstm, rate_drop_dense):
+    # one model on the preprocessed data, writes its submission and returns the best val_loss
+    ########################################
+    ## sample train/validation data
+    ########################################
+    #np.random.seed(1234)
+    perm = np.random.permutation(len(data_1))
+    idx_train = perm[:int(len(data_1)*(1-VALIDATION_SPLIT))]
+    idx_val = perm[int(len(data_1)*(1-VALIDATION_SPLIT)):]
+
+    weight = np.ones(len(labels))
+    if re_weight:
+        weight *= 0.472001959
+        weight[labels==0] = 1.309028344
+
+    # (q1, q2) and (q2, q1) batches of similar lengths, taken from data_1 / data_2 as they are
+    train_batches = PairBatches(data_1, data_2, leaks, idx_train, labels, batch_size=2048)
+
+    # the validation pairs are few, fixed arrays give every epoch the same val_loss samples
+    data_1_val = np.vstack((data_1[idx_val], data_2[idx_val]))
+    data_2_val = np.vstack((data_2[idx_val], data_1[idx_val]))
+    leaks_val = np.vstack((leaks[idx_val], leaks[idx_val]))
+    labels_val = np.concatenate((labels[idx_val], labels[idx_val]))
+    weight_val = np.concatenate((weight[idx_val], weight[idx_val]))
+
+    ########################################
+    ## define the model structure
+    ########################################
+    # padding is masked: a pair gives the same output whatever width its batch is trimmed to
+    embedding_layer = Embedding(nb_words,
+            EMBEDDING_DIM,
+            weights=[embedding_matrix],
+            mask_zero=True,
+            trainable=False)
+    lstm_layer = LSTM(num_lstm, dropout=rate_drop_lstm, recurrent_dropout=rate_drop_lstm)
+
+    sequence_1_input = Input(shape=(None,), dtype='int32')
+    embedded_sequences_1 = embedding_layer(sequence_1_input)
+    x1 = lstm_layer(embedded_sequences_1)
+
+    sequence_2_input = Input(shape=(None,), dtype='int32')
+    embedded_sequences_2 = embedding_layer(sequence_2_input)
+    y1 = lstm_layer(embedded_sequences_2)
+
+    leaks_input = Input(shape=(leaks.shape[1],))
+    leaks_dense = Dense(num_dense/2, activation=act)(leaks_input)
+
+    merged = concatenate([x1, y1, leaks_dense])
+    merged = BatchNormalization()(merged)
+    merged = Dropout(rate_drop_dense)(merged)
+
+    merged = Dense(num_dense, activation=act)(merged)
+    merged = BatchNormalization()(merged)
+    merged = Dropout(rate_drop_dense)(merged)
+
+    preds = Dense(1, activation='sigmoid')(merged)
+
+    ########################################
+    ## add class weight
+    ########################################
+    if re_weight:
+        class_weight = {0: 1.309028344, 1: 0.472001959}
+    else:
+        class_weight = None
+
+    ########################################
+    ## train the model
+    ########################################
+    STAMP = 'lstm_%d_%d_%.2f_%.2f'%(num_lstm, num_dense, rate_drop_lstm, \
+            rate_drop_dense)
+
+    model = Model(inputs=[sequence_1_input, sequence_2_input, leaks_input], \
+            outputs=preds)
+    model.compile(loss='binary_crossentropy',
+            optimizer='nadam',
+            metrics=['acc'])
+    #model.summary()
+    print(STAMP)
+
+    early_stopping =EarlyStopping(monitor='val_loss', patience=3)
+    bst_model_path = STAMP + '.h5'
+    model_checkpoint = ModelCheckpoint(bst_model_path, save_best_only=True, save_weights_only=True)
+
+    hist = model.fit_generator(iter(train_batches), steps_per_epoch=train_batches.steps, \
+            validation_data=([data_1_val, data_2_val, leaks_val], labels_val, weight_val), \
+            epochs=200, class_weight=class_weight, callbacks=[early_stopping, model_checkpoint])
+
+    model.load_weights(bst_model_path)
+    bst_val_score = min(hist.history['val_loss'])
+
+    ########################################
+    ## make the submission
+    ########################################
+    print('Start making the submission before fine-tuning')
+
+    preds = predict_pairs(model, test_data_1, test_data_2, test_leaks, batch_size=8192)
+
+    submission = pd.DataFrame({'test_id':test_ids, 'is_duplicate':preds.ravel()})
+    submission.to_csv('%.4f_'%(bst_val_score)+STAMP+'.csv', index=False)
+    return bst_val_score
 
-########################################
-## sample train/validation data
-########################################
-#np.random.seed(1234)
-perm = np.random.permutation(len(data_1))
-idx_train = perm[:int(len(data_1)*(1-VALIDATION_SPLIT))]
-idx_val = perm[int(len(data_1)*(1-VALIDATION_SPLIT)):]
-
-data_1_train = np.vstack((data_1[idx_train], data_2[idx_train]))
-data_2_train = np.vstack((data_2[idx_train], data_1[idx_train]))
-leaks_train = np.vstack((leaks[idx_train], leaks[idx_train]))
-labels_train = np.concatenate((labels[idx_train], labels[idx_train]))
-
-data_1_val = np.vstack((data_1[idx_val], data_2[idx_val]))
-data_2_val = np.vstack((data_2[idx_val], data_1[idx_val]))
-leaks_val = np.vstack((leaks[idx_val], leaks[idx_val]))
-labels_val = np.concatenate((labels[idx_val], labels[idx_val]))
-
-weight_val = np.ones(len(labels_val))
-if re_weight:
-    weight_val *= 0.472001959
-    weight_val[labels_val==0] = 1.309028344
 
 ########################################
-## define the model structure
+## train random architectures
 ########################################
-embedding_layer = Embedding(nb_words,
-        EMBEDDING_DIM,
-        weights=[embedding_matrix],
-        input_length=MAX_SEQUENCE_LENGTH,
-        trainable=False)
-lstm_layer = LSTM(num_lstm, dropout=rate_drop_lstm, recurrent_dropout=rate_drop_lstm)
-
-sequence_1_input = Input(shape=(MAX_SEQUENCE_LENGTH,), dtype='int32')
-embedded_sequences_1 = embedding_layer(sequence_1_input)
-x1 = lstm_layer(embedded_sequences_1)
-
-sequence_2_input = Input(shape=(MAX_SEQUENCE_LENGTH,), dtype='int32')
-embedded_sequences_2 = embedding_layer(sequence_2_input)
-y1 = lstm_layer(embedded_sequences_2)
-
-leaks_input = Input(shape=(leaks.shape[1],))
-leaks_dense = Dense(num_dense/2, activation=act)(leaks_input)
-
-merged = concatenate([x1, y1, leaks_dense])
-merged = BatchNormalization()(merged)
-merged = Dropout(rate_drop_dense)(merged)
-
-merged = Dense(num_dense, activation=act)(merged)
-merged = BatchNormalization()(merged)
-merged = Dropout(rate_drop_dense)(merged)
-
-preds = Dense(1, activation='sigmoid')(merged)
-
-########################################
-## add class weight
-########################################
-if re_weight:
-    class_weight = {0: 1.309028344, 1: 0.472001959}
-else:
-    class_weight = None
-
-########################################
-## train the model
-########################################
-model = Model(inputs=[sequence_1_input, sequence_2_input, leaks_input], \
-        outputs=preds)
-model.compile(loss='binary_crossentropy',
-        optimizer='nadam',
-        metrics=['acc'])
-#model.summary()
-print(STAMP)
-
-early_stopping =EarlyStopping(monitor='val_loss', patience=3)
-bst_model_path = STAMP + '.h5'
-model_checkpoint = ModelCheckpoint(bst_model_path, save_best_only=True, save_weights_only=True)
-
-hist = model.fit([data_1_train, data_2_train, leaks_train], labels_train, \
-        validation_data=([data_1_val, data_2_val, leaks_val], labels_val, weight_val), \
-        epochs=200, batch_size=2048, shuffle=True, \
-        class_weight=class_weight, callbacks=[early_stopping, model_checkpoint])
-
-model.load_weights(bst_model_path)
-bst_val_score = min(hist.history['val_loss'])
-
-########################################
-## make the submission
-########################################
-print('Start making the submission before fine-tuning')
-
-preds = model.predict([test_data_1, test_data_2, test_leaks], batch_size=8192, verbose=1)
-preds += model.predict([test_data_2, test_data_1, test_leaks], batch_size=8192, verbose=1)
-preds /= 2
-
-submission = pd.DataFrame({'test_id':test_ids, 'is_duplicate':preds.ravel()})
-submission.to_csv('%.4f_'%(bst_val_score)+STAMP+'.csv', index=False)
+# usage: python script.py [n_runs]; the runs share the preprocessed data
+n_runs = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+scores = []
+for run in range(n_runs):
+    num_lstm = np.random.randint(175, 275)
+    num_dense = np.random.randint(100, 150)
+    rate_drop_lstm = 0.15 + np.random.rand() * 0.25
+    rate_drop_dense = 0.15 + np.random.rand() * 0.25
+    scores.append((train(num_lstm, num_dense, rate_drop_lstm, rate_drop_dense),
+            num_lstm, num_dense, rate_drop_lstm, rate_drop_dense))
+    # the next model starts from an empty graph
+    K.clear_session()
+
+for score in sorted(scores):
+    print('val_loss %.4f: lstm_%d_%d_%.2f_%.2f' % score)
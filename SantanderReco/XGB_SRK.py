@@ -6,7 +6,6 @@ __author__ : SRK
 # https://www.kaggle.com/sudalairajkumar/santander-product-recommendation/when-less-is-more/code
 # https://www.kaggle.com/c/santander-product-recommendation/forums/t/25579/when-less-is-more
 
-import csv
 import datetime
 from operator import sub
 import numpy as np
@@ -14,6 +13,9 @@ import pandas as pd
 import xgboost as xgb
 from sklearn import preprocessing, ensemble
 import os
+from product_history import ProductHistory
+from ranking import recommendations
+from santander_reader import process_data, history_months, encode_categorical, scale_age, scale_seniority, scale_rent
 
 
 mapping_dict = {
@@ -39,73 +41,6 @@ target_cols = ['ind_ahor_fin_ult1','ind_aval_fin_ult1','ind_cco_fin_ult1','ind_c
 target_cols = target_cols[2:]
 
 
-# encode values
-def getTarget(row):
-    tlist = []
-    for col in target_cols:
-        if row[col].strip() in ['', 'NA']:
-            target = 0
-        else:
-            target = int(float(row[col]))
-        tlist.append(target)
-    return tlist
-
-def getIndex(row, col):
-    val = row[col].strip()
-    if val not in ['','NA']:
-        ind = mapping_dict[col][val]
-    else:
-        ind = mapping_dict[col][-99]
-    return ind
-
-def getAge(row):
-    mean_age = 40.
-    min_age = 20.
-    max_age = 90.
-    range_age = max_age - min_age
-    age = row['age'].strip()
-    if age == 'NA' or age == '':
-        age = mean_age
-    else:
-        age = float(age)
-        if age < min_age:
-            age = min_age
-        elif age > max_age:
-            age = max_age
-    return round( (age - min_age) / range_age, 4)
-
-def getCustSeniority(row):
-    min_value = 0.
-    max_value = 256.
-    range_value = max_value - min_value
-    missing_value = 0.
-    cust_seniority = row['antiguedad'].strip()
-    if cust_seniority == 'NA' or cust_seniority == '':
-        cust_seniority = missing_value
-    else:
-        cust_seniority = float(cust_seniority)
-        if cust_seniority < min_value:
-            cust_seniority = min_value
-        elif cust_seniority > max_value:
-            cust_seniority = max_value
-    return round((cust_seniority-min_value) / range_value, 4)
-
-def getRent(row):
-    min_value = 0.
-    max_value = 1500000.
-    range_value = max_value - min_value
-    missing_value = 101850.
-    rent = row['renta'].strip()
-    if rent == 'NA' or rent == '':
-        rent = missing_value
-    else:
-        rent = float(rent)
-        if rent < min_value:
-            rent = min_value
-        elif rent > max_value:
-            rent = max_value
-    return round((rent-min_value) / range_value, 6)
-
 def get_days_in(row, ref_time_str):
     '''
     Pocet dni od zalozenia ktorehokolvek produktu prvy krat.
@@ -119,25 +54,6 @@ def get_days_in(row, ref_time_str):
     return days_in
 
 
-def had_in_past(*args):
-    '''
-    had / not had product in last months
-    
-    INPUTS
-    lists of product for each month with same length
-    OUTPUT
-    [0, 1, 1, 1, 0, ...]
-    '''
-    Matrix = np.array(args)
-    sum_line = Matrix.sum(axis=0)
-    pocet = len(sum_line)
-    mask = np.where(sum_line < 1)
-    had_list = np.ones(pocet)
-    had_list[mask] = 0
-    return list(had_list)
-
-
-
 def fill_series(*args):
     '''
     Ak zakaznik mal poslednych 5 mesiacov prerusenie sluzby, tak namiesto
@@ -177,92 +93,30 @@ def sum_of_products(*args):
 
 
 
-def processData(in_file_name, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01):
+def rowFeatures(chunk):
     '''
-    creates X and y for training and X for predicting.
+    customer features of a chunk of rows, the columns of the old getIndex, getAge,
+    getCustSeniority and getRent calls
     '''
-    x_vars_list = []
-    y_vars_list = []
-    # read line by line
-    for row in csv.DictReader(in_file_name):
-        # use only the these months
-        if row['fecha_dato'] not in ['2015-01-28', '2016-01-28', '2015-02-28', '2016-02-28', '2015-03-28', 
-                                    '2016-03-28', '2015-04-28',
-                                    '2016-04-28', '2015-05-28', '2015-06-28', '2016-05-28', '2016-06-28']:
-            continue
-
-        # get target list for may
-        cust_id = int(row['ncodpers'])
-        if row['fecha_dato'] in ['2015-05-28', '2016-05-28']:   
-            target_list = getTarget(row)
-            cust_dict[cust_id] =  target_list[:]
-            continue
-
-        # get target list for april
-        if row['fecha_dato'] in ['2015-04-28', '2016-04-28']:   
-            target_list = getTarget(row)
-            cust_dict_04[cust_id] =  target_list[:]
-            continue
-
-        # get target list for March
-        if row['fecha_dato'] in ['2015-03-28', '2016-03-28']:   
-            target_list = getTarget(row)
-            cust_dict_03[cust_id] =  target_list[:]
-            continue
+    x_vars = [encode_categorical(chunk[col], mapping_dict[col]) for col in cat_cols]
+    x_vars.append(scale_age(chunk['age']))
+    x_vars.append(scale_seniority(chunk['antiguedad']))
+    x_vars.append(scale_rent(chunk['renta']))
+    return np.column_stack(x_vars)
 
-        # get target list for Feb
-        if row['fecha_dato'] in ['2015-02-28', '2016-02-28']:   
-            target_list = getTarget(row)
-            cust_dict_02[cust_id] =  target_list[:]
-            continue
 
-        # get target list for Jan
-        if row['fecha_dato'] in ['2015-01-28', '2016-01-28']:   
-            target_list = getTarget(row)
-            cust_dict_01[cust_id] =  target_list[:]
-            continue
-
-
-        # include cleaned predictors in X
-        x_vars = []
-        for col in cat_cols:
-            x_vars.append( getIndex(row, col) )
-        x_vars.append( getAge(row) )
-        x_vars.append( getCustSeniority(row) )
-        x_vars.append( getRent(row) )
-        # x_vars.append(get_days_in(row, row['fecha_dato']))
+def processData(in_file_name, history):
+    '''
+    creates X and y for training and X for predicting.
+    The file is read in column chunks of the used months and features are encoded per column.
+    history: ProductHistory of the customers products, the last 5 months are added to every row
+    '''
+    x_vars, y_vars = process_data(in_file_name, rowFeatures,
+                                  cat_cols + ['age', 'antiguedad', 'renta'],
+                                  target_cols, history, n_lags=5)
+    return x_vars, y_vars, history
 
-        # for real prediction get only X
-        if row['fecha_dato'] == '2016-06-28':
-            prev_target_list = cust_dict.get(cust_id, [0]*22)
-            prev_target_list_04 = cust_dict_04.get(cust_id, [0]*22)
-            prev_target_list_03 = cust_dict_03.get(cust_id, [0]*22)
-            prev_target_list_02 = cust_dict_02.get(cust_id, [0]*22)
-            prev_target_list_01 = cust_dict_01.get(cust_id, [0]*22)
-            # produc_sums = sum_of_products(prev_target_list, prev_target_list_04, prev_target_list_03, prev_target_list_02, prev_target_list_01)
-            had_list = had_in_past(prev_target_list, prev_target_list_04, prev_target_list_03, prev_target_list_02, prev_target_list_01)
-            x_vars_list.append(x_vars + prev_target_list + prev_target_list_04 + prev_target_list_03 + prev_target_list_02 + prev_target_list_01 + had_list)
-        # for training set get X and y too
-        elif row['fecha_dato'] == '2015-06-28':
-            prev_target_list = cust_dict.get(cust_id, [0]*22)
-            prev_target_list_04 = cust_dict_04.get(cust_id, [0]*22)
-            prev_target_list_03 = cust_dict_03.get(cust_id, [0]*22)
-            prev_target_list_02 = cust_dict_02.get(cust_id, [0]*22)
-            prev_target_list_01 = cust_dict_01.get(cust_id, [0]*22)
-            # produc_sums = sum_of_products(prev_target_list, prev_target_list_04, prev_target_list_03, prev_target_list_02, prev_target_list_01)
-            had_list = had_in_past(prev_target_list, prev_target_list_04, prev_target_list_03, prev_target_list_02, prev_target_list_01)
-            target_list = getTarget(row)
-            new_products = [max(x1 - x2,0) for (x1, x2) in zip(target_list, prev_target_list)]
-            if sum(new_products) > 0:
-                # when customer has more new products, the same line is duplicated with other target variable
-                for ind, prod in enumerate(new_products):
-                    if prod>0:
-                        assert len(prev_target_list) == 22
-                        x_vars_list.append(x_vars+prev_target_list+prev_target_list_04+prev_target_list_03+prev_target_list_02+prev_target_list_01+had_list)
-                        y_vars_list.append(ind)
 
-    return x_vars_list, y_vars_list, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01
-            
 def runXGB(train_X, train_y, seed_val=0):
     param = {}
     param['objective'] = 'multi:softprob'
@@ -289,7 +143,8 @@ if __name__ == "__main__":
     data_dir = os.path.join(root_dir, 'data_examples', 'SantanderReco')
     data_path = data_dir + '/'
     train_file =  open(data_path + "train_ver2.csv")
-    x_vars_list, y_vars_list, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01 = processData(train_file, {}, {}, {}, {}, {})
+    history = ProductHistory(history_months(5), len(target_cols))
+    x_vars_list, y_vars_list, history = processData(train_file, history)
     train_X = np.array(x_vars_list)
     train_y = np.array(y_vars_list)
     print(np.unique(train_y))
@@ -298,7 +153,7 @@ if __name__ == "__main__":
     print(train_X.shape, train_y.shape)
     print(datetime.datetime.now()-start_time)
     test_file = open(data_path + "test_ver2.csv")
-    x_vars_list, y_vars_list, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01 = processData(test_file, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01)
+    x_vars_list, y_vars_list, history = processData(test_file, history)
     test_X = np.array(x_vars_list)
     del x_vars_list
     test_file.close()
@@ -315,11 +170,8 @@ if __name__ == "__main__":
     print(datetime.datetime.now()-start_time)
 
     print("Getting the top products..")
-    target_cols = np.array(target_cols)
-    preds = np.argsort(preds, axis=1)
-    preds = np.fliplr(preds)[:,:7]
     test_id = np.array(pd.read_csv(data_path + "test_ver2.csv", usecols=['ncodpers'])['ncodpers'])
-    final_preds = [" ".join(list(target_cols[pred])) for pred in preds]
+    final_preds = recommendations(preds, target_cols, k=7)
     out_df = pd.DataFrame({'ncodpers':test_id, 'added_products':final_preds})
     out_df.to_csv('sub_xgb_new1.csv', index=False)
     print(datetime.datetime.now()-start_time)
\ No newline at end of file
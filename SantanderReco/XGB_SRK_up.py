@@ -6,7 +6,6 @@ __author__ : SRK
 # https://www.kaggle.com/sudalairajkumar/santander-product-recommendation/when-less-is-more/code
 # https://www.kaggle.com/c/santander-product-recommendation/forums/t/25579/when-less-is-more
 
-import csv
 import datetime
 from operator import sub
 import numpy as np
@@ -15,6 +14,9 @@ import xgboost as xgb
 from sklearn import preprocessing, ensemble
 import os
 import random
+from product_history import ProductHistory
+from ranking import recommendations
+from santander_reader import process_data, history_months, encode_categorical, scale_age, scale_seniority, scale_rent, marriage_index
 
 
 mapping_dict = {
@@ -40,98 +42,11 @@ target_cols = ['ind_ahor_fin_ult1','ind_aval_fin_ult1','ind_cco_fin_ult1','ind_c
 target_cols = target_cols[2:]
 
 
-# encode values
-def getTarget(row):
-    tlist = []
-    for col in target_cols:
-        if row[col].strip() in ['', 'NA']:
-            target = 0
-        else:
-            target = int(float(row[col]))
-        tlist.append(target)
-    return tlist
-
-def getIndex(row, col):
-    val = row[col].strip()
-    if val not in ['','NA']:
-        ind = mapping_dict[col][val]
-    else:
-        ind = mapping_dict[col][-99]
-    return ind
-
-def getAge(row):
-    mean_age = 40.
-    min_age = 20.
-    max_age = 90.
-    range_age = max_age - min_age
-    age = row['age'].strip()
-    if age == 'NA' or age == '':
-        age = mean_age
-    else:
-        age = float(age)
-        if age < min_age:
-            age = min_age
-        elif age > max_age:
-            age = max_age
-    return round( (age - min_age) / range_age, 4)
-
-def getCustSeniority(row):
-    min_value = 0.
-    max_value = 256.
-    range_value = max_value - min_value
-    missing_value = 0.
-    cust_seniority = row['antiguedad'].strip()
-    if cust_seniority == 'NA' or cust_seniority == '':
-        cust_seniority = missing_value
-    else:
-        cust_seniority = float(cust_seniority)
-        if cust_seniority < min_value:
-            cust_seniority = min_value
-        elif cust_seniority > max_value:
-            cust_seniority = max_value
-    return round((cust_seniority-min_value) / range_value, 4)
-
-def getRent(row):
-    min_value = 0.
-    max_value = 1500000.
-    range_value = max_value - min_value
-    renta_dict = {'ALBACETE': 76895,  'ALICANTE': 60562,  'ALMERIA': 77815,  'ASTURIAS': 83995,  'AVILA': 78525,  'BADAJOZ': 60155,  'BALEARS, ILLES': 114223,  'BARCELONA': 135149,  'BURGOS': 87410, 'NAVARRA' : 101850,
-    'CACERES': 78691,  'CADIZ': 75397,  'CANTABRIA': 87142,  'CASTELLON': 70359,  'CEUTA': 333283, 'CIUDAD REAL': 61962,  'CORDOBA': 63260,  'CORUÑA, A': 103567,  'CUENCA': 70751,  'GIRONA': 100208,  'GRANADA': 80489,
-    'GUADALAJARA': 100635,  'HUELVA': 75534,  'HUESCA': 80324,  'JAEN': 67016,  'LEON': 76339,  'LERIDA': 59191,  'LUGO': 68219,  'MADRID': 141381,  'MALAGA': 89534,  'MELILLA': 116469, 'GIPUZKOA': 101850,
-    'MURCIA': 68713,  'OURENSE': 78776,  'PALENCIA': 90843,  'PALMAS, LAS': 78168,  'PONTEVEDRA': 94328,  'RIOJA, LA': 91545,  'SALAMANCA': 88738,  'SANTA CRUZ DE TENERIFE': 83383, 'ALAVA': 101850, 'BIZKAIA' : 101850,
-    'SEGOVIA': 81287,  'SEVILLA': 94814,  'SORIA': 71615,  'TARRAGONA': 81330,  'TERUEL': 64053,  'TOLEDO': 65242,  'UNKNOWN': 103689,  'VALENCIA': 73463,  'VALLADOLID': 92032,  'ZAMORA': 73727,  'ZARAGOZA': 98827}
-
-    #missing_value = 101850.
-    rent = row['renta'].strip()
-    if rent == 'NA' or rent == '':
-        if row['nomprov'] == 'NA' or row['nomprov'] == '':
-            rent = float(renta_dict['UNKNOWN'])
-        else:
-            rent = float(renta_dict[row['nomprov']])
-    else:
-        rent = float(rent)
-        if rent < min_value:
-            rent = min_value
-        elif rent > max_value:
-            rent = max_value
-
-    return round((rent-min_value) / range_value, 6)
-
-
-def getMarriageIndex(row, age, sex, income):
-    marriage_age = 28
-    modifier = 0
-    if sex == 'V':
-        modifier += -2
-    if income <= 101850:
-        modifier += -1
-    
-    marriage_age_mod = marriage_age + modifier
-    
-    if age <= marriage_age_mod:
-        return 0
-    else:
-        return 1
+renta_dict = {'ALBACETE': 76895,  'ALICANTE': 60562,  'ALMERIA': 77815,  'ASTURIAS': 83995,  'AVILA': 78525,  'BADAJOZ': 60155,  'BALEARS, ILLES': 114223,  'BARCELONA': 135149,  'BURGOS': 87410, 'NAVARRA' : 101850,
+'CACERES': 78691,  'CADIZ': 75397,  'CANTABRIA': 87142,  'CASTELLON': 70359,  'CEUTA': 333283, 'CIUDAD REAL': 61962,  'CORDOBA': 63260,  'CORUÑA, A': 103567,  'CUENCA': 70751,  'GIRONA': 100208,  'GRANADA': 80489,
+'GUADALAJARA': 100635,  'HUELVA': 75534,  'HUESCA': 80324,  'JAEN': 67016,  'LEON': 76339,  'LERIDA': 59191,  'LUGO': 68219,  'MADRID': 141381,  'MALAGA': 89534,  'MELILLA': 116469, 'GIPUZKOA': 101850,
+'MURCIA': 68713,  'OURENSE': 78776,  'PALENCIA': 90843,  'PALMAS, LAS': 78168,  'PONTEVEDRA': 94328,  'RIOJA, LA': 91545,  'SALAMANCA': 88738,  'SANTA CRUZ DE TENERIFE': 83383, 'ALAVA': 101850, 'BIZKAIA' : 101850,
+'SEGOVIA': 81287,  'SEVILLA': 94814,  'SORIA': 71615,  'TARRAGONA': 81330,  'TERUEL': 64053,  'TOLEDO': 65242,  'UNKNOWN': 103689,  'VALENCIA': 73463,  'VALLADOLID': 92032,  'ZAMORA': 73727,  'ZARAGOZA': 98827}
 
 
 def getMonth(row):
@@ -157,25 +72,6 @@ def get_days_in(row, ref_time_str):
     return days_in
 
 
-def had_in_past(*args):
-    '''
-    had / not had product in last months
-    
-    INPUTS
-    lists of product for each month with same length
-    OUTPUT
-    [0, 1, 1, 1, 0, ...]
-    '''
-    Matrix = np.array(args)
-    sum_line = Matrix.sum(axis=0)
-    pocet = len(sum_line)
-    mask = np.where(sum_line < 1)
-    had_list = np.ones(pocet)
-    had_list[mask] = 0
-    return list(had_list)
-
-
-
 def fill_series(*args):
     '''
     Ak zakaznik mal poslednych 5 mesiacov prerusenie sluzby, tak namiesto
@@ -215,98 +111,34 @@ def sum_of_products(*args):
 
 
 
-def processData(in_file_name, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01):
+def rowFeatures(chunk):
+    '''
+    customer features of a chunk of rows, the columns of the old getIndex, getAge,
+    getCustSeniority, getRent and getMarriageIndex calls
+    '''
+    x_vars = [encode_categorical(chunk[col], mapping_dict[col]) for col in cat_cols]
+    sex = encode_categorical(chunk['sexo'], mapping_dict['sexo'])
+    age = scale_age(chunk['age'])
+    x_vars.append(age)
+    x_vars.append(scale_seniority(chunk['antiguedad']))
+    income = scale_rent(chunk['renta'], chunk['nomprov'], renta_dict)
+    x_vars.append(income)
+    x_vars.append(marriage_index(age, sex, income))
+    return np.column_stack(x_vars)
+
+
+def processData(in_file_name, history):
     '''
     creates X and y for training and X for predicting.
+    The file is read in column chunks of the used months and features are encoded per column.
+    history: ProductHistory of the customers products, the last 5 months are added to every row
     '''
-    x_vars_list = []
-    y_vars_list = []
-    # read line by line
-    for row in csv.DictReader(in_file_name):
-        # use only the these months
-        if row['fecha_dato'] not in ['2015-01-28', '2016-01-28', '2015-02-28', '2016-02-28', '2015-03-28', 
-                                    '2016-03-28', '2015-04-28',
-                                    '2016-04-28', '2015-05-28', '2015-06-28', '2016-05-28', '2016-06-28']:
-            continue
-
-        # get target list for may
-        cust_id = int(row['ncodpers'])
-        if row['fecha_dato'] in ['2015-05-28', '2016-05-28']:   
-            target_list = getTarget(row)
-            cust_dict[cust_id] =  target_list[:]
-            continue
-
-        # get target list for april
-        if row['fecha_dato'] in ['2015-04-28', '2016-04-28']:   
-            target_list = getTarget(row)
-            cust_dict_04[cust_id] =  target_list[:]
-            continue
-
-        # get target list for March
-        if row['fecha_dato'] in ['2015-03-28', '2016-03-28']:   
-            target_list = getTarget(row)
-            cust_dict_03[cust_id] =  target_list[:]
-            continue
-
-        # get target list for Feb
-        if row['fecha_dato'] in ['2015-02-28', '2016-02-28']:   
-            target_list = getTarget(row)
-            cust_dict_02[cust_id] =  target_list[:]
-            continue
-
-        # get target list for Jan
-        if row['fecha_dato'] in ['2015-01-28', '2016-01-28']:   
-            target_list = getTarget(row)
-            cust_dict_01[cust_id] =  target_list[:]
-            continue
-
-
-        # include cleaned predictors in X
-        x_vars = []
-        for col in cat_cols:
-            x_vars.append( getIndex(row, col) )
-        sex = getIndex(row, 'sexo')
-        age = getAge(row)
-        x_vars.append(age)
-        # x_vars.append( getMonth(row))
-        # x_vars.append( getjoinMonth(row))
-        x_vars.append(getCustSeniority(row))
-        income = getRent(row)
-        x_vars.append(income)
-        x_vars.append(getMarriageIndex(row, age, sex, income) )
-        # x_vars.append(get_days_in(row, row['fecha_dato']))
-
-        # for real prediction get only X
-        if row['fecha_dato'] == '2016-06-28':
-            prev_target_list = cust_dict.get(cust_id, [0]*22)
-            prev_target_list_04 = cust_dict_04.get(cust_id, [0]*22)
-            prev_target_list_03 = cust_dict_03.get(cust_id, [0]*22)
-            prev_target_list_02 = cust_dict_02.get(cust_id, [0]*22)
-            prev_target_list_01 = cust_dict_01.get(cust_id, [0]*22)
-            # produc_sums = sum_of_products(prev_target_list, prev_target_list_04, prev_target_list_03, prev_target_list_02, prev_target_list_01)
-            had_list = had_in_past(prev_target_list, prev_target_list_04, prev_target_list_03, prev_target_list_02, prev_target_list_01)
-            x_vars_list.append(x_vars + prev_target_list + prev_target_list_04 + prev_target_list_03 + prev_target_list_02 + prev_target_list_01 + had_list)
-        # for training set get X and y too
-        elif row['fecha_dato'] == '2015-06-28':
-            prev_target_list = cust_dict.get(cust_id, [0]*22)
-            prev_target_list_04 = cust_dict_04.get(cust_id, [0]*22)
-            prev_target_list_03 = cust_dict_03.get(cust_id, [0]*22)
-            prev_target_list_02 = cust_dict_02.get(cust_id, [0]*22)
-            prev_target_list_01 = cust_dict_01.get(cust_id, [0]*22)
-            # produc_sums = sum_of_products(prev_target_list, prev_target_list_04, prev_target_list_03, prev_target_list_02, prev_target_list_01)
-            had_list = had_in_past(prev_target_list, prev_target_list_04, prev_target_list_03, prev_target_list_02, prev_target_list_01)
-            target_list = getTarget(row)
-            new_products = [max(x1 - x2,0) for (x1, x2) in zip(target_list, prev_target_list)]
-            if sum(new_products) > 0:
-                # when customer has more new products, the same line is duplicated with other target variable
-                for ind, prod in enumerate(new_products):
-                    if prod>0:
-                        assert len(prev_target_list) == 22
-                        x_vars_list.append(x_vars+prev_target_list+prev_target_list_04+prev_target_list_03+prev_target_list_02+prev_target_list_01+had_list)
-                        y_vars_list.append(ind)
-
-    return x_vars_list, y_vars_list, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01
-            
+    x_vars, y_vars = process_data(in_file_name, rowFeatures,
+                                  cat_cols + ['age', 'antiguedad', 'renta', 'nomprov'],
+                                  target_cols, history, n_lags=5)
+    return x_vars, y_vars, history
+
+
 def runXGB(train_X, train_y, seed_val=0):
     param = {}
     param['objective'] = 'multi:softprob'
@@ -333,7 +165,8 @@ if __name__ == "__main__":
     data_dir = os.path.join(root_dir, 'data_examples', 'SantanderReco')
     data_path = data_dir + '/'
     train_file =  open(data_path + "train_ver2.csv")
-    x_vars_list, y_vars_list, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01 = processData(train_file, {}, {}, {}, {}, {})
+    history = ProductHistory(history_months(5), len(target_cols))
+    x_vars_list, y_vars_list, history = processData(train_file, history)
     train_X = np.array(x_vars_list)
     train_y = np.array(y_vars_list)
     print(np.unique(train_y))
@@ -342,7 +175,7 @@ if __name__ == "__main__":
     print(train_X.shape, train_y.shape)
     print(datetime.datetime.now()-start_time)
     test_file = open(data_path + "test_ver2.csv")
-    x_vars_list, y_vars_list, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01 = processData(test_file, cust_dict, cust_dict_04, cust_dict_03, cust_dict_02, cust_dict_01)
+    x_vars_list, y_vars_list, history = processData(test_file, history)
     test_X = np.array(x_vars_list)
     del x_vars_list
     test_file.close()
@@ -359,11 +192,8 @@ if __name__ == "__main__":
     print(datetime.datetime.now()-start_time)
 
     print("Getting the top products..")
-    target_cols = np.array(target_cols)
-    preds = np.argsort(preds, axis=1)
-    preds = np.fliplr(preds)[:,:7]
     test_id = np.array(pd.read_csv(data_path + "test_ver2.csv", usecols=['ncodpers'])['ncodpers'])
-    final_preds = [" ".join(list(target_cols[pred])) for pred in preds]
+    final_preds = recommendations(preds, target_cols, k=7)
     out_df = pd.DataFrame({'ncodpers':test_id, 'added_products':final_preds})
     out_df.to_csv('sub_xgb_ex4.csv', index=False)
     print(datetime.datetime.now()-start_time)
\ No newline at end of file
@@ -0,0 +1,92 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+
+
+def _source(csv_file):
+    return {'mtime': os.path.getmtime(csv_file), 'size': os.path.getsize(csv_file)}
+
+
+def _read_manifest(cache_dir, csv_file):
+    path = os.path.join(cache_dir, 'manifest.json')
+    if os.path.exists(path):
+        with open(path) as handle:
+            manifest = json.load(handle)
+        if manifest.get('version') == CACHE_VERSION and manifest.get('source') == _source(csv_file):
+            return manifest
+    return {'version': CACHE_VERSION, 'source': _source(csv_file), 'columns': {}}
+
+
+def _write_manifest(cache_dir, manifest):
+    tmp_path = os.path.join(cache_dir, 'manifest.json.tmp{}'.format(os.getpid()))
+    with open(tmp_path, 'w') as handle:
+        json.dump(manifest, handle)
+    os.rename(tmp_path, os.path.join(cache_dir, 'manifest.json'))
+
+
+def _read_columns(csv_file, columns, dtypes, chunksize):
+    # one pass over the csv for all the columns; strings are kept as int32 codes + categories
+    values = dict((col, []) for col in columns)
+    categories = dict((col, {}) for col in columns if dtypes.get(col, object) == object)
+    reader = pd.read_csv(csv_file, usecols=columns, dtype=dict((col, object) for col in columns),
+                         chunksize=chunksize)
+    for chunk in reader:
+        for col in columns:
+            if col in categories:
+                codes, uniques = pd.factorize(chunk[col].values)
+                lookup = np.array([categories[col].setdefault(u, len(categories[col])) for u in uniques] + [-1],
+                                  dtype=np.int32)
+                values[col].append(lookup[codes])
+            else:
+                # numbers with padding spaces and ' NA' like missing values
+                numbers = pd.to_numeric(chunk[col].str.strip(), errors='coerce')
+                values[col].append(numbers.values.astype(dtypes[col]))
+    for col in columns:
+        names = sorted(categories[col], key=categories[col].get) if col in categories else None
+        yield col, np.concatenate(values[col]), names
+
+
+def load_columns(csv_file, columns, dtypes=None, cache_dir=None, chunksize=1000000):
+    '''
+    pd.read_csv(csv_file, usecols=columns) through a binary column cache.
+    Columns not in the cache yet are read in one pass over the csv and stored as .npy files
+    (strings as int32 codes + categories), cached columns are memory-mapped. The cache is
+    dropped when the csv changes.
+    dtypes: {column: numpy dtype}; other columns are strings (object, missing values are NaN)
+    cache_dir: default csv_file + '.columns'
+    '''
+    dtypes = dict((col, np.dtype(t)) for col, t in (dtypes or {}).items())
+    if cache_dir is None:
+        cache_dir = csv_file + '.columns'
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    manifest = _read_manifest(cache_dir, csv_file)
+    cached = manifest['columns']
+    missing = [col for col in columns
+               if col not in cached or cached[col]['dtype'] != str(dtypes.get(col, np.dtype(object)))]
+    if missing:
+        print('reading {} columns of {}'.format(len(missing), csv_file))
+        for col, values, names in _read_columns(csv_file, missing, dtypes, chunksize):
+            name = 'col{}'.format(manifest.get('next_file', 0))
+            manifest['next_file'] = manifest.get('next_file', 0) + 1
+            np.save(os.path.join(cache_dir, name + '.npy'), values)
+            if names is not None:
+                with open(os.path.join(cache_dir, name + '.json'), 'w') as handle:
+                    json.dump(names, handle)
+            cached[col] = {'file': name, 'dtype': str(dtypes.get(col, np.dtype(object)))}
+        _write_manifest(cache_dir, manifest)
+
+    data = {}
+    for col in columns:
+        path = os.path.join(cache_dir, cached[col]['file'])
+        values = np.load(path + '.npy', mmap_mode='r')
+        if cached[col]['dtype'] == 'object':
+            with open(path + '.json') as handle:
+                # missing values have code -1, which picks the trailing NaN
+                names = np.array(json.load(handle) + [np.nan], dtype=object)
+            values = names[values]
+        data[col] = values
+    return pd.DataFrame(data, columns=columns)
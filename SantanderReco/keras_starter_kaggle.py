@@ -2,6 +2,7 @@ import sys
 import numpy as np
 import pandas as pd
 from sklearn import preprocessing
+from sparse_batches import one_hot_layout, encode_file, batch_generator
 
 from keras.models import Sequential
 from keras.layers.core import Dense, Activation, Merge, Reshape, Dropout
@@ -43,55 +44,11 @@ print(cols_to_use)
 target_cols = ['ind_ahor_fin_ult1','ind_aval_fin_ult1','ind_cco_fin_ult1','ind_cder_fin_ult1','ind_cno_fin_ult1','ind_ctju_fin_ult1','ind_ctma_fin_ult1','ind_ctop_fin_ult1','ind_ctpp_fin_ult1','ind_deco_fin_ult1','ind_deme_fin_ult1','ind_dela_fin_ult1','ind_ecue_fin_ult1','ind_fond_fin_ult1','ind_hip_fin_ult1','ind_plan_fin_ult1','ind_pres_fin_ult1','ind_reca_fin_ult1','ind_tjcr_fin_ult1','ind_valo_fin_ult1','ind_viv_fin_ult1','ind_nomina_ult1','ind_nom_pens_ult1','ind_recibo_ult1']
 print(target_cols)
 
-# one hot encode fit for all the categorical variables #
-ohes = []
-feat_count = 0
-for col in cols_to_use:
-	ohe = preprocessing.OneHotEncoder()
-	ohe.fit(np.array(list(mapping_dict[col].values())).reshape(-1,1))
-	feat_count += ohe.n_values_[0]
-	print(col, feat_count)
-	ohes.append(ohe)
-
-
-def batch_generator(file_name, batch_size, shuffle, train_input=True):
-	while (True):
-		if train_input:
-			chunked_df = pd.read_csv(file_name, usecols=['ncodpers']+cols_to_use+target_cols, chunksize=batch_size)
-		else:
-			chunked_df = pd.read_csv(file_name, usecols=['ncodpers']+cols_to_use, chunksize=batch_size)
-
-		nrows = 0
-		for chunk_df in chunked_df:
-			chunk_X = chunk_df[cols_to_use]
-			chunk_X = chunk_X.fillna(-99)
-			for col_ind, col in enumerate(cols_to_use):
-				chunk_X[col] = chunk_X[col].apply(lambda x: mapping_dict[col][x])
-				ohe = ohes[col_ind]
-				temp_X = ohe.transform( np.array(chunk_X[col]).reshape(-1,1) )
-				if col_ind == 0:
-					X = temp_X.todense().copy()
-				else:
-					X = np.hstack((X, temp_X.todense()))
-				
-			if train_input:
-				y = np.array(chunk_df[target_cols].fillna(0))
-
-			if shuffle:
-				shuffle_index = np.random.shuffle(np.arange(X.shape[0]))
-				X = X[shuffle_index,:]
-				if train_input:
-					y = y[shuffle_index,:]
-
-
-			if train_input:
-				yield X, y
-			else:
-				yield X
-
-			nrows += batch_size
-			if train_input and nrows >= train_size:
-				break
+# one hot layout of all the categorical variables #
+ohe_offsets, feat_count = one_hot_layout(mapping_dict, cols_to_use)
+for col, offset in zip(cols_to_use, ohe_offsets):
+	print(col, offset)
+print(feat_count)
 
 
 def keras_embedding_model():
@@ -112,15 +69,19 @@ if __name__ == "__main__":
 	#train_size = 13647309
 	train_size = 1000000
 	test_size = 929615
+	print("Encoding the data..")
+	train_X, train_y = encode_file(train, cols_to_use, mapping_dict, target_cols, nrows=train_size)
+	test_X, _ = encode_file(test, cols_to_use, mapping_dict)
+	print(train_X.shape, test_X.shape)
 	print("Initialize the model..")
 	model = keras_embedding_model()
 	print("Model fit..")
 	fit= model.fit_generator(
-			generator = batch_generator(train, 500, False), 
+			generator = batch_generator(train_X, train_y, 500, shuffle=False, prefetch=4), 
 			nb_epoch = 1,
 			samples_per_epoch = train_size
 		)
-	preds = model.predict_generator(generator=batch_generator(test, 10000, False, False), val_samples=test_size)
+	preds = model.predict_generator(generator=batch_generator(test_X, batch_size=10000, prefetch=4), val_samples=test_size)
 	print("Predictions : ", preds.shape)
 	
 	last_instance_df = pd.read_csv(train, usecols=['ncodpers']+target_cols, dtype=dtype_list)
@@ -3,6 +3,8 @@ import pandas as pd
 import os
 
 from sklearn import preprocessing, ensemble
+from ranking import ownership_matrix, recommendations
+from column_cache import load_columns
 
 # columns to be used as features #
 # feature_cols = ["ind_empleado","pais_residencia","sexo","age","ind_nuevo","antiguedad","indrel","ult_fec_cli_1t","indrel_1mes","tiprel_1mes","indresi","indext","conyuemp","canal_entrada","indfall","tipodom","cod_prov","nomprov","ind_actividad_cliente","renta","segmento"]
@@ -24,14 +26,17 @@ train_size = 13647309
 # 5 melonov nepomohlo
 nrows = 1000000 # change this value to read more rows from train
 
+# the feature columns are read as strings and label encoded, the targets as float16
+column_dtypes = dtype_list
+
 start_index = train_size - nrows	
+# all columns in one pass, later runs load them from the column cache
+train_df = load_columns(train_file, ['ncodpers'] + feature_cols + target_cols, column_dtypes)
+test_df = load_columns(test_file, ['ncodpers'] + feature_cols, column_dtypes)
 for ind, col in enumerate(feature_cols):
 	print(col)
-	train = pd.read_csv(train_file, usecols=[col])
-	test = pd.read_csv(test_file, usecols=[col])
-	if col == 'renta':
-		train = train.replace('         NA', -99)
-		test = test.replace('         NA', -99)
+	train = train_df[[col]].copy()
+	test = test_df[[col]].copy()
 	train.fillna(-99, inplace=True)
 	test.fillna(-99, inplace=True)
 
@@ -54,7 +59,8 @@ for ind, col in enumerate(feature_cols):
 del train
 del test
 print(train_X)
-train_y = pd.read_csv(train_file, usecols=['ncodpers']+target_cols, dtype=dtype_list)
+train_y = train_df[['ncodpers']+target_cols]
+del train_df
 last_instance_df = train_y.drop_duplicates('ncodpers', keep='last')
 train_y = np.array(train_y.fillna(0)).astype('int')[start_index:,1:]
 print(train_X.shape, train_y.shape)
@@ -69,36 +75,14 @@ preds = np.array(model.predict_proba(test_X))[:,:,1].T
 del test_X
 print ('preds shape:', preds.shape)
 
-print("Getting last instance dict..")
+print("Getting last instance products..")
 last_instance_df = last_instance_df.fillna(0).astype('int')
-cust_dict = {}
-target_cols = np.array(target_cols)
-for ind, row in last_instance_df.iterrows():
-	cust = row['ncodpers']
-	used_products = set(target_cols[np.array(row[1:])==1])
-	cust_dict[cust] = used_products
+test_id = np.array(test_df['ncodpers'])
+owned = ownership_matrix(test_id, last_instance_df['ncodpers'].values, last_instance_df[target_cols].values)
 del last_instance_df
-print (row)
-print (cust, cust_dict[cust])
 
 print("Creating submission..")
-preds = np.argsort(preds, axis=1)
-preds = np.fliplr(preds)
-#print preds.shape
-test_id = np.array(pd.read_csv(test_file, usecols=['ncodpers'])['ncodpers'])
-final_preds = []
-for ind, pred in enumerate(preds):
-	cust = test_id[ind]
-	top_products = target_cols[pred]
-	used_products = cust_dict.get(cust,[])
-	print (cust, used_products)
-	new_top_products = []
-	for product in top_products:
-		if product not in used_products:
-			new_top_products.append(product)
-		if len(new_top_products) == 7:
-			break
-	final_preds.append(" ".join(new_top_products))
+final_preds = recommendations(preds, target_cols, k=7, owned=owned)
 out_df = pd.DataFrame({'ncodpers':test_id, 'added_products':final_preds})
 out_df.to_csv('sub_rf2.csv', index=False)			
 
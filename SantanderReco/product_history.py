@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+
+def month_number(fecha_dato):
+    '''months since year 0 of 'YYYY-MM-DD' strings, consecutive months differ by one'''
+    codes, uniques = pd.factorize(np.asarray(fecha_dato, dtype=object))
+    numbers = np.array([int(v[:4]) * 12 + int(v[5:7]) - 1 for v in uniques], dtype=np.int64)
+    return numbers[codes]
+
+
+class ProductHistory(object):
+    '''
+    Products owned by every customer in a set of months, stored as one uint8 tensor
+    of shape (n_customers, n_months, n_products).
+    Customers get rows in the order they are first seen, ncodpers -> row goes through a pandas Index.
+    months: list of month numbers (see month_number) to keep, rows of other months are ignored
+    '''
+    def __init__(self, months, n_products, capacity=1024):
+        self.months = sorted(months)
+        self.n_products = n_products
+        self.slots = np.full(self.months[-1] + 1, -1, dtype=np.int64)
+        self.slots[self.months] = np.arange(len(self.months))
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.tensor = np.zeros((capacity, len(self.months), n_products), dtype=np.uint8)
+        self.n_customers = 0
+        self._index = None
+
+    def _slot(self, months):
+        months = np.asarray(months, dtype=np.int64)
+        inside = (months >= 0) & (months < len(self.slots))
+        return np.where(inside, self.slots[np.clip(months, 0, len(self.slots) - 1)], -1)
+
+    def rows(self, ids, add=False):
+        '''rows of the customers, -1 for unknown ones; add: give new customers a row'''
+        if self._index is None:
+            self._index = pd.Index(self.ids[:self.n_customers])
+        rows = self._index.get_indexer(ids)
+        if add and (rows < 0).any():
+            new_ids = pd.unique(ids[rows < 0])
+            size = self.n_customers + len(new_ids)
+            if size > len(self.ids):
+                capacity = max(size, 2 * len(self.ids))
+                self.ids = np.concatenate([self.ids, np.zeros(capacity - len(self.ids), dtype=np.int64)])
+                grown = np.zeros((capacity,) + self.tensor.shape[1:], dtype=np.uint8)
+                grown[:self.n_customers] = self.tensor[:self.n_customers]
+                self.tensor = grown
+            self.ids[self.n_customers:size] = new_ids
+            self.n_customers = size
+            self._index = None
+            return self.rows(ids)
+        return rows
+
+    def update(self, ids, months, products):
+        '''
+        Store the product flags of (customer, month) records, later records of the same pair win.
+        ids, months: arrays of length n; products: (n, n_products) 0/1 array
+        '''
+        slots = self._slot(months)
+        keep = slots >= 0
+        ids, slots, products = np.asarray(ids)[keep], slots[keep], np.asarray(products)[keep]
+        rows = self.rows(ids, add=True)
+        # last record of every (row, slot) pair
+        key = rows * len(self.months) + slots
+        _, last = np.unique(key[::-1], return_index=True)
+        last = len(key) - 1 - last
+        self.tensor[rows[last], slots[last]] = products[last]
+
+    def lags(self, ids, months, n_lags):
+        '''
+        (n, n_lags, n_products) products of the customers in the n_lags months before months,
+        lag 1 first; unknown customers and months that are not kept give zeros
+        '''
+        rows = self.rows(ids)
+        months = np.asarray(months, dtype=np.int64)
+        out = np.zeros((len(rows), n_lags, self.n_products), dtype=np.uint8)
+        for k in range(n_lags):
+            slots = self._slot(months - (k + 1))
+            found = (rows >= 0) & (slots >= 0)
+            out[found, k] = self.tensor[rows[found], slots[found]]
+        return out
+
+
+def had_in_past(lags):
+    '''1 for products owned in any of the lag months, lags from ProductHistory.lags'''
+    return lags.any(axis=1).astype(np.float64)
+
+
+def new_products(products, lags):
+    '''bool (n, n_products) of products owned now and not in the previous month'''
+    return np.asarray(products) > lags[:, 0]
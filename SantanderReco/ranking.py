@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+from itertools import zip_longest
+
+
+def ownership_matrix(ids, owner_ids, owned):
+    '''
+    Bool matrix (len(ids), n_products) of the products each customer already has.
+    owner_ids: ncodpers of the rows of owned (last record of every customer)
+    owned: (len(owner_ids), n_products) 0/1 array; customers not in owner_ids own nothing
+    '''
+    owned = np.asarray(owned) == 1
+    rows = pd.Index(owner_ids).get_indexer(ids)
+    out = np.zeros((len(rows), owned.shape[1]), dtype=bool)
+    out[rows >= 0] = owned[rows[rows >= 0]]
+    return out
+
+
+def top_k(preds, k=7, owned=None):
+    '''
+    Column indices of the k highest scores of every row, best first.
+    owned: bool matrix of the preds shape, these products are never recommended
+    returns (top, valid); valid is False where a row has fewer than k products left
+    '''
+    scores = np.array(preds, dtype=np.float64)
+    if owned is not None:
+        scores[owned] = -np.inf
+    k = min(k, scores.shape[1])
+    rows = np.arange(len(scores))[:, None]
+    # a stable sort of the few product columns: equal scores keep the product order
+    top = np.argsort(-scores, axis=1, kind='mergesort')[:, :k]
+    return top, np.isfinite(scores[rows, top])
+
+
+def join_products(top, valid, names):
+    '''space-joined product names of every row of top, skipping the invalid entries'''
+    words = np.asarray(names, dtype=object)[top]
+    words[~valid] = ''
+    out = words[:, 0].copy() if top.shape[1] else np.full(len(top), '', dtype=object)
+    for j in range(1, top.shape[1]):
+        out = np.where(valid[:, j], out + ' ' + words[:, j], out)
+    return out
+
+
+def recommendations(preds, names, k=7, owned=None):
+    '''
+    Submission strings of the k best products per row of the probability matrix preds.
+    names: product names of the preds columns
+    owned: optional bool matrix of already owned products (see ownership_matrix)
+    '''
+    top, valid = top_k(preds, k, owned)
+    return join_products(top, valid, names)
+
+
+def _encode_products(values, vocabulary):
+    # (rows, max products) int codes of space separated product names, -1 pads shorter rows;
+    # submissions repeat the same lists a lot, so only the distinct strings are split
+    rows, uniques = pd.factorize(np.asarray(values, dtype=object))
+    lists = [[vocabulary.setdefault(p, len(vocabulary)) for p in u.split()] for u in uniques]
+    width = max([len(l) for l in lists] + [0])
+    codes = np.full((len(lists), width), -1, dtype=np.int64)
+    for i, l in enumerate(lists):
+        codes[i, :len(l)] = l
+    return codes[rows]
+
+
+def fuse_submissions(sub_files, weights, out_file, k=7, place_weights=(7., 6., 5., 4., 3., 2., 1.),
+                     chunksize=100000):
+    '''
+    Weighted rank fusion of submission files: a product at position i of a file gets
+    place_weights[i] * weight of the file, the k products with the highest sum are written.
+    The files are read together in chunks of rows, their ncodpers have to be the same and in
+    the same order. Equal sums keep the order in which products first appear in the files.
+    '''
+    if len(sub_files) != len(weights):
+        raise ValueError('one weight per submission file is needed')
+    place_weights = np.asarray(place_weights, dtype=np.float64)
+    readers = [pd.read_csv(f, dtype={'ncodpers': np.int64, 'added_products': object}, keep_default_na=False,
+                           chunksize=chunksize) for f in sub_files]
+    vocabulary = {}
+    names = []
+    header = True
+    for chunks in zip_longest(*readers):
+        if any(chunk is None for chunk in chunks):
+            raise ValueError('submission files have different numbers of rows')
+        ids = chunks[0]['ncodpers'].values
+        for chunk in chunks[1:]:
+            if not np.array_equal(chunk['ncodpers'].values, ids):
+                raise ValueError('ncodpers of the submission files differ')
+
+        codes = [_encode_products(chunk['added_products'], vocabulary) for chunk in chunks]
+        names.extend(sorted(vocabulary, key=vocabulary.get)[len(names):])
+        rows = np.arange(len(ids))
+        scores = np.zeros((len(ids), len(vocabulary)))
+        first_seen = np.full(scores.shape, np.iinfo(np.int64).max, dtype=np.int64)
+        seen = 0
+        for weight, code in zip(weights, codes):
+            if code.shape[1] > len(place_weights):
+                raise ValueError('submission has more products than place_weights')
+            for position in range(code.shape[1]):
+                has = code[:, position] >= 0
+                row, col = rows[has], code[has, position]
+                scores[row, col] += place_weights[position] * weight
+                first_seen[row, col] = np.minimum(first_seen[row, col], seen + position)
+            seen += code.shape[1]
+
+        top = np.lexsort((first_seen, -scores), axis=1)[:, :k]
+        valid = first_seen[rows[:, None], top] < np.iinfo(np.int64).max
+        out = pd.DataFrame({'ncodpers': ids, 'added_products': join_products(top, valid, names)})
+        out.to_csv(out_file, index=False, header=header, mode='w' if header else 'a')
+        header = False
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+from product_history import month_number, had_in_past, new_products
+
+MISSING = ['', 'NA']
+TRAIN_DATE = '2015-06-28'
+TEST_DATE = '2016-06-28'
+
+
+def read_months(in_file, months, columns, chunksize=500000):
+    '''
+    Read only the needed columns of train_ver2.csv / test_ver2.csv as raw strings, chunk by chunk,
+    and keep the rows whose fecha_dato is in months. Rows keep the file order.
+    in_file: file name or open file
+    columns: list of column names; columns missing in the file (targets in test) are skipped
+    '''
+    wanted = set(columns) | set(['fecha_dato', 'ncodpers'])
+    reader = pd.read_csv(in_file, dtype=object, usecols=lambda c: c in wanted,
+                         keep_default_na=False, na_filter=False, chunksize=chunksize)
+    for chunk in reader:
+        chunk = chunk[chunk['fecha_dato'].isin(months)]
+        if len(chunk):
+            yield chunk.reset_index(drop=True)
+
+
+def _by_unique(values, func):
+    # columns have few distinct strings, func gets the unique values only
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return np.asarray(func(list(uniques)))[codes]
+
+
+def _is_missing(values):
+    return _by_unique(values, lambda uniques: [v.strip() in MISSING for v in uniques])
+
+
+def _to_float(values, missing_value=np.nan):
+    return _by_unique(values, lambda uniques: np.array([missing_value if v.strip() in MISSING else float(v)
+                                                        for v in uniques], dtype=np.float64))
+
+
+def _round(values, digits):
+    # python round on the unique values, np.round may differ in the last digit
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return np.array([round(v, digits) for v in uniques.tolist()], dtype=np.float64)[inverse]
+
+
+def _clip_scale(values, missing_value, min_value, max_value, digits):
+    missing = _is_missing(values)
+    x = np.clip(_to_float(values), min_value, max_value)
+    x[missing] = missing_value
+    return _round((x - min_value) / (max_value - min_value), digits)
+
+
+def customer_ids(chunk):
+    return _by_unique(chunk['ncodpers'], lambda uniques: np.array([int(v) for v in uniques], dtype=np.int64))
+
+
+def encode_categorical(values, mapping):
+    '''
+    getIndex for a whole column: values are stripped, '' and 'NA' get mapping[-99].
+    Raises KeyError for values missing in mapping, like the dict lookup did.
+    '''
+    def lookup(uniques):
+        uniques = [v.strip() for v in uniques]
+        return np.array([mapping[-99] if v in MISSING else mapping[v] for v in uniques], dtype=np.int64)
+    return _by_unique(values, lookup)
+
+
+def encode_targets(chunk, target_cols):
+    '''getTarget for a whole chunk, int matrix of shape (rows, len(target_cols)); missing values are 0'''
+    out = np.zeros((len(chunk), len(target_cols)), dtype=np.int64)
+    for j, col in enumerate(target_cols):
+        out[:, j] = _to_float(chunk[col], 0.).astype(np.int64)
+    return out
+
+
+def scale_age(values):
+    '''getAge: missing -> 40, clipped to [20, 90] and scaled to [0, 1]'''
+    return _clip_scale(values, 40., 20., 90., 4)
+
+
+def scale_seniority(values):
+    '''getCustSeniority: missing -> 0, clipped to [0, 256] and scaled to [0, 1]'''
+    return _clip_scale(values, 0., 0., 256., 4)
+
+
+def scale_rent(renta, nomprov=None, renta_dict=None, missing_value=101850.):
+    '''
+    getRent: clipped to [0, 1500000] and scaled to [0, 1].
+    Missing renta is missing_value, or with renta_dict the mean income of the province
+    (renta_dict['UNKNOWN'] for a missing province; the province name is not stripped).
+    '''
+    min_value = 0.
+    max_value = 1500000.
+    missing = _is_missing(renta)
+    x = np.clip(_to_float(renta), min_value, max_value)
+    if renta_dict is None:
+        x[missing] = missing_value
+    else:
+        x[missing] = _by_unique(nomprov[missing], lambda uniques: np.array(
+            [renta_dict['UNKNOWN'] if v in MISSING else renta_dict[v] for v in uniques], dtype=np.float64))
+    return _round((x - min_value) / (max_value - min_value), 6)
+
+
+def marriage_index(age, sex, income):
+    '''getMarriageIndex for arrays of the values passed to it'''
+    modifier = np.zeros(len(age), dtype=np.int64)
+    modifier[np.asarray(sex, dtype=object) == 'V'] -= 2
+    modifier[np.asarray(income) <= 101850] -= 1
+    return (np.asarray(age) > 28 + modifier).astype(np.int64)
+
+
+def history_months(n_lags=5):
+    '''month numbers of the n_lags months before the training and the test month'''
+    return sorted(set(int(month - k) for month in month_number([TRAIN_DATE, TEST_DATE])
+                      for k in range(1, n_lags + 1)))
+
+
+def process_data(in_file, row_features, columns, target_cols, history, n_lags=5, chunksize=500000):
+    '''
+    Columnar processData: X and y for training (2015-06-28 rows) and X for predicting (2016-06-28 rows).
+    in_file: file name or open file
+    row_features: function(chunk) -> 2d array of the customer features of the rows
+    columns: columns used by row_features
+    history: ProductHistory, updated with the products of the kept months of the file
+    n_lags: number of previous months whose products are added, followed by the had in past flags
+    Rows are produced in file order and the rows of a customer with several new products are
+    repeated with each product as target.
+    '''
+    months = [TRAIN_DATE, TEST_DATE] + ['{:04d}-{:02d}-28'.format(m // 12, m % 12 + 1) for m in history.months]
+    parts = []
+    for chunk in read_months(in_file, months, list(columns) + list(target_cols), chunksize):
+        ids = customer_ids(chunk)
+        chunk_months = month_number(chunk['fecha_dato'])
+        targets = None
+        if all(col in chunk.columns for col in target_cols):
+            targets = encode_targets(chunk, target_cols)
+            history.update(ids, chunk_months, targets)
+
+        dates = chunk['fecha_dato'].values
+        rows = np.flatnonzero((dates == TRAIN_DATE) | (dates == TEST_DATE))
+        if len(rows):
+            train = dates[rows] == TRAIN_DATE
+            parts.append((row_features(chunk.iloc[rows]), ids[rows], chunk_months[rows], train,
+                          targets[rows[train]] if train.any() else None))
+
+    # lags are taken once the whole file is in the history
+    x_blocks, y_blocks = [], []
+    for x, ids, row_months, train, targets in parts:
+        lags = history.lags(ids, row_months, n_lags)
+        x = np.hstack([x, lags.reshape(len(ids), -1), had_in_past(lags)])
+        counts = (~train).astype(np.int64)
+        if train.any():
+            # one training row per newly added product
+            added = new_products(targets, lags[train])
+            counts[train] = added.sum(axis=1)
+            y_blocks.append(np.nonzero(added)[1])
+        x_blocks.append(x[np.repeat(np.arange(len(ids)), counts)])
+    if not x_blocks:
+        return np.zeros((0, 0)), np.zeros(0, dtype=np.int64)
+    return np.vstack(x_blocks), np.concatenate(y_blocks) if y_blocks else np.zeros(0, dtype=np.int64)
@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from scipy import sparse
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+
+
+def one_hot_layout(mapping_dict, columns):
+    '''first one-hot column of every categorical column and the total number of columns'''
+    offsets = []
+    feat_count = 0
+    for col in columns:
+        offsets.append(feat_count)
+        feat_count += max(mapping_dict[col].values()) + 1
+    return offsets, feat_count
+
+
+def _lookup(mapping, value):
+    if pd.isnull(value):
+        return mapping[-99]
+    if value in mapping:
+        return mapping[value]
+    text = str(value).strip()
+    if text in ('', 'NA'):
+        return mapping[-99]
+    try:
+        # numbers read as text ('1.0' for the key 1.0)
+        return mapping[float(text)]
+    except (ValueError, KeyError):
+        return mapping[text]
+
+
+def _cache_meta(file_name, columns, mapping_dict, target_cols, nrows):
+    # everything the encoded matrix depends on; mapping keys mix numbers and strings, so the
+    # mappings are compared through a hash of their sorted repr
+    mappings = [(col, sorted((repr(k), v) for k, v in mapping_dict[col].items())) for col in columns]
+    return json.dumps({'source': {'path': os.path.abspath(file_name), 'mtime': os.path.getmtime(file_name),
+                                  'size': os.path.getsize(file_name)},
+                       'columns': list(columns), 'target_cols': list(target_cols or []), 'nrows': nrows,
+                       'mapping': hashlib.sha1(repr(mappings).encode('utf8')).hexdigest()}, sort_keys=True)
+
+
+def encode_file(file_name, columns, mapping_dict, target_cols=None, nrows=None, chunksize=500000, cache_file=None):
+    '''
+    Read the csv once and one-hot encode the categorical columns with mapping_dict.
+    Every value is mapped through mapping_dict (missing -> -99) and the distinct values of a chunk
+    are looked up only once.
+    returns (X, y); X: float32 CSR (rows, feat_count), y: float32 targets (missing -> 0) or None
+    cache_file: .npz file; loaded when it was written for the same csv (size / mtime), columns,
+    mappings, target_cols and nrows, written otherwise
+    '''
+    meta = _cache_meta(file_name, columns, mapping_dict, target_cols, nrows)
+    if cache_file is not None and os.path.exists(cache_file):
+        with np.load(cache_file) as data:
+            if 'meta' in data.files and str(data['meta']) == meta:
+                X = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+                return X, (data['y'] if 'y' in data.files else None)
+        print('{} is out of date, encoding {} again'.format(cache_file, file_name))
+
+    offsets, feat_count = one_hot_layout(mapping_dict, columns)
+    usecols = list(columns) + list(target_cols or [])
+    codes, targets = [], []
+    reader = pd.read_csv(file_name, usecols=usecols, dtype=dict((col, object) for col in columns),
+                         nrows=nrows, chunksize=chunksize)
+    for chunk in reader:
+        chunk_codes = np.empty((len(chunk), len(columns)), dtype=np.int32)
+        for j, col in enumerate(columns):
+            values, uniques = pd.factorize(chunk[col].fillna(-99).values)
+            lookup = np.array([_lookup(mapping_dict[col], v) for v in uniques], dtype=np.int32)
+            chunk_codes[:, j] = lookup[values] + offsets[j]
+        codes.append(chunk_codes)
+        if target_cols:
+            targets.append(chunk[list(target_cols)].fillna(0).values.astype(np.float32))
+
+    codes = np.vstack(codes) if codes else np.zeros((0, len(columns)), dtype=np.int32)
+    n = len(codes)
+    # exactly one active column per categorical column
+    X = sparse.csr_matrix((np.ones(codes.size, dtype=np.float32), codes.ravel(),
+                           np.arange(0, codes.size + 1, len(columns))), shape=(n, feat_count))
+    y = np.vstack(targets) if target_cols else None
+    if cache_file is not None:
+        arrays = dict(data=X.data, indices=X.indices, indptr=X.indptr, shape=np.array(X.shape),
+                      meta=np.array(meta))
+        if y is not None:
+            arrays['y'] = y
+        np.savez(cache_file, **arrays)
+    return X, y
+
+
+def _batches(X, y, batch_size, shuffle, rng):
+    n = X.shape[0]
+    while True:
+        index = rng.permutation(n) if shuffle else np.arange(n)
+        for start in range(0, n, batch_size):
+            rows = index[start:start + batch_size]
+            batch_X = X[rows].toarray()
+            if y is None:
+                yield batch_X
+            else:
+                yield batch_X, y[rows]
+
+
+def _prefetch(batches, size):
+    # the producer starts with the first batch and stops when this generator is closed or
+    # garbage collected; its puts are timed so it sees stop even with a full queue
+    queue = Queue(maxsize=size)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for batch in batches:
+                while True:
+                    if stop.is_set():
+                        return
+                    try:
+                        queue.put((batch, None), timeout=0.1)
+                        break
+                    except Full:
+                        pass
+        except Exception as e:
+            queue.put((None, e))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            batch, error = queue.get()
+            if error is not None:
+                raise error
+            yield batch
+    finally:
+        stop.set()
+
+
+def batch_generator(X, y=None, batch_size=500, shuffle=False, prefetch=0, seed=None):
+    '''
+    Endless generator of dense mini-batches of the CSR matrix X (and y) for keras fit_generator
+    and predict_generator; with shuffle the rows are permuted again every epoch.
+    The last batch of an epoch has the remaining rows, so one epoch gives X.shape[0] rows.
+    prefetch: number of batches prepared ahead on a background thread, 0 for none
+    '''
+    batches = _batches(X, y, batch_size, shuffle, np.random.RandomState(seed))
+    if prefetch:
+        return _prefetch(batches, prefetch)
+    return batches
@@ -8,100 +8,22 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 from sklearn.preprocessing import LabelEncoder
-from scipy.sparse import csr_matrix, hstack
 from sklearn.linear_model import LogisticRegression
-from sklearn.cross_validation import StratifiedKFold
-from sklearn.metrics import log_loss
+from sparse_features import device_features
+from cv_path import score_path
 
 datadir = 'data'
 gatrain = pd.read_csv(os.path.join(datadir,'gender_age_train.csv'),
                       index_col='device_id')
 gatest = pd.read_csv(os.path.join(datadir,'gender_age_test.csv'),
                      index_col = 'device_id')
-phone = pd.read_csv(os.path.join(datadir,'phone_brand_device_model.csv'))
-# Get rid of duplicate device ids in phone
-phone = phone.drop_duplicates('device_id',keep='first').set_index('device_id')
-events = pd.read_csv(os.path.join(datadir,'events.csv'),
-                     parse_dates=['timestamp'], index_col='event_id')
-appevents = pd.read_csv(os.path.join(datadir,'app_events.csv'), 
-                        usecols=['event_id','app_id','is_active'],
-                        dtype={'is_active':bool})
-applabels = pd.read_csv(os.path.join(datadir,'app_labels.csv'))
 
 
-gatrain['trainrow'] = np.arange(gatrain.shape[0])
-gatest['testrow'] = np.arange(gatest.shape[0])
-
-brandencoder = LabelEncoder().fit(phone.phone_brand)
-phone['brand'] = brandencoder.transform(phone['phone_brand'])
-# stotozni sa podla indexu automaticky
-gatrain['brand'] = phone['brand']
-gatest['brand'] = phone['brand']
-# create sparse matrix : csr_matrix((data, (row_ind, col_ind))
-Xtr_brand = csr_matrix((np.ones(gatrain.shape[0]), 
-                       (gatrain.trainrow, gatrain.brand)))
-Xte_brand = csr_matrix((np.ones(gatest.shape[0]), 
-                       (gatest.testrow, gatest.brand)))
-print('Brand features: train shape {}, test shape {}'.format(Xtr_brand.shape, Xte_brand.shape))
-
-# model telefonu
-m = phone.phone_brand.str.cat(phone.device_model)
-modelencoder = LabelEncoder().fit(m)
-phone['model'] = modelencoder.transform(m)
-gatrain['model'] = phone['model']
-gatest['model'] = phone['model']
-Xtr_model = csr_matrix((np.ones(gatrain.shape[0]), 
-                       (gatrain.trainrow, gatrain.model)))
-Xte_model = csr_matrix((np.ones(gatest.shape[0]), 
-                       (gatest.testrow, gatest.model)))
-print('Model features: train shape {}, test shape {}'.format(Xtr_model.shape, Xte_model.shape))
-
-
-
-appencoder = LabelEncoder().fit(appevents.app_id)
-appevents['app'] = appencoder.transform(appevents.app_id)
-napps = len(appencoder.classes_)
-deviceapps = (appevents.merge(events[['device_id']], how='left',left_on='event_id',right_index=True)
-                       .groupby(['device_id','app'])['app'].agg(['size'])
-                       .merge(gatrain[['trainrow']], how='left', left_index=True, right_index=True)
-                       .merge(gatest[['testrow']], how='left', left_index=True, right_index=True)
-                       .reset_index())
-
-
-
-d = deviceapps.dropna(subset=['trainrow'])
-Xtr_app = csr_matrix((np.ones(d.shape[0]), (d.trainrow, d.app)), 
-                      shape=(gatrain.shape[0],napps))
-d = deviceapps.dropna(subset=['testrow'])
-Xte_app = csr_matrix((np.ones(d.shape[0]), (d.testrow, d.app)), 
-                      shape=(gatest.shape[0],napps))
-print('Apps data: train shape {}, test shape {}'.format(Xtr_app.shape, Xte_app.shape))
-
-applabels = applabels.loc[applabels.app_id.isin(appevents.app_id.unique())]
-applabels['app'] = appencoder.transform(applabels.app_id)
-labelencoder = LabelEncoder().fit(applabels.label_id)
-applabels['label'] = labelencoder.transform(applabels.label_id)
-nlabels = len(labelencoder.classes_)
-
-
-devicelabels = (deviceapps[['device_id','app']]
-                .merge(applabels[['app','label']])
-                .groupby(['device_id','label'])['app'].agg(['size'])
-                .merge(gatrain[['trainrow']], how='left', left_index=True, right_index=True)
-                .merge(gatest[['testrow']], how='left', left_index=True, right_index=True)
-                .reset_index())
-
-
-d = devicelabels.dropna(subset=['trainrow'])
-Xtr_label = csr_matrix((np.ones(d.shape[0]), (d.trainrow, d.label)), 
-                      shape=(gatrain.shape[0],nlabels))
-d = devicelabels.dropna(subset=['testrow'])
-Xte_label = csr_matrix((np.ones(d.shape[0]), (d.testrow, d.label)), 
-                      shape=(gatest.shape[0],nlabels))
-print('Labels data: train shape {}, test shape {}'.format(Xtr_label.shape, Xte_label.shape))
-
-Xtrain = hstack((Xtr_brand, Xtr_model, Xtr_app, Xtr_label), format='csr')
-Xtest =  hstack((Xte_brand, Xte_model, Xte_app, Xte_label), format='csr')
+# brand, model, bag of apps and bag of app labels; train devices first, then test devices
+X, columns = device_features(datadir, np.concatenate([gatrain.index.values, gatest.index.values]),
+                             cache_file=os.path.join(datadir, 'features_label_id.npz'))
+Xtrain = X[:gatrain.shape[0]]
+Xtest = X[gatrain.shape[0]:]
 print('All features: train shape {}, test shape {}'.format(Xtrain.shape, Xtest.shape))
 
 # cross validation
@@ -109,24 +31,16 @@ targetencoder = LabelEncoder().fit(gatrain.group)
 y = targetencoder.transform(gatrain.group)
 nclasses = len(targetencoder.classes_)
 
-def score(clf, random_state = 0):
-    kf = StratifiedKFold(y, n_folds=5, shuffle=True, random_state=random_state)
-    pred = np.zeros((y.shape[0],nclasses))
-    for itrain, itest in kf:
-        Xtr, Xte = Xtrain[itrain, :], Xtrain[itest, :]
-        ytr, yte = y[itrain], y[itest]
-        clf.fit(Xtr, ytr)
-        pred[itest,:] = clf.predict_proba(Xte)
-        # Downsize to one fold only for kernels
-#        return log_loss(yte, pred[itest, :])
-        print("{:.5f}".format(log_loss(yte, pred[itest,:])), end=' ')
-    print('')
-    return log_loss(y, pred)
+def score(clf, Cs=None, random_state = 0):
+    # 5 folds in parallel processes, warm-started along Cs (default: the C of clf)
+    Cs = [clf.C] if Cs is None else Cs
+    losses, fold_losses, fold_times = score_path(clf, Xtrain, y, Cs, n_folds=5, random_state=random_state)
+    for C, l, t in zip(Cs, fold_losses.T, fold_times.T):
+        print('C={:g} '.format(C) + ' '.join('{:.5f}'.format(v) for v in l) + ' ({:.1f}s per fold)'.format(t.mean()))
+    return losses
 
 Cs = np.logspace(-3,0,4)
-res = []
-for C in Cs:
-    res.append(score(LogisticRegression(C = C)))
+res = score(LogisticRegression(), Cs)
 plt.semilogx(Cs, res,'-o')
 
 # By default LogisticRegression classifier solves a multiclass 
@@ -134,7 +48,7 @@ plt.semilogx(Cs, res,'-o')
 #possible to fit a multinomial model that optimizes the multiclass 
 #logloss - exactly the metric we're evaluated on. Let's see if doing 
 #that improves our results:
-print(score(LogisticRegression(C=0.02, multi_class='multinomial',solver='lbfgs')))
+print(score(LogisticRegression(C=0.02, multi_class='multinomial',solver='lbfgs'))[0])
 
 clf = LogisticRegression(C=0.02, multi_class='multinomial',solver='lbfgs')
 clf.fit(Xtrain, y)
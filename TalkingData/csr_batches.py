@@ -0,0 +1,121 @@
+import threading
+from collections import deque
+import numpy as np
+from scipy import sparse
+try:
+    from queue import Queue, Empty, Full
+except ImportError:
+    from Queue import Queue, Empty, Full
+
+
+def fill_rows(X, rows, out, clear=None):
+    '''
+    Dense copy of the rows of the CSR matrix X into out[:len(rows)], gathered from the CSR arrays.
+    clear: flat positions in out set by the previous call, only these are zeroed (all of out when None)
+    returns (batch, flat positions set in out)
+    '''
+    flat = out.reshape(-1)
+    if clear is None:
+        flat.fill(0)
+    else:
+        flat[clear] = 0
+    starts = X.indptr[rows]
+    lengths = X.indptr[rows + 1] - starts
+    # positions of the stored values of every row, row after row
+    offsets = np.cumsum(lengths) - lengths
+    pos = np.arange(lengths.sum()) + np.repeat(starts - offsets, lengths)
+    written = np.repeat(np.arange(len(rows)) * out.shape[1], lengths) + X.indices[pos]
+    flat[written] = X.data[pos]
+    return out[:len(rows)], written
+
+
+# after chenglong's fit_generator code for sparse matrices
+# (https://www.kaggle.com/c/talkingdata-mobile-user-demographics/forums/t/22567/neural-network-for-sparse-matrices)
+def _batch_rows(n, batch_size, shuffle, rng):
+    while True:
+        index = rng.permutation(n) if shuffle else np.arange(n)
+        for start in range(0, n, batch_size):
+            yield index[start:start + batch_size]
+
+
+def batch_generator(X, y=None, batch_size=400, shuffle=False, prefetch=4, keep=10, seed=None):
+    '''
+    Endless generator of dense float32 mini-batches of the CSR matrix X (and y) for keras
+    fit_generator and predict_generator; with shuffle the rows are permuted again every epoch.
+    The last batch of an epoch has the remaining rows, so predict_generator with
+    val_samples=X.shape[0] gives exactly one prediction per row.
+    Batches are views of prefetch + keep + 2 preallocated buffers, which are reused once the
+    consumer has taken keep more batches; keep must be at least the max_q_size given to keras.
+    prefetch: number of batches filled ahead on a background thread, 0 for none. The thread starts
+    with the first batch and stops when the generator is closed or garbage collected.
+    '''
+    X = sparse.csr_matrix(X)
+    if X.shape[0] == 0:
+        raise ValueError('X has no rows')
+    X.sum_duplicates()
+    rng = np.random.RandomState(seed)
+    n_buffers = prefetch + keep + 2
+    buffers = [np.zeros((min(batch_size, X.shape[0]), X.shape[1]), dtype=np.float32) for _ in range(n_buffers)]
+    written = [np.zeros(0, dtype=np.int64)] * n_buffers
+    free = Queue()
+    for i in range(n_buffers):
+        free.put(i)
+    stop = threading.Event()
+
+    def fill(rows):
+        i = free.get()
+        written[i] = fill_rows(X, rows, buffers[i], written[i])[1]
+        return i, len(rows), (None if y is None else y[rows])
+
+    def produce(ready):
+        # both queues are polled, so the thread ends soon after stop is set
+        try:
+            for rows in _batch_rows(X.shape[0], batch_size, shuffle, rng):
+                while True:
+                    if stop.is_set():
+                        return
+                    try:
+                        i = free.get(timeout=0.1)
+                        break
+                    except Empty:
+                        pass
+                free.put(i)
+                item = (fill(rows), None)
+                while not stop.is_set():
+                    try:
+                        ready.put(item, timeout=0.1)
+                        break
+                    except Full:
+                        pass
+        except Exception as e:
+            ready.put((None, e))
+
+    def batches():
+        used = deque()
+        if prefetch:
+            ready = Queue(maxsize=prefetch)
+            thread = threading.Thread(target=produce, args=(ready,))
+            thread.daemon = True
+            thread.start()
+        else:
+            rows = _batch_rows(X.shape[0], batch_size, shuffle, rng)
+        try:
+            while True:
+                if prefetch:
+                    batch, error = ready.get()
+                    if error is not None:
+                        raise error
+                else:
+                    batch = fill(next(rows))
+                i, n, batch_y = batch
+                used.append(i)
+                if len(used) > keep + 1:
+                    free.put(used.popleft())
+                if batch_y is None:
+                    yield buffers[i][:n]
+                else:
+                    yield buffers[i][:n], batch_y
+        finally:
+            stop.set()
+
+    return batches()
@@ -0,0 +1,94 @@
+import os
+import time
+import shutil
+import tempfile
+import multiprocessing
+import numpy as np
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.metrics import log_loss
+
+# the matrix of the worker processes, memory-mapped from the files written by _share
+_X = None
+
+
+def stratified_folds(y, n_folds=5, random_state=0):
+    '''list of (train rows, test rows) of a shuffled stratified k-fold split'''
+    try:
+        from sklearn.model_selection import StratifiedKFold
+        kf = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+        return list(kf.split(np.zeros(len(y)), y))
+    except ImportError:
+        from sklearn.cross_validation import StratifiedKFold
+        return list(StratifiedKFold(y, n_folds=n_folds, shuffle=True, random_state=random_state))
+
+
+def _share(X, folder):
+    # the CSR arrays go to .npy files (in /dev/shm when there is one) that every worker maps
+    X = sparse.csr_matrix(X)
+    for name in ('data', 'indices', 'indptr'):
+        np.save(os.path.join(folder, name + '.npy'), getattr(X, name))
+    return X.shape
+
+
+def _load(folder, shape):
+    global _X
+    arrays = [np.load(os.path.join(folder, name + '.npy'), mmap_mode='r') for name in ('data', 'indices', 'indptr')]
+    _X = sparse.csr_matrix(tuple(arrays), shape=shape, copy=False)
+
+
+def _fit_fold(task):
+    clf, Cs, warm_start, y, itrain, itest = task
+    Xtr, Xte = _X[itrain, :], _X[itest, :]
+    clf = clone(clf)
+    preds, times = [], []
+    for C in Cs:
+        start = time.time()
+        clf.set_params(C=C, warm_start=warm_start)
+        clf.fit(Xtr, y[itrain])
+        preds.append(clf.predict_proba(Xte))
+        times.append(time.time() - start)
+    return np.array(preds), np.array(times)
+
+
+def score_path(clf, X, y, Cs, n_folds=5, n_jobs=None, random_state=0, warm_start=True):
+    '''
+    Stratified k-fold log loss of clf for every regularization strength of Cs.
+    The folds run in n_jobs processes (default: one per fold, at most the number of cpus), which
+    share X through memory-mapped files. Every fold fits the Cs from the smallest to the largest;
+    with warm_start each fit starts from the coefficients of the previous C (solvers other than
+    liblinear). Where processes are spawned (Windows) the calling script needs a __main__ guard.
+    returns (losses, fold_losses, fold_times): log loss of the out-of-fold predictions for every C,
+    and (n_folds, len(Cs)) arrays of the log loss and the fit + predict seconds of every fold and C
+    '''
+    y = np.asarray(y)
+    Cs = np.asarray(Cs, dtype=np.float64)
+    order = np.argsort(Cs)
+    folds = stratified_folds(y, n_folds, random_state)
+    if n_jobs is None:
+        n_jobs = min(len(folds), multiprocessing.cpu_count())
+
+    folder = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    try:
+        shape = _share(X, folder)
+        tasks = [(clf, Cs[order], warm_start, y, itrain, itest) for itrain, itest in folds]
+        pool = multiprocessing.Pool(n_jobs, initializer=_load, initargs=(folder, shape))
+        try:
+            results = pool.map(_fit_fold, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        shutil.rmtree(folder)
+
+    pred = None
+    fold_losses = np.zeros((len(folds), len(Cs)))
+    fold_times = np.zeros((len(folds), len(Cs)))
+    for k, ((itrain, itest), (preds, times)) in enumerate(zip(folds, results)):
+        if pred is None:
+            pred = np.zeros((len(Cs), len(y), preds.shape[2]))
+        pred[order[:, None], itest] = preds
+        fold_times[k, order] = times
+        fold_losses[k, order] = [log_loss(y[itest], p) for p in preds]
+    losses = np.array([log_loss(y, p) for p in pred])
+    return losses, fold_losses, fold_times
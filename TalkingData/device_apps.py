@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+
+def unique_pairs(rows, cols, n_cols, return_counts=False):
+    '''distinct (row, col) pairs of two code arrays sorted by row and col (and their numbers of occurrences)'''
+    keys = np.asarray(rows, dtype=np.int64) * n_cols + np.asarray(cols, dtype=np.int64)
+    if return_counts:
+        keys, counts = np.unique(keys, return_counts=True)
+        return keys // n_cols, keys % n_cols, counts
+    keys = np.unique(keys)
+    return keys // n_cols, keys % n_cols
+
+
+def event_device_apps(app_events, events, return_counts=False):
+    '''
+    Distinct (device, app) pairs of the apps seen in the events of every device.
+    app_events: DataFrame with event_id, app_id; events: DataFrame with event_id, device_id
+    App events are joined to their event through a hash index on event_id, app events of
+    unknown events are dropped.
+    returns (device_codes, app_codes, devices, apps); the codes index the devices / apps arrays
+    return_counts: also return the number of app events of every pair
+    '''
+    rows = pd.Index(events['event_id'].values).get_indexer(app_events['event_id'].values)
+    found = rows >= 0
+    event_devices, devices = pd.factorize(events['device_id'].values)
+    app_codes, apps = pd.factorize(app_events['app_id'].values[found])
+    pairs = unique_pairs(event_devices[rows[found]], app_codes, len(apps), return_counts)
+    return pairs[:2] + (np.asarray(devices, dtype=object), np.asarray(apps)) + pairs[2:]
+
+
+def device_labels(device_codes, app_codes, apps, app_labels, label_col='label_id', missing_label=None,
+                  return_counts=False):
+    '''
+    Distinct (device, label) pairs of the labels of the apps of every device.
+    device_codes, app_codes, apps: output of event_device_apps
+    app_labels: DataFrame with app_id and label_col; rows with a missing label are ignored
+    missing_label: label given to apps without any label, None to skip them
+    returns (device_codes, label_codes, labels)
+    return_counts: also return the number of apps of the device with every label
+    '''
+    label_apps = pd.Index(apps).get_indexer(app_labels['app_id'].values)
+    label_codes, labels = pd.factorize(app_labels[label_col].values)
+    keep = (label_apps >= 0) & (label_codes >= 0)
+    labels = list(labels)
+    if missing_label is not None:
+        labels.append(missing_label)
+    label_apps, label_codes = unique_pairs(label_apps[keep], label_codes[keep], len(labels))
+
+    # labels of every app as a CSR-like layout: app -> label_codes[starts[app]:starts[app + 1]]
+    counts = np.bincount(label_apps, minlength=len(apps))
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    pair_counts = counts[app_codes]
+    if missing_label is not None:
+        pair_counts = np.maximum(pair_counts, 1)
+    pair_index = np.repeat(np.arange(len(app_codes)), pair_counts)
+    # position of every output row inside the labels of its app
+    offsets = np.arange(len(pair_index)) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    pair_apps = app_codes[pair_index]
+    has_label = counts[pair_apps] > 0
+    out_labels = np.full(len(pair_index), len(labels) - 1, dtype=np.int64)
+    out_labels[has_label] = label_codes[starts[pair_apps[has_label]] + offsets[has_label]]
+    pairs = unique_pairs(device_codes[pair_index], out_labels, len(labels), return_counts)
+    return pairs[:2] + (np.asarray(labels, dtype=object),) + pairs[2:]
@@ -0,0 +1,154 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from device_apps import event_device_apps, device_labels
+
+WEIGHTINGS = (None, 'count', 'log', 'tfidf')
+SOURCES = ('phone_brand_device_model.csv', 'events.csv', 'app_events.csv', 'app_labels.csv',
+           'label_categories.csv')
+
+
+class FeatureAssembler(object):
+    '''
+    Sparse (device, feature) matrix put together from blocks of features keyed by device_id.
+    device_ids: the row order of the matrix, e.g. the train devices followed by the test devices;
+    devices of a source that are not in device_ids are ignored
+    '''
+
+    def __init__(self, device_ids):
+        self.device_ids = pd.Index(device_ids)
+        if not self.device_ids.is_unique:
+            raise ValueError('device_ids are not unique')
+        self.blocks = []
+        self.columns = []
+
+    def _rows(self, device_ids):
+        # sources repeat devices a lot, so only the distinct ones are looked up
+        codes, uniques = pd.factorize(device_ids)
+        rows = np.append(self.device_ids.get_indexer(uniques), -1)
+        return rows[codes]
+
+    def add_categorical(self, name, device_ids, values):
+        '''one-hot block of a column with (at most) one value per device, e.g. the phone brand'''
+        return self.add_bag(name, device_ids, values)
+
+    def add_bag(self, name, device_ids, items, counts=None, weighting=None):
+        '''
+        Bag-of-items block, one column per distinct item named name:item, sorted by item (by the
+        category order for a pd.Categorical).
+        device_ids, items: one (device, item) pair per row, missing items are skipped; repeated
+        pairs add up. A pd.Categorical of codes saves building the item values.
+        counts: number of occurrences of every pair, default 1
+        weighting: None -> 0/1, 'count', 'log' -> log(1 + count),
+        'tfidf' -> count * (log((1 + n_rows) / (1 + document frequency)) + 1), rows scaled to unit norm
+        '''
+        if weighting not in WEIGHTINGS:
+            raise ValueError('unknown weighting {}'.format(weighting))
+        rows = self._rows(device_ids)
+        cols, names = pd.factorize(items, sort=True)
+        counts = np.ones(len(rows)) if counts is None else np.asarray(counts, dtype=np.float64)
+        keep = (rows >= 0) & (cols >= 0)
+        block = sparse.csr_matrix((counts[keep], (rows[keep], cols[keep])),
+                                  shape=(len(self.device_ids), len(names)))
+        block.sum_duplicates()
+        if weighting is None:
+            block.data[:] = 1
+        elif weighting == 'log':
+            block.data = np.log1p(block.data)
+        elif weighting == 'tfidf':
+            df = np.bincount(block.indices, minlength=block.shape[1])
+            idf = np.log((1. + block.shape[0]) / (1. + df)) + 1
+            block.data *= idf[block.indices]
+            norms = np.sqrt(np.asarray(block.multiply(block).sum(axis=1)).ravel())
+            norms[norms == 0] = 1
+            block.data /= np.repeat(norms, np.diff(block.indptr))
+        self.blocks.append(block)
+        self.columns.extend('{}:{}'.format(name, v) for v in names)
+        return block
+
+    def matrix(self):
+        '''all blocks side by side as one float64 CSR matrix'''
+        if not self.blocks:
+            return sparse.csr_matrix((len(self.device_ids), 0))
+        return sparse.hstack(self.blocks, format='csr')
+
+
+def save_features(cache_file, X, device_ids, columns, meta=None):
+    '''meta: json-able description of how X was built, returned as is by load_features'''
+    device_ids = np.asarray(device_ids)
+    if device_ids.dtype == object:
+        device_ids = device_ids.astype(str)
+    np.savez(cache_file, data=X.data, indices=X.indices, indptr=X.indptr, shape=np.array(X.shape),
+             device_ids=device_ids, columns=np.asarray(columns, dtype=str),
+             meta=np.array(json.dumps(meta, sort_keys=True)))
+
+
+def load_features(cache_file):
+    '''(X, device_ids, columns, meta) written by save_features'''
+    with np.load(cache_file) as data:
+        X = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+        meta = json.loads(str(data['meta'])) if 'meta' in data.files else None
+        return X, pd.Index(data['device_ids']), list(data['columns']), meta
+
+
+def _sources(datadir):
+    # size / mtime of the input csv files, a changed file means other features
+    sources = {}
+    for name in SOURCES:
+        path = os.path.join(datadir, name)
+        if os.path.exists(path):
+            sources[name] = {'mtime': os.path.getmtime(path), 'size': os.path.getsize(path)}
+    return sources
+
+
+def device_features(datadir, device_ids, label_col='label_id', missing_label=None, app_weighting=None,
+                    label_weighting=None, cache_file=None):
+    '''
+    Phone brand, phone model (brand + model), bag of apps and bag of app labels of device_ids.
+    label_col: 'label_id' or 'category' (labels named through label_categories.csv)
+    missing_label: label of the apps without a label, None for no label
+    app_weighting, label_weighting: see FeatureAssembler.add_bag; apps are counted by app
+    events, labels by apps
+    cache_file: .npz file; loaded when it exists and was built from the same device_ids, options
+    and input files, written otherwise
+    returns (X, columns): CSR matrix with one row per device of device_ids and the column names
+    '''
+    device_ids = pd.Index(device_ids)
+    meta = {'options': {'label_col': label_col, 'missing_label': missing_label,
+                        'app_weighting': app_weighting, 'label_weighting': label_weighting},
+            'sources': _sources(datadir)}
+    if cache_file is not None and os.path.exists(cache_file):
+        X, cached_ids, columns, cached_meta = load_features(cache_file)
+        if cached_meta == meta and cached_ids.equals(device_ids):
+            return X, columns
+        print('{} is out of date, building the features again'.format(cache_file))
+
+    features = FeatureAssembler(device_ids)
+    phone = pd.read_csv(os.path.join(datadir, 'phone_brand_device_model.csv'))
+    phone = phone.drop_duplicates('device_id', keep='first')
+    features.add_categorical('phone_brand', phone['device_id'].values, phone['phone_brand'].values)
+    features.add_categorical('device_model', phone['device_id'].values,
+                             (phone['phone_brand'] + ' ' + phone['device_model']).values)
+
+    events = pd.read_csv(os.path.join(datadir, 'events.csv'), usecols=['event_id', 'device_id'])
+    app_events = pd.read_csv(os.path.join(datadir, 'app_events.csv'), usecols=['event_id', 'app_id'])
+    app_devices, app_codes, devices, apps, app_counts = event_device_apps(app_events, events, return_counts=True)
+    del events, app_events
+    features.add_bag('app_id', pd.Categorical.from_codes(app_devices, devices),
+                     pd.Categorical.from_codes(app_codes, apps), app_counts, app_weighting)
+
+    app_labels = pd.read_csv(os.path.join(datadir, 'app_labels.csv'))
+    if label_col != 'label_id':
+        label_cat = pd.read_csv(os.path.join(datadir, 'label_categories.csv'))
+        app_labels = app_labels.merge(label_cat[['label_id', label_col]], on='label_id', how='left')
+    label_devices, label_codes, labels, label_counts = device_labels(
+        app_devices, app_codes, apps, app_labels, label_col, missing_label, return_counts=True)
+    features.add_bag(label_col, pd.Categorical.from_codes(label_devices, devices),
+                     pd.Categorical.from_codes(label_codes, labels), label_counts, label_weighting)
+
+    X = features.matrix()
+    if cache_file is not None:
+        save_features(cache_file, X, device_ids, features.columns, meta)
+    return X, features.columns
@@ -7,6 +7,11 @@ from itertools import product
 from sklearn.model_selection import StratifiedKFold
 import datetime as dt
 import random
+from collections import OrderedDict
+import sys
+sys.path.append('..')
+from count_features import add_future_count, add_future_count_groupedby, add_group_stats
+from listing_loader import load_listings
 
 
 def add_features(df):
@@ -296,121 +301,6 @@ def add_feature_groupby_managerlevel(target_col, train_df, test_df, n_folds=5, e
     return train_df, test_df
 
 
-def add_stats_for_manager(variable, train_df, test_df, count=False):
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-    grouped = df.groupby('manager_id')[variable]
-    # ind2exclude = grouped.filter(lambda x: len(x) < excl_shorter).index
-    # train_df.loc[ind2exclude, new_features] = np.nan
-    if count:
-        functions = ['sum', 'mean', 'count', 'median']
-    else:
-        functions = ['sum', 'mean', 'median']
-    for function in functions:
-        col_name = 'man_{}_{}'.format(variable, function)
-        df[col_name] = grouped.transform(function)
-
-    new_features = [ 'man_{}_{}'.format(variable, j) for j in functions]
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
-    return train_df, test_df
-
-
-
-def add_future_count(train_df, test_df, days_list, positive=True):
-    '''
-    days_list: list of integers; integer represents number of days from current day to the future for calculating
-                    the count.
-                    i.e. [1,8,...]      1 - calculate count for current day only,  
-                                        8 - calculate count for current day with next 7 days
-                    i.e. [0,-1,..]      0 - from yesterday and today (incl)
-                                        -1 from day before yesterday to today (incl)
-    positive: bool; for positive values are incomplete days replaced by means (for negative not yet)
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-    df['created'] = pd.to_datetime(df["created"])
-    ref_days = df.groupby(df['created'].dt.date)['created'].count()
-    new_features = [ 'future_count_{}'.format(i) for i in days_list ]
-
-    def get_count(row, n_days=1):
-        curr_date = row.date()
-        last_date = curr_date + dt.timedelta(days=n_days-1)
-        count = ref_days[curr_date:last_date].sum()
-        return count
-
-    for n_days in days_list:
-        new_feature = 'future_count_{}'.format(n_days)
-        df[new_feature] = df['created'].apply(get_count, n_days=n_days)
-
-        # replace last incomplete dates with means
-        if positive:
-            last_date = df['created'].max().date()
-            first_bad_date = last_date - dt.timedelta(days=n_days-2)
-            last_good_day = last_date - dt.timedelta(days=n_days-1)
-            mask = (df['created'] > first_bad_date) & (df['created'] < last_date+dt.timedelta(days=1))
-            df.loc[mask, new_feature] = df[new_feature].mean()
-
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
-    print('nans in train: ', train_df[new_features].isnull().any().any())
-    print('nans in test: ', test_df[new_features].isnull().any().any())
-    return train_df, test_df
-
-
-def add_future_count_groupedby(by, train_df, test_df, days_list, positive=True, price_mode=False):
-    '''
-    the same as add_future_count, but grouped by column.
-    by: str; column name for groupby function
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test]).reset_index(drop=True)
-    new_features = [ 'future_count_gr{}_{}'.format(by, i) for i in days_list ]
-    df['created'] = pd.to_datetime(df["created"])
-    print(df['created'])
-    if price_mode:
-        df['price_quantiles'] = pd.qcut(df['price'], 5, labels=False)
-    for gr_name, df_group in df.copy().groupby(by):
-        last_date = df_group['created'].max().date()
-        idx_group = df_group.index
-        ref_days = df_group.groupby(df_group['created'].dt.date)['created'].count()
-
-        def get_count(row, n_days=1):
-            curr_date = row.date()
-            last_date = curr_date + dt.timedelta(days=n_days-1)
-            count = ref_days[curr_date:last_date].sum()
-            return count
-
-        for n_days in days_list:
-            new_feature = 'future_count_gr{}_{}'.format(by, n_days)
-            df.loc[idx_group, new_feature] = df_group['created'].apply(get_count, n_days=n_days)
-            print(df.loc[idx_group, new_feature])
-
-            # replace last incomplete dates with means
-            if positive:
-                first_bad_date = last_date - dt.timedelta(days=n_days-2)
-                last_good_day = last_date - dt.timedelta(days=n_days-1)
-                df_sub = df.loc[idx_group]
-                mask = (df_sub['created'] > first_bad_date) & (df_sub['created'] < last_date+dt.timedelta(days=1))
-                idx_group_rewrite = idx_group[mask]
-                df.loc[idx_group_rewrite, new_feature] = df_sub[new_feature].mean()
-
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
-    print('nans in train: ', train_df[new_features].isnull().any().any())
-    print('nans in test: ', test_df[new_features].isnull().any().any())
-    return train_df, test_df
-
-
 def add_leakage(df, leak_file):
     # add leak from pictures
     image_date = pd.read_csv(leak_file)
@@ -441,8 +331,8 @@ def add_leakage(df, leak_file):
     return df
 
 # Load data
-X_train = pd.read_json("../input/train.json").sort_values(by="listing_id")
-X_test = pd.read_json("../input/test.json").sort_values(by="listing_id")
+X_train = load_listings("../input/train.json").sort_values(by="listing_id")
+X_test = load_listings("../input/test.json").sort_values(by="listing_id")
 leak_file = "../input/listing_image_time.csv"
 
 X_train = add_leakage(X_train, leak_file)
@@ -453,8 +343,9 @@ X_test = add_leakage(X_test, leak_file)
 # X_train, X_test = add_feature_groupby_managerlevel('bathrooms', X_train, X_test)
 X_train, X_test = add_manager_level_weaker_leakage(X_train, X_test)
 # X_train, X_test = add_builing_level_weaker_leakage(X_train, X_test)
-X_train, X_test = add_stats_for_manager('price', X_train, X_test, count=True)
-X_train, X_test = add_stats_for_manager('listing_id', X_train, X_test)
+X_train, X_test = add_group_stats(X_train, X_test, 'manager_id',
+                                  OrderedDict([('price', ['sum', 'mean', 'count', 'median']),
+                                               ('listing_id', ['sum', 'mean', 'median'])]), prefix='man')
 
 
 # Make target integer, one hot encoded, calculate target priors
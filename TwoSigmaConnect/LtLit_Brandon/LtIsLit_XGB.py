@@ -1,3 +1,4 @@
+import sys
 import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import CountVectorizer
@@ -7,12 +8,21 @@ import random
 from math import exp
 import xgboost as xgb
 import datetime as dt
+from collections import OrderedDict
+sys.path.append('..')
+from target_encoding import categorical_average
+from count_features import add_future_count, add_future_count_groupedby, add_percentils, add_group_stats
+from feature_bag import FeatureBag, hstack_features
+from listing_loader import load_listings
 
 random.seed(444)
 np.random.seed(444)
 
-X_train = pd.read_json("../input/train.json")
-X_test = pd.read_json("../input/test.json")
+# keep the CountVectorizer columns as a sparse block next to the dense features
+SPARSE_BAG = True
+
+X_train = load_listings("../input/train.json")
+X_test = load_listings("../input/test.json")
 leak_file = "../input/listing_image_time.csv"
 
 interest_level_map = {'low': 0, 'medium': 1, 'high': 2}
@@ -80,73 +90,19 @@ f=1.0
 r_k=0.01 
 g = 1.0
 
-def categorical_average(variable, y, pred_0, feature_name):
-    def calculate_average(sub1, sub2):
-        s = pd.DataFrame(data = {
-                                 variable: sub1.groupby(variable, as_index = False).count()[variable],                              
-                                 'sumy': sub1.groupby(variable, as_index = False).sum()['y'],
-                                 'avgY': sub1.groupby(variable, as_index = False).mean()['y'],
-                                 'cnt': sub1.groupby(variable, as_index = False).count()['y']
-                                 })
-                                 
-        tmp = sub2.merge(s.reset_index(), how='left', left_on=variable, right_on=variable) 
-        del tmp['index']                       
-        tmp.loc[pd.isnull(tmp['cnt']), 'cnt'] = 0.0
-        tmp.loc[pd.isnull(tmp['cnt']), 'sumy'] = 0.0
-
-        def compute_beta(row):
-            cnt = row['cnt'] if row['cnt'] < 200 else float('inf')
-            return 1.0 / (g + exp((cnt - k) / f))
-            
-        if lambda_val is not None:
-            tmp['beta'] = lambda_val
-        else:
-            tmp['beta'] = tmp.apply(compute_beta, axis = 1)
-            
-        tmp['adj_avg'] = tmp.apply(lambda row: (1.0 - row['beta']) * row['avgY'] + row['beta'] * row['pred_0'],
-                                   axis = 1)
-                                   
-        tmp.loc[pd.isnull(tmp['avgY']), 'avgY'] = tmp.loc[pd.isnull(tmp['avgY']), 'pred_0']
-        tmp.loc[pd.isnull(tmp['adj_avg']), 'adj_avg'] = tmp.loc[pd.isnull(tmp['adj_avg']), 'pred_0']
-        tmp['random'] = np.random.uniform(size = len(tmp))
-        tmp['adj_avg'] = tmp.apply(lambda row: row['adj_avg'] *(1 + (row['random'] - 0.5) * r_k),
-                                   axis = 1)
-    
-        return tmp['adj_avg'].ravel()
-     
-    #cv for training set 
-    k_fold = StratifiedKFold(5)
-    X_train[feature_name] = -999 
-    for (train_index, cv_index) in k_fold.split(np.zeros(len(X_train)),
-                                                X_train['interest_level'].ravel()):
-        sub = pd.DataFrame(data = {variable: X_train[variable],
-                                   'y': X_train[y],
-                                   'pred_0': X_train[pred_0]})
-            
-        sub1 = sub.iloc[train_index]        
-        sub2 = sub.iloc[cv_index]
-        
-        X_train.loc[cv_index, feature_name] = calculate_average(sub1, sub2)
-    
-    #for test set
-    sub1 = pd.DataFrame(data = {variable: X_train[variable],
-                                'y': X_train[y],
-                                'pred_0': X_train[pred_0]})
-    sub2 = pd.DataFrame(data = {variable: X_test[variable],
-                                'y': X_test[y],
-                                'pred_0': X_test[pred_0]})
-    X_test.loc[:, feature_name] = calculate_average(sub1, sub2)                               
-
-def transform_data(X):
+def transform_data(X, sparse_bag=False):
+    '''
+    sparse_bag: bool; keep the feature-bag columns out of X and return them as a FeatureBag (X, bag)
+    '''
     #add features    
-    feat_sparse = feature_transform.transform(X["features"])
-    vocabulary = feature_transform.vocabulary_
+    bag = FeatureBag.from_vectorizer(feature_transform, X["features"])
     X['vykricnik'] = X['features'].apply(lambda x: x.count('!'))
     del X['features']
-    X1 = pd.DataFrame([ pd.Series(feat_sparse[i].toarray().ravel()) for i in np.arange(feat_sparse.shape[0]) ])
-    X1.columns = list(sorted(vocabulary.keys()))
-    X = pd.concat([X.reset_index(), X1.reset_index()], axis = 1)
-    del X['index']
+    if sparse_bag:
+        X = X.reset_index(drop=True)
+    else:
+        X = pd.concat([X.reset_index(), bag.to_frame().reset_index()], axis = 1)
+        del X['index']
     
     X["num_photos"] = X["photos"].apply(len)
     X['created'] = pd.to_datetime(X["created"])
@@ -193,13 +149,18 @@ def transform_data(X):
     X.loc[X['display_address'].isin(addresses_with_one_lot['display_address'].ravel()), 
           'display_address'] = "-1"
           
+    if sparse_bag:
+        return X, bag
     return X
 
 def normalize_high_cordiality_data():
     high_cardinality = ["building_id", "manager_id"]
+    k_fold = StratifiedKFold(5)
+    folds = list(k_fold.split(np.zeros(len(X_train)), X_train['interest_level'].ravel()))
     for c in high_cardinality:
-        categorical_average(c, "medium", "pred0_medium", c + "_mean_medium")
-        categorical_average(c, "high", "pred0_high", c + "_mean_high")
+        categorical_average(X_train, X_test, c, ["medium", "high"], ["pred0_medium", "pred0_high"],
+                            [c + "_mean_medium", c + "_mean_high"], folds,
+                            lambda_val=lambda_val, k=k, f=f, r_k=r_k, g=g)
 
 def transform_categorical_data():
     categorical = ['building_id', 'manager_id', 
@@ -467,33 +428,6 @@ def add_street_adress_level_weaker_leakage(train_df, test_df):
     return train_df, test_df
 
 
-def add_stats_for_manager(variable, train_df, test_df, funcs=None):
-    '''
-    Groupby manager_id and calculate 'sum', 'mean', 'count', 'median' of selected variable.
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-    grouped = df.groupby('manager_id')[variable]
-    # ind2exclude = grouped.filter(lambda x: len(x) < excl_shorter).index
-    # train_df.loc[ind2exclude, new_features] = np.nan
-    if funcs is None:
-        functions = ['sum', 'mean', 'median']
-    else:
-        functions = funcs
-
-    for function in functions:
-        col_name = 'man_{}_{}'.format(variable, function)
-        df[col_name] = grouped.transform(function)
-
-    new_features = [ 'man_{}_{}'.format(variable, j) for j in functions]
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
-    return train_df, test_df
-
-
 def merge_same_info(df, dic, exclude_cols):
     ''' Marge the smae columns with different names based on dic'''
     for new_feature, old_features in dic.items():
@@ -526,149 +460,6 @@ encoder = {'dishwasher': ['dishwasher', '_dishwasher_'],
 exclude_cols = ['multi', 'pre']
 
 
-def add_percentils(train_df, test_df):
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-
-    managers_count = df['manager_id'].value_counts()
-
-    df['top_10_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 90)] else 0)
-    df['top_25_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 75)] else 0)
-    df['top_5_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 95)] else 0)
-    df['top_50_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 50)] else 0)
-    df['top_1_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 99)] else 0)
-    df['top_2_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 98)] else 0)
-    df['top_15_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 85)] else 0)
-    df['top_20_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 80)] else 0)
-    df['top_30_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 70)] else 0)
-
-    buildings_count = df['building_id'].value_counts()
-
-    df['top_10_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 90)] else 0)
-    df['top_25_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 75)] else 0)
-    df['top_5_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 95)] else 0)
-    df['top_50_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 50)] else 0)
-    df['top_1_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 99)] else 0)
-    df['top_2_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 98)] else 0)
-    df['top_15_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 85)] else 0)
-    df['top_20_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 80)] else 0)
-    df['top_30_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 70)] else 0)
-
-    percentil_features = [ i for i in df.columns.values if i.startswith('top') ]
-    train_df[percentil_features] = df[df['source'] == 'train'][percentil_features]
-    test_df[percentil_features] = df[df['source'] == 'test'][percentil_features]
-    return train_df, test_df
-
-
-def add_future_count(train_df, test_df, days_list, positive=True):
-    '''
-    days_list: list of integers; integer represents number of days from current day to the future for calculating
-                    the count.
-                    i.e. [1,8,...]      1 - calculate count for current day only,  
-                                        8 - calculate count for current day with next 7 days
-                    i.e. [0,-1,..]      0 - from yesterday and today (incl)
-                                        -1 from day before yesterday to today (incl)
-    positive: bool; for positive values are incomplete days replaced by means (for negative not yet)
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-    df['created'] = pd.to_datetime(df["created"])
-    ref_days = df.groupby(df['created'].dt.date)['created'].count()
-    new_features = [ 'future_count_{}'.format(i) for i in days_list ]
-
-    def get_count(row, n_days=1):
-        curr_date = row.date()
-        last_date = curr_date + dt.timedelta(days=n_days-1)
-        count = ref_days[curr_date:last_date].sum()
-        return count
-
-    for n_days in days_list:
-        new_feature = 'future_count_{}'.format(n_days)
-        df[new_feature] = df['created'].apply(get_count, n_days=n_days)
-
-        # replace last incomplete dates with means
-        if positive:
-            last_date = df['created'].max().date()
-            first_bad_date = last_date - dt.timedelta(days=n_days-2)
-            last_good_day = last_date - dt.timedelta(days=n_days-1)
-            mask = (df['created'] > first_bad_date) & (df['created'] < last_date+dt.timedelta(days=1))
-            df.loc[mask, new_feature] = df[new_feature].mean()
-
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
-    print('nans in train: ', train_df[new_features].isnull().any().any())
-    print('nans in test: ', test_df[new_features].isnull().any().any())
-    return train_df, test_df
-
-
-def add_future_count_groupedby(by, train_df, test_df, days_list, positive=True, price_mode=False):
-    '''
-    the same as add_future_count, but grouped by column.
-    by: str; column name for groupby function
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test]).reset_index()
-    new_features = [ 'future_count_gr{}_{}'.format(by, i) for i in days_list ]
-    df['created'] = pd.to_datetime(df["created"])
-    if price_mode:
-        df['price_quantiles'] = pd.qcut(df['price'], 5, labels=False)
-    for gr_name, df_group in df.copy().groupby(by):
-        last_date = df_group['created'].max().date()
-        idx_group = df_group.index
-        ref_days = df_group.groupby(df_group['created'].dt.date)['created'].count()
-
-        def get_count(row, n_days=1):
-            curr_date = row.date()
-            last_date = curr_date + dt.timedelta(days=n_days-1)
-            count = ref_days[curr_date:last_date].sum()
-            return count
-
-        for n_days in days_list:
-            new_feature = 'future_count_gr{}_{}'.format(by, n_days)
-            df.loc[idx_group, new_feature] = df_group['created'].apply(get_count, n_days=n_days)
-
-            # replace last incomplete dates with means
-            if positive:
-                first_bad_date = last_date - dt.timedelta(days=n_days-2)
-                last_good_day = last_date - dt.timedelta(days=n_days-1)
-                df_sub = df.loc[idx_group]
-                mask = (df_sub['created'] > first_bad_date) & (df_sub['created'] < last_date+dt.timedelta(days=1))
-                idx_group_rewrite = idx_group[mask]
-                df.loc[idx_group_rewrite, new_feature] = df_sub[new_feature].mean()
-
-    train_df[new_features] = df[df['source'] == 'train'].set_index('index')[new_features]
-    test_df[new_features] = df[df['source'] == 'test'].set_index('index')[new_features]
-    print('nans in train: ', train_df[new_features].isnull().any().any())
-    print('nans in test: ', test_df[new_features].isnull().any().any())
-    return train_df, test_df
-
 print("Starting transformations")
 
 X_train, X_test = add_percentils(X_train, X_test)
@@ -680,8 +471,12 @@ X_train, X_test = add_future_count_groupedby('bedrooms', X_train, X_test, [1,3])
 X_train, X_test = add_future_count_groupedby('price_quantiles', X_train, X_test, [1,3], price_mode=True)
 
 
-X_train = transform_data(X_train)    
-X_test = transform_data(X_test) 
+if SPARSE_BAG:
+    X_train, bag_train = transform_data(X_train, sparse_bag=True)
+    X_test, bag_test = transform_data(X_test, sparse_bag=True)
+else:
+    X_train = transform_data(X_train)
+    X_test = transform_data(X_test)
 y = X_train['interest_level'].ravel()
 
 print("Normalizing high cordiality data...")
@@ -692,12 +487,13 @@ X_train, X_test = add_manager_level_weaker_leakage(X_train, X_test)
 X_train, X_test = add_builing_level_weaker_leakage(X_train, X_test)
 X_train, X_test = add_adress_level_weaker_leakage(X_train, X_test)
 X_train, X_test = add_street_adress_level_weaker_leakage(X_train, X_test)
-X_train, X_test = add_stats_for_manager('price', X_train, X_test, funcs=['sum', 'mean', 'median', 'count'])
-X_train, X_test = add_stats_for_manager('bedrooms', X_train, X_test)
-X_train, X_test = add_stats_for_manager('bathrooms', X_train, X_test)
-X_train, X_test = add_stats_for_manager('price_per_room', X_train, X_test)
-# X_train, X_test = add_stats_for_manager('bedBathSum', X_train, X_test)
-X_train, X_test = add_stats_for_manager('listing_id', X_train, X_test, funcs=['mean', 'median'])
+manager_stats = OrderedDict([('price', ['sum', 'mean', 'median', 'count']),
+                             ('bedrooms', ['sum', 'mean', 'median']),
+                             ('bathrooms', ['sum', 'mean', 'median']),
+                             ('price_per_room', ['sum', 'mean', 'median']),
+                             # ('bedBathSum', ['sum', 'mean', 'median']),
+                             ('listing_id', ['mean', 'median'])])
+X_train, X_test = add_group_stats(X_train, X_test, 'manager_id', manager_stats, prefix='man')
 
 X_train = add_leakage(X_train, leak_file)
 X_test = add_leakage(X_test, leak_file)
@@ -705,6 +501,8 @@ X_test = add_leakage(X_test, leak_file)
 
 # X_train = merge_same_info(X_train, encoder, exclude_cols)
 # X_test = merge_same_info(X_test, encoder, exclude_cols)
+# bag_train = bag_train.merge(encoder, exclude_cols)
+# bag_test = bag_test.merge(encoder, exclude_cols)
 
 remove_columns(X_train)
 remove_columns(X_test)
@@ -742,9 +540,14 @@ remove_columns(X_test)
 # prepare_submission(clf)
 
 # option 2, automatic detection of the best num_rounds
-train_X = X_train.values
+if SPARSE_BAG:
+    # numeric frame + CSR feature bag, the text features are never densified
+    train_X, _ = hstack_features(X_train, bag_train)
+    test_X, _ = hstack_features(X_test, bag_test)
+else:
+    train_X = X_train.values
+    test_X = X_test.values
 train_y = y
-test_X = X_test.values
 
 
 NFOLDS = 5
@@ -11,6 +11,7 @@ import xgboost as xgb
 from sklearn import model_selection, preprocessing, ensemble
 from sklearn.metrics import log_loss
 from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from listing_loader import load_listings
 
 import string
 
@@ -47,8 +48,8 @@ data_path = "input/"
 train_file = data_path + "train.json"
 test_file = data_path + "test.json"
 
-train_df = pd.read_json(train_file)
-test_df = pd.read_json(test_file)
+train_df = load_listings(train_file)
+test_df = load_listings(test_file)
 print(train_df.shape)
 print(test_df.shape)
 
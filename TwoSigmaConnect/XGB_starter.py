@@ -8,6 +8,7 @@ import xgboost as xgb
 from sklearn import model_selection, preprocessing, ensemble
 from sklearn.metrics import log_loss
 from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+from listing_loader import load_listings
 
 def runXGB(train_X, train_y, test_X, test_y=None, feature_names=None, seed_val=0, num_rounds=1000):
     param = {}
@@ -42,8 +43,8 @@ data_path = "input/"
 train_file = data_path + "train.json"
 test_file = data_path + "test.json"
 
-train_df = pd.read_json(train_file)
-test_df = pd.read_json(test_file)
+train_df = load_listings(train_file)
+test_df = load_listings(test_file)
 print(train_df.shape)
 print(test_df.shape)
 
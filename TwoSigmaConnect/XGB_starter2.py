@@ -6,6 +6,7 @@ import string
 from sklearn.feature_extraction.text import  CountVectorizer
 from scipy.stats import boxcox
 from scipy import sparse
+from listing_loader import load_listings
 
 data_path = "input/"
 train_file = data_path + "train.json"
@@ -13,8 +14,8 @@ test_file = data_path + "test.json"
 
 
 
-train = pd.read_json(train_file)
-test = pd.read_json(test_file)
+train = load_listings(train_file)
+test = load_listings(test_file)
 listing_id = test.listing_id.values
 
 
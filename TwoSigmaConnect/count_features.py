@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+DAY_NS = 24 * 3600 * 10**9
+
+
+def window_counts(created, days_list, groups=None, positive=True):
+    '''
+    Number of records per group in a window of days around the created day of every row.
+    created: datetime-like array
+    days_list: list of integers; n >= 1 counts the current day and n-1 following days,
+                    n <= 0 counts the current day and 1-n preceding days
+    groups: array of group keys or None for one group; rows with a missing key get NaN
+    positive: bool; rows whose forward window reaches behind the last day of their group
+                    get the group mean of the feature instead
+    returns float array of shape (len(created), len(days_list))
+    '''
+    t = pd.to_datetime(pd.Series(created)).values.astype('datetime64[ns]').astype(np.int64)
+    day = t // DAY_NS
+    first_day = day.min()
+    day = day - first_day
+    n_days_total = day.max() + 1
+
+    if groups is None:
+        codes = np.zeros(len(t), dtype=np.int64)
+    else:
+        codes = pd.factorize(np.asarray(groups))[0].astype(np.int64)
+    valid = codes >= 0
+    n_groups = codes.max() + 1 if valid.any() else 0
+    codes_v, day_v, t_v = codes[valid], day[valid], t[valid]
+
+    # per group cumulative counts of days, cum[g, j] = records of group g before day j
+    per_day = np.bincount(codes_v * n_days_total + day_v, minlength=n_groups * n_days_total)
+    cum = np.zeros((n_groups, n_days_total + 1), dtype=np.int64)
+    cum[:, 1:] = per_day.reshape(n_groups, n_days_total).cumsum(axis=1)
+
+    last_day = np.full(n_groups, -1, dtype=np.int64)
+    np.maximum.at(last_day, codes_v, day_v)
+    group_size = np.bincount(codes_v, minlength=n_groups).astype(np.float64)
+
+    out = np.full((len(t), len(days_list)), np.nan)
+    for j, n_days in enumerate(days_list):
+        if n_days >= 1:
+            lo, hi = day_v, day_v + n_days - 1
+        else:
+            lo, hi = day_v + n_days - 1, day_v
+        lo = np.clip(lo, 0, n_days_total)
+        hi = np.clip(hi + 1, 0, n_days_total)
+        counts = (cum[codes_v, hi] - cum[codes_v, lo]).astype(np.float64)
+
+        # replace last incomplete dates with means
+        if positive and n_days >= 2:
+            first_bad_day = last_day - (n_days - 2) + first_day
+            mask = t_v > first_bad_day[codes_v] * DAY_NS
+            means = np.bincount(codes_v, weights=counts, minlength=n_groups) / np.maximum(group_size, 1)
+            counts[mask] = means[codes_v[mask]]
+        out[valid, j] = counts
+    return out
+
+
+def add_future_count(train_df, test_df, days_list, positive=True):
+    '''
+    days_list: list of integers; integer represents number of days from current day to the future for calculating
+                    the count.
+                    i.e. [1,8,...]      1 - calculate count for current day only,
+                                        8 - calculate count for current day with next 7 days
+                    i.e. [0,-1,..]      0 - from yesterday and today (incl)
+                                        -1 from day before yesterday to today (incl)
+    positive: bool; for positive values are incomplete days replaced by means (for negative not yet)
+    '''
+    ntrain = len(train_df)
+    created = pd.concat([train_df['created'], test_df['created']])
+    new_features = [ 'future_count_{}'.format(i) for i in days_list ]
+    counts = window_counts(created, days_list, positive=positive)
+
+    for j, new_feature in enumerate(new_features):
+        train_df[new_feature] = counts[:ntrain, j]
+        test_df[new_feature] = counts[ntrain:, j]
+    print('nans in train: ', train_df[new_features].isnull().any().any())
+    print('nans in test: ', test_df[new_features].isnull().any().any())
+    return train_df, test_df
+
+
+def add_future_count_groupedby(by, train_df, test_df, days_list, positive=True, price_mode=False):
+    '''
+    the same as add_future_count, but grouped by column.
+    by: str; column name for groupby function
+    price_mode: bool; group by price quintiles (by should be 'price_quantiles')
+    '''
+    ntrain = len(train_df)
+    created = pd.concat([train_df['created'], test_df['created']])
+    if price_mode:
+        groups = pd.qcut(pd.concat([train_df['price'], test_df['price']]), 5, labels=False)
+    else:
+        groups = pd.concat([train_df[by], test_df[by]])
+    new_features = [ 'future_count_gr{}_{}'.format(by, i) for i in days_list ]
+    counts = window_counts(created, days_list, groups=groups.values, positive=positive)
+
+    for j, new_feature in enumerate(new_features):
+        train_df[new_feature] = counts[:ntrain, j]
+        test_df[new_feature] = counts[ntrain:, j]
+    print('nans in train: ', train_df[new_features].isnull().any().any())
+    print('nans in test: ', test_df[new_features].isnull().any().any())
+    return train_df, test_df
+
+
+def frequency_rank(values, tops=(), rank=False):
+    '''
+    Frequency percentile features of a key column, computed from one value count.
+    values: array of keys; missing keys count as the least frequent
+    tops: list of numbers; N gives a 0/1 flag of keys whose count is at least the (100-N)th
+                    percentile of the counts of unique keys (key is in top N %)
+    rank: bool; add the percentile rank of the key count (share of unique keys with count <=)
+    returns list of arrays, the flags in the order of tops followed by the rank
+    '''
+    codes, uniques = pd.factorize(np.asarray(values))
+    valid = codes >= 0
+    counts = np.bincount(codes[valid], minlength=len(uniques))
+    row_counts = np.zeros(len(codes), dtype=counts.dtype)
+    row_counts[valid] = counts[codes[valid]]
+
+    out = []
+    if len(tops):
+        thresholds = np.percentile(counts, [100 - top for top in tops])
+        for threshold in thresholds:
+            out.append(((row_counts >= threshold) & valid).astype(int))
+    if rank:
+        sorted_counts = np.sort(counts)
+        pct = 100.0 * np.searchsorted(sorted_counts, row_counts, side='right') / len(counts)
+        out.append(np.where(valid, pct, 0.0))
+    return out
+
+
+def add_percentils(train_df, test_df, keys=(('manager_id', 'manager'), ('building_id', 'building')),
+                   tops=(10, 25, 5, 50, 1, 2, 15, 20, 30), rank=False):
+    '''
+    Add top_N_<name> flags (key is among the top N % most frequent) for every key column.
+    keys: list of (column, name) pairs
+    tops: list of percents N
+    rank: bool; add also <name>_count_percentile with the percentile rank of the key frequency
+    '''
+    ntrain = len(train_df)
+    for column, name in keys:
+        values = np.concatenate([train_df[column].values, test_df[column].values])
+        new_features = [ 'top_{}_{}'.format(top, name) for top in tops ]
+        if rank:
+            new_features.append('{}_count_percentile'.format(name))
+        for new_feature, feature in zip(new_features, frequency_rank(values, tops, rank)):
+            train_df[new_feature] = feature[:ntrain]
+            test_df[new_feature] = feature[ntrain:]
+    return train_df, test_df
+
+
+def add_group_stats(train_df, test_df, key, stats, prefix='man'):
+    '''
+    Groupby key over train and test together and add aggregations of several variables.
+    The key is factorized once and all aggregations are computed in one grouped pass,
+    results are written back by position as '<prefix>_<variable>_<agg>'.
+    key: str; column name for groupby function
+    stats: mapping {variable: list of aggregations ('sum', 'mean', 'median', 'count', ...)}
+    Rows with a missing key get NaN.
+    '''
+    ntrain = len(train_df)
+    codes, uniques = pd.factorize(np.concatenate([train_df[key].values, test_df[key].values]))
+    valid = codes >= 0
+    values = pd.DataFrame(dict((variable, np.concatenate([train_df[variable].values, test_df[variable].values]))
+                               for variable in stats))
+    table = values[valid].groupby(codes[valid]).agg(dict((variable, list(funcs)) for variable, funcs in stats.items()))
+    if not valid.all():
+        # missing keys point to an extra all-NaN row
+        table = table.reindex(np.arange(len(uniques) + 1))
+        codes = np.where(valid, codes, len(uniques))
+
+    for variable, funcs in stats.items():
+        for function in funcs:
+            column = table[(variable, function)].values[codes]
+            new_feature = '{}_{}_{}'.format(prefix, variable, function)
+            train_df[new_feature] = column[:ntrain]
+            test_df[new_feature] = column[ntrain:]
+    return train_df, test_df
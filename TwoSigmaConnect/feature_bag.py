@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class FeatureBag(object):
+    '''
+    CSR block of bag-of-features columns (CountVectorizer output) with their names.
+    Kept next to the dense numeric frame, memory is proportional to the non-zeros.
+    '''
+    def __init__(self, matrix, columns):
+        self.matrix = sparse.csr_matrix(matrix)
+        self.columns = list(columns)
+
+    @classmethod
+    def from_vectorizer(cls, feature_transform, texts):
+        # CountVectorizer orders columns by the sorted vocabulary
+        vocabulary = feature_transform.vocabulary_
+        return cls(feature_transform.transform(texts), sorted(vocabulary.keys()))
+
+    def to_frame(self):
+        '''Dense DataFrame of the bag, the same as the old row by row expansion.'''
+        return pd.DataFrame(self.matrix.toarray(), columns=self.columns)
+
+    def merge(self, dic, exclude_cols):
+        '''
+        Sparse merge_same_info: the columns of every dic entry are or-ed into one new column
+        appended at the end, then exclude_cols are dropped.
+        '''
+        matrix, columns = self.matrix, self.columns
+        for new_feature, old_features in dic.items():
+            idx = [columns.index(c) for c in old_features]
+            merged = sparse.csr_matrix((matrix[:, idx].sum(axis=1) > 0).astype(matrix.dtype))
+            keep = [i for i in range(len(columns)) if i not in idx]
+            matrix = sparse.hstack([matrix[:, keep], merged], format='csr')
+            columns = [columns[i] for i in keep] + [new_feature]
+        keep = [i for i, c in enumerate(columns) if c not in exclude_cols]
+        return FeatureBag(matrix[:, keep], [columns[i] for i in keep])
+
+
+def hstack_features(X, bag, dtype=np.float32):
+    '''
+    CSR matrix of the dense frame X followed by the bag columns, for xgb.DMatrix or sklearn.
+    Values of X are stored explicitly (zeros too), so xgboost treats only NaN in X as missing;
+    absent bag entries are missing for xgboost, which for 0/1 columns only sets the default direction.
+    returns (matrix, column names)
+    '''
+    dense = np.asarray(X.values, dtype=dtype)
+    n, m = dense.shape
+    indptr = np.arange(0, n * m + 1, m, dtype=np.int64)
+    indices = np.tile(np.arange(m, dtype=np.int32), n)
+    dense_csr = sparse.csr_matrix((dense.ravel(), indices, indptr), shape=(n, m))
+    matrix = sparse.hstack([dense_csr, bag.matrix.astype(dtype)], format='csr')
+    return matrix, list(X.columns) + bag.columns
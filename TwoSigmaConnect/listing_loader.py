@@ -0,0 +1,139 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_VERSION = 1
+
+
+def _save_strings(prefix, values):
+    # strings as one utf8 blob with character offsets
+    values = [v if isinstance(v, str) else u'' for v in values]
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(v) for v in values])
+    np.save(prefix + '_offsets.npy', offsets)
+    np.save(prefix + '_blob.npy', np.frombuffer(u''.join(values).encode('utf8'), dtype=np.uint8))
+
+
+def _load_strings(prefix):
+    offsets = np.load(prefix + '_offsets.npy', mmap_mode='r').tolist()
+    text = np.load(prefix + '_blob.npy', mmap_mode='r').tobytes().decode('utf8')
+    return [text[a:b] for a, b in zip(offsets[:-1], offsets[1:])]
+
+
+def _column_kind(name, values):
+    if name == 'created':
+        return 'datetime'
+    if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return 'numeric'
+    if len(values) and isinstance(values.iloc[0], list):
+        return 'list'
+    if values.nunique() <= len(values) // 2:
+        return 'category'
+    return 'text'
+
+
+def save_snapshot(df, snapshot_dir, source=None):
+    '''
+    Store a listings DataFrame as typed columns: numbers as .npy, 'created' as datetime64,
+    repeated strings (ids, addresses) as int32 codes + categories, lists (features, photos)
+    as row offsets + values. source: file whose mtime and size are checked on load.
+    '''
+    tmp_dir = snapshot_dir + '.tmp{}'.format(os.getpid())
+    os.makedirs(tmp_dir)
+    columns = []
+    for i, name in enumerate(df.columns):
+        values = df[name]
+        kind = _column_kind(name, values)
+        prefix = os.path.join(tmp_dir, 'col{}'.format(i))
+        if kind == 'numeric':
+            np.save(prefix + '.npy', values.values)
+        elif kind == 'datetime':
+            np.save(prefix + '.npy', pd.to_datetime(values).values)
+        elif kind == 'category':
+            codes, uniques = pd.factorize(values)
+            np.save(prefix + '_codes.npy', codes.astype(np.int32))
+            _save_strings(prefix + '_cat', list(uniques))
+        elif kind == 'list':
+            lengths = values.apply(len).values
+            row_offsets = np.zeros(len(values) + 1, dtype=np.int64)
+            row_offsets[1:] = np.cumsum(lengths)
+            np.save(prefix + '_rows.npy', row_offsets)
+            _save_strings(prefix + '_values', [v for row in values for v in row])
+        else:
+            _save_strings(prefix, list(values))
+        columns.append({'name': name, 'kind': kind, 'file': 'col{}'.format(i)})
+
+    np.save(os.path.join(tmp_dir, 'index.npy'), df.index.values)
+    manifest = {'version': SNAPSHOT_VERSION, 'columns': columns}
+    if source is not None:
+        manifest['source'] = {'mtime': os.path.getmtime(source), 'size': os.path.getsize(source)}
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as handle:
+        json.dump(manifest, handle)
+    if os.path.exists(snapshot_dir):
+        shutil.rmtree(snapshot_dir)
+    os.rename(tmp_dir, snapshot_dir)
+
+
+def load_snapshot(snapshot_dir, columns=None, as_category=False):
+    '''
+    Rebuild the DataFrame from a snapshot, numeric columns are memory-mapped.
+    columns: list of column names to load, default all
+    as_category: bool; return repeated string columns as pandas Categorical instead of objects
+    '''
+    with open(os.path.join(snapshot_dir, 'manifest.json')) as handle:
+        manifest = json.load(handle)
+    data = {}
+    names = []
+    for col in manifest['columns']:
+        name = col['name']
+        if columns is not None and name not in columns:
+            continue
+        names.append(name)
+        prefix = os.path.join(snapshot_dir, col['file'])
+        kind = col['kind']
+        if kind in ('numeric', 'datetime'):
+            data[name] = np.load(prefix + '.npy', mmap_mode='r')
+        elif kind == 'category':
+            codes = np.load(prefix + '_codes.npy', mmap_mode='r')
+            # missing values have code -1, which picks the trailing None
+            categories = np.array(_load_strings(prefix + '_cat') + [None], dtype=object)
+            if as_category:
+                data[name] = pd.Categorical.from_codes(codes, categories[:-1])
+            else:
+                data[name] = categories[codes]
+        elif kind == 'list':
+            row_offsets = np.load(prefix + '_rows.npy', mmap_mode='r').tolist()
+            values = _load_strings(prefix + '_values')
+            data[name] = [values[a:b] for a, b in zip(row_offsets[:-1], row_offsets[1:])]
+        else:
+            data[name] = _load_strings(prefix)
+    index = np.load(os.path.join(snapshot_dir, 'index.npy'), allow_pickle=True)
+    return pd.DataFrame(data, index=index, columns=names)
+
+
+def _is_fresh(snapshot_dir, path):
+    manifest_file = os.path.join(snapshot_dir, 'manifest.json')
+    if not os.path.exists(manifest_file):
+        return False
+    with open(manifest_file) as handle:
+        manifest = json.load(handle)
+    source = manifest.get('source', {})
+    return (manifest.get('version') == SNAPSHOT_VERSION and
+            source.get('mtime') == os.path.getmtime(path) and source.get('size') == os.path.getsize(path))
+
+
+def load_listings(path, snapshot_dir=None, columns=None, as_category=False):
+    '''
+    pd.read_json(path) backed by a columnar snapshot written next to the json on the first call.
+    The first call parses with pandas itself, so row order and dtypes are the ones the scripts
+    expect (positional fixes like X_test["bathrooms"].iloc[19671]); later calls only read the snapshot.
+    '''
+    if snapshot_dir is None:
+        snapshot_dir = path + '.snapshot'
+    if not _is_fresh(snapshot_dir, path):
+        df = pd.read_json(path)
+        df['created'] = pd.to_datetime(df['created'])
+        save_snapshot(df, snapshot_dir, source=path)
+    return load_snapshot(snapshot_dir, columns=columns, as_category=as_category)
@@ -0,0 +1,118 @@
+import os
+import json
+import random
+import hashlib
+import inspect
+import numpy as np
+import pandas as pd
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj)
+    except (TypeError, IOError):
+        return repr(obj)
+
+
+def _hash_column(values):
+    try:
+        hashed = pd.util.hash_pandas_object(values, index=False).values
+    except TypeError:
+        # list columns (photos, ...) are hashed by their text representation
+        hashed = pd.util.hash_pandas_object(values.map(repr), index=False).values
+    return hashed.tobytes()
+
+
+class Stage(object):
+    '''
+    One step of the feature pipeline.
+    func: function(train_df, test_df) -> (train_df, test_df)
+    inputs: list of columns the stage reads; their content is part of the cache key
+    outputs: list of existing columns the stage overwrites; new columns are detected automatically
+    uses: other functions or classes called by func, their source is part of the cache key
+    params: dict of extra values for the cache key (file names, ...)
+    '''
+    def __init__(self, name, func, inputs, outputs=(), uses=(), params=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.uses = list(uses)
+        self.params = params or {}
+
+    def key(self, train_df, test_df, seed):
+        h = hashlib.sha1()
+        for obj in [self.func] + self.uses:
+            h.update(_source(obj).encode('utf8'))
+        h.update(json.dumps([self.params, seed, len(train_df), len(test_df)], sort_keys=True, default=str).encode('utf8'))
+        for df in (train_df, test_df):
+            for col in self.inputs:
+                h.update(col.encode('utf8'))
+                h.update(_hash_column(df[col]))
+        return h.hexdigest()
+
+
+class FeaturePipeline(object):
+    '''
+    Runs registered stages in order on a (train, test) pair of DataFrames.
+    Columns written by every stage are cached in cache_dir/<stage>/<key>/ as one .npy file per
+    column, keyed by the stage code and the hash of its input columns. A changed stage is recomputed,
+    and so is every later stage reading its columns (their input hash changes); the rest is loaded.
+    Every stage is seeded with its own seed, so cached and recomputed stages give the same values.
+    '''
+    def __init__(self, cache_dir='data4stack/feature_cache', seed=0):
+        self.cache_dir = cache_dir
+        self.seed = seed
+        self.stages = []
+
+    def stage(self, inputs, outputs=(), uses=(), params=None, name=None):
+        '''Decorator registering func(train_df, test_df) as the next stage.'''
+        def register(func):
+            self.stages.append(Stage(name or func.__name__, func, inputs, outputs, uses, params))
+            return func
+        return register
+
+    def _stage_seed(self, stage):
+        return int(hashlib.sha1('{}_{}'.format(self.seed, stage.name).encode('utf8')).hexdigest()[:8], 16)
+
+    def _save(self, path, stage, train_df, test_df, columns_before):
+        written = [c for c in train_df.columns if c not in columns_before or c in stage.outputs]
+        tmp_path = path + '.tmp{}'.format(os.getpid())
+        os.makedirs(tmp_path)
+        for i, col in enumerate(written):
+            np.save(os.path.join(tmp_path, 'train_{}.npy'.format(i)), train_df[col].values)
+            np.save(os.path.join(tmp_path, 'test_{}.npy'.format(i)), test_df[col].values)
+        manifest = {'written': written, 'train_columns': list(train_df.columns),
+                    'test_columns': list(test_df.columns)}
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as handle:
+            json.dump(manifest, handle)
+        os.rename(tmp_path, path)
+
+    def _load(self, path, train_df, test_df):
+        with open(os.path.join(path, 'manifest.json')) as handle:
+            manifest = json.load(handle)
+        for i, col in enumerate(manifest['written']):
+            train_df[col] = np.load(os.path.join(path, 'train_{}.npy'.format(i)), allow_pickle=True)
+            test_df[col] = np.load(os.path.join(path, 'test_{}.npy'.format(i)), allow_pickle=True)
+        return train_df[manifest['train_columns']], test_df[manifest['test_columns']]
+
+    def run(self, train_df, test_df):
+        train_df = train_df.reset_index(drop=True)
+        test_df = test_df.reset_index(drop=True)
+        for stage in self.stages:
+            stage_seed = self._stage_seed(stage)
+            path = os.path.join(self.cache_dir, stage.name, stage.key(train_df, test_df, stage_seed))
+            if os.path.exists(path):
+                print('{}: loaded from cache'.format(stage.name))
+                train_df, test_df = self._load(path, train_df, test_df)
+                continue
+
+            print('{}: computing'.format(stage.name))
+            random.seed(stage_seed)
+            np.random.seed(stage_seed)
+            columns_before = set(train_df.columns)
+            train_df, test_df = stage.func(train_df, test_df)
+            train_df = train_df.reset_index(drop=True)
+            test_df = test_df.reset_index(drop=True)
+            self._save(path, stage, train_df, test_df, columns_before)
+        return train_df, test_df
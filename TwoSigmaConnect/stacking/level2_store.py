@@ -0,0 +1,109 @@
+import os
+import json
+import numpy as np
+
+
+class Level2Store(object):
+    '''
+    Level-2 dataset kept as one .npy block per base model plus manifest.json.
+    Blocks are memory-mapped on load, so selecting a few models reads only their columns
+    and adding or removing a model touches only its own files.
+    '''
+    def __init__(self, root='data4stack/level2'):
+        self.root = root
+        self.manifest_file = os.path.join(root, 'manifest.json')
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as handle:
+                self.manifest = json.load(handle)
+        else:
+            self.manifest = {'blocks': {}, 'arrays': {}}
+
+    def _save_manifest(self):
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, 'w') as handle:
+            json.dump(self.manifest, handle, indent=2, sort_keys=True)
+        os.rename(tmp_file, self.manifest_file)
+
+    def _save(self, file_name, array):
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        np.save(os.path.join(self.root, file_name), np.asarray(array))
+
+    def names(self):
+        return sorted(self.manifest['blocks'].keys())
+
+    def set_models(self, names):
+        '''Record the base models of the current level-1 run, blocks of other models are kept.'''
+        missing = [name for name in names if name not in self.manifest['blocks']]
+        if missing:
+            raise KeyError('no blocks stored for {}'.format(', '.join(missing)))
+        self.manifest['models'] = list(names)
+        self._save_manifest()
+
+    def models(self):
+        '''base models of the last run given to set_models, all blocks when none was recorded'''
+        return list(self.manifest.get('models', self.names()))
+
+    def put(self, name, oof_train, oof_test, columns=None):
+        '''Store OOF train/test matrices of one base model, replacing an older block of the same name.'''
+        if oof_train.shape[1] != oof_test.shape[1]:
+            raise ValueError('train and test blocks of {} have different widths'.format(name))
+        if columns is None:
+            columns = ['{}_{}'.format(name, i) for i in range(oof_train.shape[1])]
+        self._save('{}_train.npy'.format(name), oof_train)
+        self._save('{}_test.npy'.format(name), oof_test)
+        self.manifest['blocks'][name] = {'train': '{}_train.npy'.format(name),
+                                         'test': '{}_test.npy'.format(name),
+                                         'columns': list(columns)}
+        self._save_manifest()
+
+    def remove(self, name):
+        block = self.manifest['blocks'].pop(name)
+        self._save_manifest()
+        for part in ('train', 'test'):
+            os.remove(os.path.join(self.root, block[part]))
+
+    def put_array(self, name, array):
+        '''Store an extra array next to the blocks (target, test ids, ...).'''
+        self._save('{}.npy'.format(name), array)
+        self.manifest['arrays'][name] = '{}.npy'.format(name)
+        self._save_manifest()
+
+    def array(self, name):
+        return np.load(os.path.join(self.root, self.manifest['arrays'][name]))
+
+    def block(self, name, part='train'):
+        return np.load(os.path.join(self.root, self.manifest['blocks'][name][part]), mmap_mode='r')
+
+    def columns(self, names=None):
+        names = self.names() if names is None else names
+        return [c for name in names for c in self.manifest['blocks'][name]['columns']]
+
+    def load(self, names=None, columns=None):
+        '''
+        Assemble level-2 train and test matrices.
+        names: list of base models, default all; columns: optional subset of their column names
+        '''
+        names = self.names() if names is None else names
+        if not names:
+            raise ValueError('no blocks stored in {}'.format(self.root) if not self.names()
+                             else 'no base models selected')
+        out = []
+        for part in ('train', 'test'):
+            blocks = []
+            for name in names:
+                block = self.block(name, part)
+                if columns is not None:
+                    block_columns = self.manifest['blocks'][name]['columns']
+                    idx = [i for i, c in enumerate(block_columns) if c in columns]
+                    if not idx:
+                        continue
+                    block = block[:, idx]
+                blocks.append(block)
+            if not blocks:
+                raise ValueError('none of the columns {} is in the blocks of {}'.format(
+                    ', '.join(columns), ', '.join(names)))
+            out.append(np.concatenate(blocks, axis=1))
+        return out[0], out[1]
@@ -0,0 +1,201 @@
+import os
+import json
+import shutil
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import xgboost as xgb
+
+
+## Creating Classes for stacking
+
+
+class SklearnWrapper(object):
+    thread_param = 'n_jobs'
+
+    def __init__(self, clf, seed=0, params=None):
+        params['random_state'] = seed
+        self.clf = clf(**params)
+
+    def train(self, x_train, y_train):
+        self.clf.fit(x_train, y_train)
+
+    def predict_proba(self, x):
+        proba = self.clf.predict_proba(x)
+        return proba
+
+
+class XgbWrapper(object):
+    thread_param = 'nthread'
+
+    def __init__(self, seed=0, params=None):
+        self.param = dict(params)
+        self.param['seed'] = seed
+        self.nrounds = self.param.pop('nrounds', 30)
+
+    def train(self, x_train, y_train):
+        dtrain = xgb.DMatrix(x_train, label=y_train)
+        self.gbdt = xgb.train(self.param, dtrain, self.nrounds)
+
+    def predict_proba(self, x):
+        proba = self.gbdt.predict(xgb.DMatrix(x))
+        return proba
+
+
+class BaseModel(object):
+    '''
+    Level-1 model for the OOF engine.
+    name: str; key of the result returned by OOFEngine.run
+    wrapper: XgbWrapper or SklearnWrapper
+    params: dict; model parameters (not modified)
+    features: list of column names or None for all columns
+    clf: sklearn estimator class, only for SklearnWrapper
+    '''
+    def __init__(self, name, wrapper, params, features=None, clf=None):
+        self.name = name
+        self.wrapper = wrapper
+        self.params = params
+        self.features = features
+        self.clf = clf
+
+    def build(self, seed, nthread=None):
+        params = dict(self.params)
+        if nthread is not None:
+            params[self.wrapper.thread_param] = nthread
+        if self.clf is not None:
+            return self.wrapper(clf=self.clf, seed=seed, params=params)
+        return self.wrapper(seed=seed, params=params)
+
+    def signature(self):
+        return {'wrapper': self.wrapper.__name__,
+                'clf': None if self.clf is None else self.clf.__name__,
+                'params': self.params,
+                'features': self.features}
+
+
+def _hash_arrays(*arrays):
+    h = hashlib.sha1()
+    for a in arrays:
+        a = np.ascontiguousarray(a)
+        h.update(str((a.shape, a.dtype.str)).encode('utf8'))
+        h.update(a.data)
+    return h.hexdigest()
+
+
+def _fit_fold(task):
+    '''Train one (model, fold) task on the memory-mapped data and store its predictions.'''
+    data_dir, model, seed, nthread, columns, train_index, test_index, cache_file = task
+    x_train = np.load(os.path.join(data_dir, 'x_train.npy'), mmap_mode='r')
+    x_test = np.load(os.path.join(data_dir, 'x_test.npy'), mmap_mode='r')
+    y_train = np.load(os.path.join(data_dir, 'y_train.npy'))
+
+    clf = model.build(seed, nthread)
+    clf.train(x_train[train_index][:, columns], y_train[train_index])
+    oof_fold = clf.predict_proba(x_train[test_index][:, columns])
+    test_fold = clf.predict_proba(x_test[:, columns])
+
+    tmp_file = cache_file + '.tmp{}.npz'.format(os.getpid())
+    np.savez(tmp_file, oof=oof_fold, test=test_fold)
+    os.rename(tmp_file, cache_file)
+    return cache_file
+
+
+class OOFEngine(object):
+    '''
+    Out-of-fold predictions of several base models, computed fold by fold on a process pool.
+    Each (model params, feature subset, fold) result is cached in cache_dir under a content hash
+    of the inputs, so only new or changed models are trained on the next run.
+    folds: iterable of (train_index, test_index)
+    n_jobs: number of worker processes; nthread: threads given to each task
+    keep_data: number of memory-mapped feature set copies (data_<hash>) kept in cache_dir, the
+    most recently used ones; None keeps all of them
+    '''
+    def __init__(self, folds, n_classes, cache_dir='data4stack/oof_cache', n_jobs=None, nthread=2, keep_data=3):
+        self.folds = [(np.asarray(tr), np.asarray(te)) for tr, te in folds]
+        self.keep_data = keep_data
+        self.n_classes = n_classes
+        self.cache_dir = cache_dir
+        self.nthread = nthread
+        if n_jobs is None:
+            n_jobs = max(1, multiprocessing.cpu_count() // max(1, nthread))
+        self.n_jobs = n_jobs
+
+    def _dump_data(self, x_train, y_train, x_test):
+        data_hash = _hash_arrays(x_train, y_train, x_test)
+        name = 'data_' + data_hash[:16]
+        data_dir = os.path.join(self.cache_dir, name)
+        if not os.path.exists(data_dir):
+            # written aside and renamed, an interrupted run leaves no half-written data_dir
+            tmp_dir = data_dir + '.tmp{}'.format(os.getpid())
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir)
+            os.makedirs(tmp_dir)
+            np.save(os.path.join(tmp_dir, 'x_train.npy'), x_train)
+            np.save(os.path.join(tmp_dir, 'y_train.npy'), y_train)
+            np.save(os.path.join(tmp_dir, 'x_test.npy'), x_test)
+            os.rename(tmp_dir, data_dir)
+        else:
+            # mtime of a data dir is its last use
+            os.utime(data_dir, None)
+        self._prune_data(name)
+        return data_dir, data_hash
+
+    def _prune_data(self, current):
+        # drop the least recently used complete copies beyond keep_data; .tmp dirs may belong
+        # to a run in progress and are left alone
+        if self.keep_data is None:
+            return
+        names = [other for other in os.listdir(self.cache_dir)
+                 if other.startswith('data_') and '.tmp' not in other and other != current]
+        paths = sorted((os.path.join(self.cache_dir, other) for other in names),
+                       key=os.path.getmtime, reverse=True)
+        for path in paths[max(self.keep_data - 1, 0):]:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _cache_file(self, data_hash, model, seed, fold, train_index):
+        key = json.dumps({'data': data_hash, 'model': model.signature(), 'seed': seed,
+                          'fold': fold, 'train_index': _hash_arrays(train_index)},
+                         sort_keys=True, default=str)
+        name = '{}_fold{}_{}.npz'.format(model.name, fold, hashlib.sha1(key.encode('utf8')).hexdigest())
+        return os.path.join(self.cache_dir, name)
+
+    def run(self, models, X_train, y_train, X_test, seed=0):
+        '''
+        X_train, X_test: DataFrames with the same columns
+        returns OrderedDict name -> (oof_train, oof_test); oof_test is the mean over folds
+        '''
+        x_train = np.ascontiguousarray(X_train.values, dtype=np.float32)
+        x_test = np.ascontiguousarray(X_test.values, dtype=np.float32)
+        y_train = np.asarray(y_train)
+        data_dir, data_hash = self._dump_data(x_train, y_train, x_test)
+
+        tasks = []
+        for model in models:
+            features = list(X_train.columns) if model.features is None else model.features
+            columns = X_train.columns.get_indexer(features)
+            for fold, (train_index, test_index) in enumerate(self.folds):
+                cache_file = self._cache_file(data_hash, model, seed, fold, train_index)
+                if not os.path.exists(cache_file):
+                    tasks.append((data_dir, model, seed, self.nthread, columns,
+                                  train_index, test_index, cache_file))
+
+        print('OOF engine: {} of {} tasks to train'.format(len(tasks), len(models) * len(self.folds)))
+        if self.n_jobs == 1:
+            for task in tasks:
+                _fit_fold(task)
+        elif tasks:
+            with ProcessPoolExecutor(max_workers=self.n_jobs) as executor:
+                list(executor.map(_fit_fold, tasks))
+
+        results = OrderedDict()
+        for model in models:
+            oof_train = np.zeros((x_train.shape[0], self.n_classes))
+            oof_test = np.zeros((x_test.shape[0], self.n_classes))
+            for fold, (train_index, test_index) in enumerate(self.folds):
+                with np.load(self._cache_file(data_hash, model, seed, fold, train_index)) as cached:
+                    oof_train[test_index] = cached['oof']
+                    oof_test += cached['test']
+            results[model.name] = (oof_train, oof_test / len(self.folds))
+        return results
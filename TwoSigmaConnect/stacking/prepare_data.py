@@ -15,12 +15,19 @@ import random
 from math import exp
 import datetime as dt
 import pickle
+from collections import OrderedDict
+sys.path.append('..')
+from target_encoding import OOFClassFrequencyEncoder, categorical_average
+from count_features import add_future_count, add_future_count_groupedby, add_percentils, add_group_stats
+from feature_bag import FeatureBag
+from listing_loader import load_listings
+from feature_pipeline import FeaturePipeline
 print(check_output(["ls", "../input"]).decode("utf8"))
 
 
 
-X_train = pd.read_json("../input/train.json")
-X_test = pd.read_json("../input/test.json")
+X_train = load_listings("../input/train.json")
+X_test = load_listings("../input/test.json")
 leak_file = "../input/listing_image_time.csv"
 
 interest_level_map = {'low': 0, 'medium': 1, 'high': 2}
@@ -83,70 +90,11 @@ f=1.0
 r_k=0.01 
 g = 1.0
 
-def categorical_average(variable, y, pred_0, feature_name):
-    def calculate_average(sub1, sub2):
-        s = pd.DataFrame(data = {
-                                 variable: sub1.groupby(variable, as_index = False).count()[variable],                              
-                                 'sumy': sub1.groupby(variable, as_index = False).sum()['y'],
-                                 'avgY': sub1.groupby(variable, as_index = False).mean()['y'],
-                                 'cnt': sub1.groupby(variable, as_index = False).count()['y']
-                                 })
-                                 
-        tmp = sub2.merge(s.reset_index(), how='left', left_on=variable, right_on=variable) 
-        del tmp['index']                       
-        tmp.loc[pd.isnull(tmp['cnt']), 'cnt'] = 0.0
-        tmp.loc[pd.isnull(tmp['cnt']), 'sumy'] = 0.0
-
-        def compute_beta(row):
-            cnt = row['cnt'] if row['cnt'] < 200 else float('inf')
-            return 1.0 / (g + exp((cnt - k) / f))
-            
-        if lambda_val is not None:
-            tmp['beta'] = lambda_val
-        else:
-            tmp['beta'] = tmp.apply(compute_beta, axis = 1)
-            
-        tmp['adj_avg'] = tmp.apply(lambda row: (1.0 - row['beta']) * row['avgY'] + row['beta'] * row['pred_0'],
-                                   axis = 1)
-                                   
-        tmp.loc[pd.isnull(tmp['avgY']), 'avgY'] = tmp.loc[pd.isnull(tmp['avgY']), 'pred_0']
-        tmp.loc[pd.isnull(tmp['adj_avg']), 'adj_avg'] = tmp.loc[pd.isnull(tmp['adj_avg']), 'pred_0']
-        tmp['random'] = np.random.uniform(size = len(tmp))
-        tmp['adj_avg'] = tmp.apply(lambda row: row['adj_avg'] *(1 + (row['random'] - 0.5) * r_k),
-                                   axis = 1)
-    
-        return tmp['adj_avg'].ravel()
-     
-    #cv for training set 
-    k_fold = StratifiedKFold(5)
-    X_train[feature_name] = -999 
-    for (train_index, cv_index) in k_fold.split(np.zeros(len(X_train)),
-                                                X_train['interest_level'].ravel()):
-        sub = pd.DataFrame(data = {variable: X_train[variable],
-                                   'y': X_train[y],
-                                   'pred_0': X_train[pred_0]})
-            
-        sub1 = sub.iloc[train_index]        
-        sub2 = sub.iloc[cv_index]
-        
-        X_train.loc[cv_index, feature_name] = calculate_average(sub1, sub2)
-    
-    #for test set
-    sub1 = pd.DataFrame(data = {variable: X_train[variable],
-                                'y': X_train[y],
-                                'pred_0': X_train[pred_0]})
-    sub2 = pd.DataFrame(data = {variable: X_test[variable],
-                                'y': X_test[y],
-                                'pred_0': X_test[pred_0]})
-    X_test.loc[:, feature_name] = calculate_average(sub1, sub2)                               
-
 def transform_data(X):
     #add features    
-    feat_sparse = feature_transform.transform(X["features"])
-    vocabulary = feature_transform.vocabulary_
+    bag = FeatureBag.from_vectorizer(feature_transform, X["features"])
     del X['features']
-    X1 = pd.DataFrame([ pd.Series(feat_sparse[i].toarray().ravel()) for i in np.arange(feat_sparse.shape[0]) ])
-    X1.columns = list(sorted(vocabulary.keys()))
+    X1 = bag.to_frame()
     X = pd.concat([X.reset_index(), X1.reset_index()], axis = 1)
     del X['index']
     
@@ -197,21 +145,24 @@ def transform_data(X):
           
     return X
 
-def normalize_high_cordiality_data():
+def normalize_high_cordiality_data(train_df, test_df):
     high_cardinality = ["building_id", "manager_id"]
+    k_fold = StratifiedKFold(5)
+    folds = list(k_fold.split(np.zeros(len(train_df)), train_df['interest_level'].ravel()))
     for c in high_cardinality:
-        categorical_average(c, "medium", "pred0_medium", c + "_mean_medium")
-        categorical_average(c, "high", "pred0_high", c + "_mean_high")
+        categorical_average(train_df, test_df, c, ["medium", "high"], ["pred0_medium", "pred0_high"],
+                            [c + "_mean_medium", c + "_mean_high"], folds,
+                            lambda_val=lambda_val, k=k, f=f, r_k=r_k, g=g)
 
-def transform_categorical_data():
+def transform_categorical_data(train_df, test_df):
     categorical = ['building_id', 'manager_id', 
                    'display_address', 'street_address']
                    
     for f in categorical:
         encoder = LabelEncoder()
-        encoder.fit(list(X_train[f]) + list(X_test[f])) 
-        X_train[f] = encoder.transform(X_train[f].ravel())
-        X_test[f] = encoder.transform(X_test[f].ravel())
+        encoder.fit(list(train_df[f]) + list(test_df[f])) 
+        train_df[f] = encoder.transform(train_df[f].ravel())
+        test_df[f] = encoder.transform(test_df[f].ravel())
                   
 
 def remove_columns(X):
@@ -221,281 +172,6 @@ def remove_columns(X):
     for c in columns:
         del X[c]
 
-def add_manager_level_weaker_leakage(train_df, test_df):
-    index=list(range(train_df.shape[0]))
-    random.shuffle(index)
-    a=[np.nan]*len(train_df)
-    b=[np.nan]*len(train_df)
-    c=[np.nan]*len(train_df)
-
-    for i in range(5):
-        building_level={}
-        for j in train_df['manager_id'].values:
-            building_level[j]=[0,0,0]
-        test_index=index[int((i*train_df.shape[0])/5):int(((i+1)*train_df.shape[0])/5)]
-        train_index=list(set(index).difference(test_index))
-        for j in train_index:
-            temp=train_df.iloc[j]
-            if temp['interest_level']==0:
-                building_level[temp['manager_id']][0]+=1
-            if temp['interest_level']==1:
-                building_level[temp['manager_id']][1]+=1
-            if temp['interest_level']==2:
-                building_level[temp['manager_id']][2]+=1
-        for j in test_index:
-            temp=train_df.iloc[j]
-            if sum(building_level[temp['manager_id']])!=0:
-                a[j]=building_level[temp['manager_id']][0]*1.0/sum(building_level[temp['manager_id']])
-                b[j]=building_level[temp['manager_id']][1]*1.0/sum(building_level[temp['manager_id']])
-                c[j]=building_level[temp['manager_id']][2]*1.0/sum(building_level[temp['manager_id']])
-    train_df['manager_level_low']=a
-    train_df['manager_level_medium']=b
-    train_df['manager_level_high']=c
-
-
-    a=[]
-    b=[]
-    c=[]
-    building_level={}
-    for j in train_df['manager_id'].values:
-        building_level[j]=[0,0,0]
-    for j in range(train_df.shape[0]):
-        temp=train_df.iloc[j]
-        if temp['interest_level']==0:
-            building_level[temp['manager_id']][0]+=1
-        if temp['interest_level']==1:
-            building_level[temp['manager_id']][1]+=1
-        if temp['interest_level']==2:
-            building_level[temp['manager_id']][2]+=1
-
-    for i in test_df['manager_id'].values:
-        if i not in building_level.keys():
-            a.append(np.nan)
-            b.append(np.nan)
-            c.append(np.nan)
-        else:
-            a.append(building_level[i][0]*1.0/sum(building_level[i]))
-            b.append(building_level[i][1]*1.0/sum(building_level[i]))
-            c.append(building_level[i][2]*1.0/sum(building_level[i]))
-    test_df['manager_level_low']=a
-    test_df['manager_level_medium']=b
-    test_df['manager_level_high']=c
-    return train_df, test_df
-
-
-def add_builing_level_weaker_leakage(train_df, test_df):
-    index=list(range(train_df.shape[0]))
-    random.shuffle(index)
-    a=[np.nan]*len(train_df)
-    b=[np.nan]*len(train_df)
-    c=[np.nan]*len(train_df)
-
-    for i in range(5):
-        building_level={}
-        for j in train_df['building_id'].values:
-            building_level[j]=[0,0,0]
-        test_index=index[int((i*train_df.shape[0])/5):int(((i+1)*train_df.shape[0])/5)]
-        train_index=list(set(index).difference(test_index))
-        for j in train_index:
-            temp=train_df.iloc[j]
-            if temp['interest_level']==0:
-                building_level[temp['building_id']][0]+=1
-            if temp['interest_level']==1:
-                building_level[temp['building_id']][1]+=1
-            if temp['interest_level']==2:
-                building_level[temp['building_id']][2]+=1
-        for j in test_index:
-            temp=train_df.iloc[j]
-            if sum(building_level[temp['building_id']])!=0:
-                a[j]=building_level[temp['building_id']][0]*1.0/sum(building_level[temp['building_id']])
-                b[j]=building_level[temp['building_id']][1]*1.0/sum(building_level[temp['building_id']])
-                c[j]=building_level[temp['building_id']][2]*1.0/sum(building_level[temp['building_id']])
-    train_df['building_level_low']=a
-    train_df['building_level_medium']=b
-    train_df['building_level_high']=c
-
-
-    a=[]
-    b=[]
-    c=[]
-    building_level={}
-    for j in train_df['building_id'].values:
-        building_level[j]=[0,0,0]
-    for j in range(train_df.shape[0]):
-        temp=train_df.iloc[j]
-        if temp['interest_level']==0:
-            building_level[temp['building_id']][0]+=1
-        if temp['interest_level']==1:
-            building_level[temp['building_id']][1]+=1
-        if temp['interest_level']==2:
-            building_level[temp['building_id']][2]+=1
-
-    for i in test_df['building_id'].values:
-        if i not in building_level.keys():
-            a.append(np.nan)
-            b.append(np.nan)
-            c.append(np.nan)
-        else:
-            a.append(building_level[i][0]*1.0/sum(building_level[i]))
-            b.append(building_level[i][1]*1.0/sum(building_level[i]))
-            c.append(building_level[i][2]*1.0/sum(building_level[i]))
-    test_df['building_level_low']=a
-    test_df['building_level_medium']=b
-    test_df['building_level_high']=c
-    return train_df, test_df
-
-
-def add_adress_level_weaker_leakage(train_df, test_df):
-    index=list(range(train_df.shape[0]))
-    random.shuffle(index)
-    a=[np.nan]*len(train_df)
-    b=[np.nan]*len(train_df)
-    c=[np.nan]*len(train_df)
-
-    for i in range(5):
-        building_level={}
-        for j in train_df['display_address'].values:
-            building_level[j]=[0,0,0]
-        test_index=index[int((i*train_df.shape[0])/5):int(((i+1)*train_df.shape[0])/5)]
-        train_index=list(set(index).difference(test_index))
-        for j in train_index:
-            temp=train_df.iloc[j]
-            if temp['interest_level']==0:
-                building_level[temp['display_address']][0]+=1
-            if temp['interest_level']==1:
-                building_level[temp['display_address']][1]+=1
-            if temp['interest_level']==2:
-                building_level[temp['display_address']][2]+=1
-        for j in test_index:
-            temp=train_df.iloc[j]
-            if sum(building_level[temp['display_address']])!=0:
-                a[j]=building_level[temp['display_address']][0]*1.0/sum(building_level[temp['display_address']])
-                b[j]=building_level[temp['display_address']][1]*1.0/sum(building_level[temp['display_address']])
-                c[j]=building_level[temp['display_address']][2]*1.0/sum(building_level[temp['display_address']])
-    train_df['display_address_level_low']=a
-    train_df['display_address_level_medium']=b
-    train_df['display_address_level_high']=c
-
-
-    a=[]
-    b=[]
-    c=[]
-    building_level={}
-    for j in train_df['display_address'].values:
-        building_level[j]=[0,0,0]
-    for j in range(train_df.shape[0]):
-        temp=train_df.iloc[j]
-        if temp['interest_level']==0:
-            building_level[temp['display_address']][0]+=1
-        if temp['interest_level']==1:
-            building_level[temp['display_address']][1]+=1
-        if temp['interest_level']==2:
-            building_level[temp['display_address']][2]+=1
-
-    for i in test_df['display_address'].values:
-        if i not in building_level.keys():
-            a.append(np.nan)
-            b.append(np.nan)
-            c.append(np.nan)
-        else:
-            a.append(building_level[i][0]*1.0/sum(building_level[i]))
-            b.append(building_level[i][1]*1.0/sum(building_level[i]))
-            c.append(building_level[i][2]*1.0/sum(building_level[i]))
-    test_df['display_address_level_low']=a
-    test_df['display_address_level_medium']=b
-    test_df['display_address_level_high']=c
-    return train_df, test_df
-
-
-def add_street_adress_level_weaker_leakage(train_df, test_df):
-    index=list(range(train_df.shape[0]))
-    random.shuffle(index)
-    a=[np.nan]*len(train_df)
-    b=[np.nan]*len(train_df)
-    c=[np.nan]*len(train_df)
-
-    for i in range(5):
-        building_level={}
-        for j in train_df['street_address'].values:
-            building_level[j]=[0,0,0]
-        test_index=index[int((i*train_df.shape[0])/5):int(((i+1)*train_df.shape[0])/5)]
-        train_index=list(set(index).difference(test_index))
-        for j in train_index:
-            temp=train_df.iloc[j]
-            if temp['interest_level']==0:
-                building_level[temp['street_address']][0]+=1
-            if temp['interest_level']==1:
-                building_level[temp['street_address']][1]+=1
-            if temp['interest_level']==2:
-                building_level[temp['street_address']][2]+=1
-        for j in test_index:
-            temp=train_df.iloc[j]
-            if sum(building_level[temp['street_address']])!=0:
-                a[j]=building_level[temp['street_address']][0]*1.0/sum(building_level[temp['street_address']])
-                b[j]=building_level[temp['street_address']][1]*1.0/sum(building_level[temp['street_address']])
-                c[j]=building_level[temp['street_address']][2]*1.0/sum(building_level[temp['street_address']])
-    train_df['street_address_level_low']=a
-    train_df['street_address_level_medium']=b
-    train_df['street_address_level_high']=c
-
-
-    a=[]
-    b=[]
-    c=[]
-    building_level={}
-    for j in train_df['street_address'].values:
-        building_level[j]=[0,0,0]
-    for j in range(train_df.shape[0]):
-        temp=train_df.iloc[j]
-        if temp['interest_level']==0:
-            building_level[temp['street_address']][0]+=1
-        if temp['interest_level']==1:
-            building_level[temp['street_address']][1]+=1
-        if temp['interest_level']==2:
-            building_level[temp['street_address']][2]+=1
-
-    for i in test_df['street_address'].values:
-        if i not in building_level.keys():
-            a.append(np.nan)
-            b.append(np.nan)
-            c.append(np.nan)
-        else:
-            a.append(building_level[i][0]*1.0/sum(building_level[i]))
-            b.append(building_level[i][1]*1.0/sum(building_level[i]))
-            c.append(building_level[i][2]*1.0/sum(building_level[i]))
-    test_df['street_address_level_low']=a
-    test_df['street_address_level_medium']=b
-    test_df['street_address_level_high']=c
-    return train_df, test_df
-
-
-def add_stats_for_manager(variable, train_df, test_df, funcs=None):
-    '''
-    Groupby manager_id and calculate 'sum', 'mean', 'count', 'median' of selected variable.
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-    grouped = df.groupby('manager_id')[variable]
-    # ind2exclude = grouped.filter(lambda x: len(x) < excl_shorter).index
-    # train_df.loc[ind2exclude, new_features] = np.nan
-    if funcs is None:
-        functions = ['sum', 'mean', 'median']
-    else:
-        functions = funcs
-
-    for function in functions:
-        col_name = 'man_{}_{}'.format(variable, function)
-        df[col_name] = grouped.transform(function)
-
-    new_features = [ 'man_{}_{}'.format(variable, j) for j in functions]
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
-    return train_df, test_df
-
-
 def merge_same_info(df, dic, exclude_cols):
     ''' Marge the smae columns with different names based on dic'''
     for new_feature, old_features in dic.items():
@@ -528,267 +204,85 @@ encoder = {'dishwasher': ['dishwasher', '_dishwasher_'],
 exclude_cols = ['multi', 'pre']
 
 
-def add_percentils(train_df, test_df):
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-
-    managers_count = df['manager_id'].value_counts()
-
-    df['top_10_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 90)] else 0)
-    df['top_25_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 75)] else 0)
-    df['top_5_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 95)] else 0)
-    df['top_50_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 50)] else 0)
-    df['top_1_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 99)] else 0)
-    df['top_2_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 98)] else 0)
-    df['top_15_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 85)] else 0)
-    df['top_20_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 80)] else 0)
-    df['top_30_manager'] = df['manager_id'].apply(lambda x: 1 if x in managers_count.index.values[
-        managers_count.values >= np.percentile(managers_count.values, 70)] else 0)
-
-    buildings_count = df['building_id'].value_counts()
-
-    df['top_10_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 90)] else 0)
-    df['top_25_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 75)] else 0)
-    df['top_5_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 95)] else 0)
-    df['top_50_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 50)] else 0)
-    df['top_1_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 99)] else 0)
-    df['top_2_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 98)] else 0)
-    df['top_15_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 85)] else 0)
-    df['top_20_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 80)] else 0)
-    df['top_30_building'] = df['building_id'].apply(lambda x: 1 if x in buildings_count.index.values[
-        buildings_count.values >= np.percentile(buildings_count.values, 70)] else 0)
-
-    percentil_features = [ i for i in df.columns.values if i.startswith('top') ]
-    train_df[percentil_features] = df[df['source'] == 'train'][percentil_features]
-    test_df[percentil_features] = df[df['source'] == 'test'][percentil_features]
-    return train_df, test_df
+print("Starting transformations")
 
+# every stage declares the columns it reads, its output is cached by code and input hash
+pipeline = FeaturePipeline('data4stack/feature_cache', seed=444)
+address_columns = ['manager_id', 'building_id', 'display_address', 'street_address']
 
-def add_future_count(train_df, test_df, days_list, positive=True):
-    '''
-    days_list: list of integers; integer represents number of days from current day to the future for calculating
-                    the count.
-                    i.e. [1,8,...]      1 - calculate count for current day only,  
-                                        8 - calculate count for current day with next 7 days
-                    i.e. [0,-1,..]      0 - from yesterday and today (incl)
-                                        -1 from day before yesterday to today (incl)
-    positive: bool; for positive values are incomplete days replaced by means (for negative not yet)
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-    ref_days = df.groupby(df['created'].dt.date)['created'].count()
-    new_features = [ 'future_count_{}'.format(i) for i in days_list ]
-
-    def get_count(row, n_days=1):
-        curr_date = row.date()
-        last_date = curr_date + dt.timedelta(days=n_days-1)
-        count = ref_days[curr_date:last_date].sum()
-        return count
-
-    for n_days in days_list:
-        new_feature = 'future_count_{}'.format(n_days)
-        df[new_feature] = df['created'].apply(get_count, n_days=n_days)
-
-    # replace last incomplete dates with means
-    if positive:
-        last_date = df['created'].max().date()
-        first_bad_date = last_date - dt.timedelta(days=n_days-2)
-        last_good_day = last_date - dt.timedelta(days=n_days-1)
-        mask = (df['created'] > first_bad_date) & (df['created'] < last_date+dt.timedelta(days=1))
-        df.loc[mask, new_features] = df[new_features].mean().values
-
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
-    return train_df, test_df
+
+@pipeline.stage(inputs=['manager_id', 'building_id'], uses=[add_percentils])
+def percentils(train_df, test_df):
+    return add_percentils(train_df, test_df)
 
 
-def add_future_count_groupedby(by, train_df, test_df, days_list, positive=True):
-    '''
-    the same as add_future_count, but grouped by column.
-    by: str; column name for groupby function
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-    new_features = [ 'future_count_gr{}_{}'.format(by, i) for i in days_list ]
-    # df['created'] = pd.to_datetime(df["created"])
-    for gr_name, df_group in df.groupby(by):
-        idx_group = df_group.index
-        ref_days = df_group.groupby(df_group['created'].dt.date)['created'].count()
-
-        def get_count(row, n_days=1):
-            curr_date = row.date()
-            last_date = curr_date + dt.timedelta(days=n_days-1)
-            count = ref_days[curr_date:last_date].sum()
-            return count
-
-        for n_days in days_list:
-            new_feature = 'future_count_gr{}_{}'.format(by, n_days)
-            df.ix[idx_group, new_feature] = df_group['created'].apply(get_count, n_days=n_days)
-
-        # replace last incomplete dates with means
-        if positive:
-            last_date = df_group['created'].max().date()
-            first_bad_date = last_date - dt.timedelta(days=n_days-2)
-            last_good_day = last_date - dt.timedelta(days=n_days-1)
-            df_sub = df.ix[idx_group]
-            mask = (df_sub['created'] > first_bad_date) & (df_sub['created'] < last_date+dt.timedelta(days=1))
-            idx_group_rewrite = idx_group[mask]
-            df.loc[idx_group_rewrite, new_features] = df_sub[new_features].mean().values
-
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
+@pipeline.stage(inputs=['created', 'bedrooms', 'price'],
+                uses=[add_future_count, add_future_count_groupedby])
+def future_count(train_df, test_df):
+    train_df, test_df = add_future_count(train_df, test_df, [1,4,8])
+    train_df, test_df = add_future_count(train_df, test_df, [-2], positive=False)
+    train_df, test_df = add_future_count_groupedby('bedrooms', train_df, test_df, [1,3])
+    train_df, test_df = add_future_count_groupedby('price_quantiles', train_df, test_df, [1,3], price_mode=True)
     return train_df, test_df
 
 
-def add_future_count(train_df, test_df, days_list, positive=True):
-    '''
-    days_list: list of integers; integer represents number of days from current day to the future for calculating
-                    the count.
-                    i.e. [1,8,...]      1 - calculate count for current day only,  
-                                        8 - calculate count for current day with next 7 days
-                    i.e. [0,-1,..]      0 - from yesterday and today (incl)
-                                        -1 from day before yesterday to today (incl)
-    positive: bool; for positive values are incomplete days replaced by means (for negative not yet)
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test])
-    df['created'] = pd.to_datetime(df["created"])
-    ref_days = df.groupby(df['created'].dt.date)['created'].count()
-    new_features = [ 'future_count_{}'.format(i) for i in days_list ]
-
-    def get_count(row, n_days=1):
-        curr_date = row.date()
-        last_date = curr_date + dt.timedelta(days=n_days-1)
-        count = ref_days[curr_date:last_date].sum()
-        return count
-
-    for n_days in days_list:
-        new_feature = 'future_count_{}'.format(n_days)
-        df[new_feature] = df['created'].apply(get_count, n_days=n_days)
-
-        # replace last incomplete dates with means
-        if positive:
-            last_date = df['created'].max().date()
-            first_bad_date = last_date - dt.timedelta(days=n_days-2)
-            last_good_day = last_date - dt.timedelta(days=n_days-1)
-            mask = (df['created'] > first_bad_date) & (df['created'] < last_date+dt.timedelta(days=1))
-            df.loc[mask, new_feature] = df[new_feature].mean()
-
-    train_df[new_features] = df[df['source'] == 'train'][new_features]
-    test_df[new_features] = df[df['source'] == 'test'][new_features]
-    print('nans in train: ', train_df[new_features].isnull().any().any())
-    print('nans in test: ', test_df[new_features].isnull().any().any())
+@pipeline.stage(inputs=['features', 'photos', 'created', 'description', 'price', 'bedrooms', 'bathrooms',
+                        'interest_level'] + address_columns,
+                outputs=['created'] + address_columns, uses=[transform_data, FeatureBag])
+def transform(train_df, test_df):
+    return transform_data(train_df), transform_data(test_df)
+
+
+@pipeline.stage(inputs=['building_id', 'manager_id', 'interest_level', 'medium', 'high',
+                        'pred0_medium', 'pred0_high'],
+                uses=[normalize_high_cordiality_data, categorical_average])
+def high_cordiality(train_df, test_df):
+    print("Normalizing high cordiality data...")
+    normalize_high_cordiality_data(train_df, test_df)
     return train_df, test_df
 
 
-def add_future_count_groupedby(by, train_df, test_df, days_list, positive=True, price_mode=False):
-    '''
-    the same as add_future_count, but grouped by column.
-    by: str; column name for groupby function
-    '''
-    train = train_df.copy()
-    train['source'] = 'train'
-    test = test_df.copy()
-    test['source'] = 'test'
-    df = pd.concat([train, test]).reset_index()
-    new_features = [ 'future_count_gr{}_{}'.format(by, i) for i in days_list ]
-    df['created'] = pd.to_datetime(df["created"])
-    if price_mode:
-        df['price_quantiles'] = pd.qcut(df['price'], 5, labels=False)
-    for gr_name, df_group in df.copy().groupby(by):
-        last_date = df_group['created'].max().date()
-        idx_group = df_group.index
-        ref_days = df_group.groupby(df_group['created'].dt.date)['created'].count()
-
-        def get_count(row, n_days=1):
-            curr_date = row.date()
-            last_date = curr_date + dt.timedelta(days=n_days-1)
-            count = ref_days[curr_date:last_date].sum()
-            return count
-
-        for n_days in days_list:
-            new_feature = 'future_count_gr{}_{}'.format(by, n_days)
-            df.loc[idx_group, new_feature] = df_group['created'].apply(get_count, n_days=n_days)
-
-            # replace last incomplete dates with means
-            if positive:
-                first_bad_date = last_date - dt.timedelta(days=n_days-2)
-                last_good_day = last_date - dt.timedelta(days=n_days-1)
-                df_sub = df.loc[idx_group]
-                mask = (df_sub['created'] > first_bad_date) & (df_sub['created'] < last_date+dt.timedelta(days=1))
-                idx_group_rewrite = idx_group[mask]
-                df.loc[idx_group_rewrite, new_feature] = df_sub[new_feature].mean()
-
-    train_df[new_features] = df[df['source'] == 'train'].set_index('index')[new_features]
-    test_df[new_features] = df[df['source'] == 'test'].set_index('index')[new_features]
-    print('nans in train: ', train_df[new_features].isnull().any().any())
-    print('nans in test: ', test_df[new_features].isnull().any().any())
+@pipeline.stage(inputs=address_columns, outputs=address_columns, uses=[transform_categorical_data])
+def categorical(train_df, test_df):
+    transform_categorical_data(train_df, test_df)
     return train_df, test_df
 
 
-print("Starting transformations")
+@pipeline.stage(inputs=address_columns + ['interest_level'], uses=[OOFClassFrequencyEncoder])
+def level_leakage(train_df, test_df):
+    for key in address_columns:
+        train_df, test_df = OOFClassFrequencyEncoder(key).fit_transform(train_df, test_df)
+    return train_df, test_df
 
-X_train, X_test = add_percentils(X_train, X_test)
 
-X_train, X_test = add_future_count(X_train, X_test, [1,4,8])
-X_train, X_test = add_future_count(X_train, X_test, [-2], positive=False)
-X_train, X_test = add_future_count_groupedby('bedrooms', X_train, X_test, [1,3])
-X_train, X_test = add_future_count_groupedby('price_quantiles', X_train, X_test, [1,3], price_mode=True)
+manager_stats = OrderedDict([('price', ['sum', 'mean', 'median', 'count']),
+                             ('bedrooms', ['sum', 'mean', 'median']),
+                             ('bathrooms', ['sum', 'mean', 'median']),
+                             ('price_per_room', ['sum', 'mean', 'median']),
+                             ('bedBathSum', ['sum', 'mean', 'median']),
+                             ('listing_id', ['mean', 'median'])])
 
 
-X_train = transform_data(X_train)    
-X_test = transform_data(X_test) 
-y = X_train['interest_level'].ravel()
+@pipeline.stage(inputs=['manager_id'] + list(manager_stats.keys()), uses=[add_group_stats],
+                params={'stats': manager_stats}, name='manager_stats')
+def manager_stats_stage(train_df, test_df):
+    return add_group_stats(train_df, test_df, 'manager_id', manager_stats, prefix='man')
+
 
-print("Normalizing high cordiality data...")
-normalize_high_cordiality_data()
-transform_categorical_data()
+@pipeline.stage(inputs=['listing_id'], uses=[add_leakage],
+                params={'leak_file': leak_file, 'mtime': os.path.getmtime(leak_file)})
+def leakage(train_df, test_df):
+    return add_leakage(train_df, leak_file), add_leakage(test_df, leak_file)
 
-X_train, X_test = add_manager_level_weaker_leakage(X_train, X_test)
-X_train, X_test = add_builing_level_weaker_leakage(X_train, X_test)
-X_train, X_test = add_adress_level_weaker_leakage(X_train, X_test)
-X_train, X_test = add_street_adress_level_weaker_leakage(X_train, X_test)
-X_train, X_test = add_stats_for_manager('price', X_train, X_test, funcs=['sum', 'mean', 'median', 'count'])
-X_train, X_test = add_stats_for_manager('bedrooms', X_train, X_test)
-X_train, X_test = add_stats_for_manager('bathrooms', X_train, X_test)
-X_train, X_test = add_stats_for_manager('price_per_room', X_train, X_test)
-X_train, X_test = add_stats_for_manager('bedBathSum', X_train, X_test)
-X_train, X_test = add_stats_for_manager('listing_id', X_train, X_test, funcs=['mean', 'median'])
 
+@pipeline.stage(inputs=[c for cols in encoder.values() for c in cols] + exclude_cols,
+                outputs=list(encoder.keys()), uses=[merge_same_info], params={'encoder': encoder})
+def merge_same(train_df, test_df):
+    return merge_same_info(train_df, encoder, exclude_cols), merge_same_info(test_df, encoder, exclude_cols)
 
-X_train = add_leakage(X_train, leak_file)
-X_test = add_leakage(X_test, leak_file)
 
-X_train = merge_same_info(X_train, encoder, exclude_cols)
-X_test = merge_same_info(X_test, encoder, exclude_cols)
+X_train, X_test = pipeline.run(X_train, X_test)
+y = X_train['interest_level'].ravel()
 
 remove_columns(X_train)
 remove_columns(X_test)
@@ -12,6 +12,8 @@ from sklearn.ensemble import ExtraTreesClassifier
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.cross_validation import KFold
 import pickle
+from oof_engine import OOFEngine, BaseModel, XgbWrapper, SklearnWrapper
+from level2_store import Level2Store
 
 
 
@@ -40,58 +42,6 @@ ntest = x_test.shape[0]
 kf = KFold(ntrain, n_folds=NFOLDS, shuffle=True, random_state=SEED)
 
 
-## Creating Classes for stacking
-
-
-class SklearnWrapper(object):
-    def __init__(self, clf, seed=0, params=None):
-        params['random_state'] = seed
-        self.clf = clf(**params)
-
-    def train(self, x_train, y_train):
-        self.clf.fit(x_train, y_train)
-
-    def predict_proba(self, x):
-        proba = self.clf.predict_proba(x)
-        return proba
-
-
-class XgbWrapper(object):
-    def __init__(self, seed=0, params=None):
-        self.param = params
-        self.param['seed'] = seed
-        self.nrounds = params.pop('nrounds', 30)
-
-    def train(self, x_train, y_train):
-        dtrain = xgb.DMatrix(x_train, label=y_train)
-        self.gbdt = xgb.train(self.param, dtrain, self.nrounds)
-
-    def predict_proba(self, x):
-        proba = self.gbdt.predict(xgb.DMatrix(x))
-        return proba
-
-
-def get_oof(clf, x_train, y_train, x_test):
-    oof_train = np.zeros((ntrain,n_classes))
-    oof_test = np.zeros((ntest,n_classes))
-    oof_test_skf = np.empty((ntest, NFOLDS*n_classes))
-
-    for i, (train_index, test_index) in enumerate(kf):
-        x_tr = x_train[train_index]
-        y_tr = y_train[train_index]
-        x_te = x_train[test_index]
-
-        clf.train(x_tr, y_tr)
-        oof_train[test_index] = clf.predict_proba(x_te)
-        oof_test_skf[:,3*i: 3*i+3] = clf.predict_proba(x_test)
-        
-    for i in range(3):
-        oof_test[:,i] = (oof_test_skf[:,i]+oof_test_skf[:,i+3]+oof_test_skf[:,i+6]+oof_test_skf[:,i+9]+oof_test_skf[:,i+12])/5
-
-    
-    return oof_train, oof_test
-
-
 et_params = {
     'n_jobs': -1,
     'n_estimators': 500,
@@ -233,22 +183,6 @@ for i in X_train.columns:
     if 'medium' in i or 'high' in i:
         hcc.append(i)
 
-xg = XgbWrapper(seed=SEED, params=xgb_params)
-# et = SklearnWrapper(clf=ExtraTreesClassifier, seed=SEED, params=et_params)
-xg2 = XgbWrapper(seed=SEED, params=xgb_params2)
-xg3 = XgbWrapper(seed=SEED, params=xgb_params3)
-xg4 = XgbWrapper(seed=SEED, params=xgb_params4)
-xg5 = XgbWrapper(seed=SEED, params=xgb_params5)
-xg6 = XgbWrapper(seed=SEED, params=xgb_params6)
-# rf = SklearnWrapper(clf=RandomForestClassifier, seed=SEED, params=rf_params)
-
-# xg_oof_train, xg_oof_test = get_oof(xg, x_train, y_train, x_test)
-# et_oof_train, et_oof_test = get_oof(et, x_train, y_train, x_test)
-# # rf_oof_train, rf_oof_test = get_oof(rf, x_train, y_train, x_test)
-# xg2_oof_train, xg2_oof_test = get_oof(xg2, x_train, y_train, x_test)
-# xg3_oof_train, xg3_oof_test = get_oof(xg3, x_train, y_train, x_test)
-
-
 features1 = [ i for i in X_train.columns if i not in display_address_level+building_level+top_mans_build+street_adress+future_count_gr+future_count]
 features2 = [ i for i in X_train.columns if i not in manager_level+man_stats+top_mans_build+future_count_gr+future_count]
 # features3 = [ i for i in X_train.columns if i not in manager_level+display_address_level+building_level+top_mans_build+street_adress]
@@ -257,13 +191,27 @@ features5 = [ i for i in X_train.columns if i not in leakage]
 features6 = [ i for i in X_train.columns if i not in hcc]
 
 
-xg_oof_train, xg_oof_test = get_oof(xg, X_train[features1].values, y_train, X_test[features1].values)
-# et_oof_train, et_oof_test = get_oof(et, x_train, y_train, x_test)
-xg2_oof_train, xg2_oof_test = get_oof(xg2, X_train[features2].values, y_train, X_test[features2].values)
-xg3_oof_train, xg3_oof_test = get_oof(xg3, x_train, y_train, x_test)
-xg4_oof_train, xg4_oof_test = get_oof(xg4, X_train[features4].values, y_train, X_test[features4].values)
-xg5_oof_train, xg5_oof_test = get_oof(xg5, X_train[features5].values, y_train, X_test[features5].values)
-xg6_oof_train, xg6_oof_test = get_oof(xg6, X_train[features6].values, y_train, X_test[features6].values)
+base_models = [
+    BaseModel('xg', XgbWrapper, xgb_params, features1),
+    # BaseModel('et', SklearnWrapper, et_params, clf=ExtraTreesClassifier),
+    # BaseModel('rf', SklearnWrapper, rf_params, clf=RandomForestClassifier),
+    BaseModel('xg2', XgbWrapper, xgb_params2, features2),
+    BaseModel('xg3', XgbWrapper, xgb_params3),
+    BaseModel('xg4', XgbWrapper, xgb_params4, features4),
+    BaseModel('xg5', XgbWrapper, xgb_params5, features5),
+    BaseModel('xg6', XgbWrapper, xgb_params6, features6),
+]
+
+# folds and models run on a process pool, finished (params, features, fold) results are cached
+engine = OOFEngine(kf, n_classes, cache_dir='data4stack/oof_cache', nthread=4)
+oof = engine.run(base_models, X_train, y_train, X_test, seed=SEED)
+
+xg_oof_train, xg_oof_test = oof['xg']
+xg2_oof_train, xg2_oof_test = oof['xg2']
+xg3_oof_train, xg3_oof_test = oof['xg3']
+xg4_oof_train, xg4_oof_test = oof['xg4']
+xg5_oof_train, xg5_oof_test = oof['xg5']
+xg6_oof_train, xg6_oof_test = oof['xg6']
 
 
 
@@ -278,11 +226,17 @@ print("XG6-CV: {}".format(log_loss(y_train, xg6_oof_train)))
 
 
 
-x_train = np.concatenate((xg_oof_train, xg2_oof_train, xg3_oof_train, xg4_oof_train, xg5_oof_train, xg6_oof_train), axis=1)
-x_test = np.concatenate((xg_oof_test, xg2_oof_test, xg3_oof_test, xg4_oof_test, xg5_oof_test, xg6_oof_test), axis=1)
+# every base model is its own block, adding or removing one doesn't rewrite the others
+store = Level2Store('data4stack/level2')
+for name, (oof_train, oof_test) in oof.items():
+    store.put(name, oof_train, oof_test,
+              columns=['{}_{}'.format(name, c) for c in ['low', 'medium', 'high']])
+store.put_array('y_train', y_train)
+store.put_array('test_listing_id', X_test.listing_id.values)
+# level-2 scripts read the models of this run, not every block ever stored
+store.set_models([model.name for model in base_models])
 
-with open('data4stack/data_level2.pickle', 'wb') as handle:
-    pickle.dump([x_train, x_test], handle)
+x_train, x_test = store.load(store.models())
 
 print("{},{}".format(x_train.shape, x_test.shape))
 
@@ -12,6 +12,7 @@ from sklearn.ensemble import ExtraTreesClassifier
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.cross_validation import KFold
 import pickle
+from level2_store import Level2Store
 
 
 SEED = 444
@@ -19,16 +20,12 @@ SEED = 444
 
 
 
-with open('data4stack/data_level2.pickle', 'rb') as handle:
-    level2 = pickle.load(handle)
-x_train, x_test = level2
-
-# y train som zabudol dat do level2
-with open('data4stack/data_perpared_wleak.pickle', 'rb') as handle:
-    sets_prepared = pickle.load(handle)
-_, y_train, X_test = sets_prepared
-
-
+store = Level2Store('data4stack/level2')
+# the base models of the last stacker2 run, read from their memory-mapped blocks
+level2_models = store.models()
+x_train, x_test = store.load(level2_models)
+y_train = store.array('y_train')
+listing_id = store.array('test_listing_id')
 
 
 
@@ -63,5 +60,5 @@ gbdt = xgb.train(xgb_params, dtrain, best_nrounds)
 
 # out_df = pd.DataFrame(gbdt.predict(dtest))
 # out_df.columns = ["low", "medium", "high"]
-# out_df["listing_id"] = X_test.listing_id.values
+# out_df["listing_id"] = listing_id
 # out_df.to_csv('../sub/stacker2_starter7_2.csv', index=False)
\ No newline at end of file
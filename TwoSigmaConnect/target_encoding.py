@@ -0,0 +1,141 @@
+import random
+import numpy as np
+import pandas as pd
+
+
+def factorize_keys(frames, key):
+    '''
+    Map the key column (or tuple of columns) of all frames to one dense integer code space.
+    frames: list of DataFrames; codes are returned concatenated in the same order
+    key: str or tuple of str
+    Missing values are treated as a regular key.
+    '''
+    columns = [key] if isinstance(key, str) else list(key)
+    codes = np.zeros(sum(len(df) for df in frames), dtype=np.int64)
+    for col in columns:
+        col_codes, uniques = pd.factorize(np.concatenate([df[col].values for df in frames]))
+        codes = codes * (len(uniques) + 1) + (col_codes + 1)
+        codes = pd.factorize(codes)[0]
+    return codes, codes.max() + 1 if len(codes) else 0
+
+
+class OOFClassFrequencyEncoder(object):
+    '''
+    Out-of-fold per-class frequencies of a target for any key column (or tuple of columns).
+    Replaces the add_*_level_weaker_leakage functions: train rows are shuffled with `random`
+    and split to n_folds contiguous blocks, each block gets the class ratios of its key counted
+    on the other blocks; test rows get the ratios counted on the whole train set.
+    Keys without any counted row get NaN.
+    '''
+    def __init__(self, key, target='interest_level', n_classes=3, n_folds=5,
+                 class_names=('low', 'medium', 'high'), name=None):
+        self.key = key
+        self.target = target
+        self.n_classes = n_classes
+        self.n_folds = n_folds
+        if class_names is None or len(class_names) != n_classes:
+            class_names = [str(i) for i in range(n_classes)]
+        self.class_names = list(class_names)
+        if name is None:
+            name = key if isinstance(key, str) else '_'.join(key)
+            if name.endswith('_id'):
+                name = name[:-3]
+            name = name + '_level'
+        self.name = name
+
+    @property
+    def columns(self):
+        return ['{}_{}'.format(self.name, c) for c in self.class_names]
+
+    def _count(self, codes, y, n_keys):
+        valid = (y >= 0) & (y < self.n_classes)
+        flat = codes[valid] * self.n_classes + y[valid]
+        counts = np.bincount(flat, minlength=n_keys * self.n_classes)
+        return counts.reshape(n_keys, self.n_classes).astype(np.float64)
+
+    @staticmethod
+    def _ratios(counts):
+        totals = counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratios = counts / totals
+        ratios[totals[:, 0] == 0] = np.nan
+        return ratios
+
+    def fit_transform(self, train_df, test_df):
+        ntrain = len(train_df)
+        codes, n_keys = factorize_keys([train_df, test_df], self.key)
+        train_codes, test_codes = codes[:ntrain], codes[ntrain:]
+        y = np.asarray(train_df[self.target].values, dtype=np.int64)
+
+        index = list(range(ntrain))
+        random.shuffle(index)
+        index = np.array(index, dtype=np.int64)
+
+        total_counts = self._count(train_codes, y, n_keys)
+        oof = np.full((ntrain, self.n_classes), np.nan)
+        for i in range(self.n_folds):
+            test_index = index[int((i * ntrain) / self.n_folds):int(((i + 1) * ntrain) / self.n_folds)]
+            fold_counts = total_counts - self._count(train_codes[test_index], y[test_index], n_keys)
+            oof[test_index] = self._ratios(fold_counts)[train_codes[test_index]]
+
+        test_values = self._ratios(total_counts)[test_codes]
+        for j, col in enumerate(self.columns):
+            train_df[col] = oof[:, j]
+            test_df[col] = test_values[:, j]
+        return train_df, test_df
+
+
+def categorical_average(train_df, test_df, variable, targets, priors, feature_names, folds,
+                        lambda_val=None, k=5.0, f=1.0, r_k=0.01, g=1.0):
+    '''
+    Bayesian (high cardinality) average of one or more targets per category of variable.
+    Train rows get the average computed out-of-fold, test rows the one computed on the whole train set.
+    targets, priors, feature_names: lists of the same length; priors are the names of pred_0 columns
+    folds: list of (train_index, cv_index), shared by all targets
+    lambda_val: fixed shrinkage, otherwise beta = 1 / (g + exp((cnt - k) / f))
+    r_k: size of the multiplicative uniform noise
+    '''
+    ntrain = len(train_df)
+    n_targets = len(targets)
+    codes, n_keys = factorize_keys([train_df, test_df], variable)
+    train_codes, test_codes = codes[:ntrain], codes[ntrain:]
+    y = np.column_stack([train_df[t].values for t in targets]).astype(np.float64)
+    prior_train = np.column_stack([train_df[p].values for p in priors]).astype(np.float64)
+    prior_test = np.column_stack([test_df[p].values for p in priors]).astype(np.float64)
+    # noise is drawn target by target over the cv folds and then the test set
+    noise = np.random.uniform(size=(n_targets, ntrain + len(test_df))).T
+
+    def calculate_average(fit_codes, fit_y, apply_codes, prior, random):
+        cnt = np.bincount(fit_codes, minlength=n_keys).astype(np.float64)
+        flat = (fit_codes[:, None] * n_targets + np.arange(n_targets)).ravel()
+        sumy = np.bincount(flat, weights=fit_y.ravel(), minlength=n_keys * n_targets)
+        sumy = sumy.reshape(n_keys, n_targets)
+
+        row_cnt = cnt[apply_codes]
+        if lambda_val is not None:
+            beta = np.full(len(apply_codes), lambda_val, dtype=np.float64)
+        else:
+            with np.errstate(over='ignore'):
+                beta = 1.0 / (g + np.exp((np.where(row_cnt < 200, row_cnt, np.inf) - k) / f))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            avg = sumy[apply_codes] / row_cnt[:, None]
+        adj_avg = (1.0 - beta[:, None]) * avg + beta[:, None] * prior
+        adj_avg = np.where(np.isnan(adj_avg), prior, adj_avg)
+        return adj_avg * (1 + (random - 0.5) * r_k)
+
+    #cv for training set
+    train_values = np.empty((ntrain, n_targets))
+    offset = 0
+    for (train_index, cv_index) in folds:
+        train_values[cv_index] = calculate_average(train_codes[train_index], y[train_index],
+                                                   train_codes[cv_index], prior_train[cv_index],
+                                                   noise[offset:offset + len(cv_index)])
+        offset += len(cv_index)
+
+    #for test set
+    test_values = calculate_average(train_codes, y, test_codes, prior_test, noise[ntrain:])
+
+    for j, feature_name in enumerate(feature_names):
+        train_df[feature_name] = train_values[:, j]
+        test_df[feature_name] = test_values[:, j]
+    return train_df, test_df